@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import argparse
+import glob
+import tempfile
+from functions.processing import load_label
+from functions.scene_cache import scene_cache
+from functions.train_functions import class_histograms
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Benchmark of the class pixel counts behind get_class_weights(): the former list-based path
+(every label extended into a Python list, then one torch.bincount), the parallel np.bincount
+path, and the same path answered from the histograms stored in a scene cache.
+
+    python benchmarks/class_weights.py --glob "raw_data/**/*.dat" --threads 8
+"""
+
+def list_counts(label_paths, num_classes):
+    """
+    Class counts computed like get_class_weights() used to.
+    """
+    all_labels = []
+    for path in label_paths:
+        all_labels.extend(load_label(path))
+    return torch.bincount(torch.tensor(all_labels, dtype=torch.long), minlength=num_classes)[:num_classes].numpy()
+
+def seconds(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Class counts: list-based vs vectorized vs cached.")
+    parser.add_argument("--glob", required=True, help="Glob pattern of .dat label files.")
+    parser.add_argument("--num-classes", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--skip-list", action="store_true", help="Skip the slow list-based path.")
+    args = parser.parse_args()
+
+    label_paths = sorted(glob.glob(args.glob, recursive=True))
+    print(f"{len(label_paths)} label files")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = scene_cache(cache_dir)
+        vectorized, vectorized_seconds = seconds(lambda: class_histograms(label_paths, args.num_classes,
+                                                                          num_workers=args.threads).sum(axis=0))
+        _, cold_seconds = seconds(lambda: class_histograms(label_paths, args.num_classes, cache,
+                                                           num_workers=args.threads))
+        cached, cached_seconds = seconds(lambda: class_histograms(label_paths, args.num_classes, cache,
+                                                                  num_workers=args.threads).sum(axis=0))
+
+    print(f"{'path':>22} {'seconds':>9}")
+    if not args.skip_list:
+        reference, list_seconds = seconds(lambda: list_counts(label_paths, args.num_classes))
+        print(f"{'list + torch.bincount':>22} {list_seconds:>9.3f}")
+        if not (np.array_equal(reference, vectorized) and np.array_equal(reference, cached)):
+            print(colored("Class counts differ!", "red"))
+    print(f"{'np.bincount':>22} {vectorized_seconds:>9.3f}")
+    print(f"{'cache (cold)':>22} {cold_seconds:>9.3f}")
+    print(f"{'cache (warm)':>22} {cached_seconds:>9.3f}")
+    print(f"Class counts: {cached.tolist()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+from libraries.training import *
+import argparse
+from dataset import merged_hyperspectral_dataset
+from samplers import permutation_batch_sampler
+from functions.processing import normalization_manager
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Benchmark of the DataLoader throughput (samples/s) of merged_hyperspectral_dataset:
+the per-pixel path (one __getitem__ per pixel plus collation) against the batched path
+(permutation_batch_sampler plus one vectorized __getitems__ slice per batch).
+Synthetic uint16 spectra are used, so no scenes are needed.
+
+    python benchmarks/dataset_throughput.py --pixels 2000000 --storage compact
+"""
+
+class per_pixel_view(Dataset):
+    """
+    Wraps a dataset and hides its __getitems__, so the DataLoader falls back to one __getitem__ per pixel.
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        return self.dataset[idx]
+
+#######################################################################################
+
+def measure(loader, max_samples):
+    """
+    Iterate over the loader until max_samples are seen and return the samples/s.
+    """
+    seen = 0
+    start = time.perf_counter()
+    for spectra, labels in loader:
+        seen += spectra.shape[0]
+        if seen >= max_samples:
+            break
+    return seen / (time.perf_counter() - start)
+
+#######################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="DataLoader throughput, per-pixel vs batched path.")
+    parser.add_argument("--pixels", type=int, default=2_000_000, help="Number of synthetic pixels.")
+    parser.add_argument("--bands", type=int, default=114)
+    parser.add_argument("--storage", default="compact", choices=["compact", "float32"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[128, 512, 2048, 8192])
+    parser.add_argument("--samples", type=int, default=200_000, help="Samples measured per configuration.")
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 4096, size=(args.pixels, args.bands), dtype=np.uint16)
+    labels = rng.integers(0, 3, size=args.pixels, dtype=np.uint8)
+
+    normalizer = normalization_manager()
+    normalizer.fit(images)
+    dataset = merged_hyperspectral_dataset.from_arrays(images, labels, normalizer, storage=args.storage)
+
+    print(f"{'batch':>6} {'per-pixel [samples/s]':>22} {'batched [samples/s]':>20} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        per_pixel_loader = DataLoader(per_pixel_view(dataset), batch_size=batch_size, shuffle=True,
+                                      num_workers=args.workers, collate_fn=dataset.collate_fn)
+        batched_loader = DataLoader(dataset, num_workers=args.workers, collate_fn=dataset.collate_fn,
+                                    batch_sampler=permutation_batch_sampler(len(dataset), batch_size))
+
+        per_pixel = measure(per_pixel_loader, args.samples)
+        batched = measure(batched_loader, args.samples)
+        print(f"{batch_size:>6} {per_pixel:>22,.0f} {batched:>20,.0f} {batched / per_pixel:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import argparse
+import glob
+from functions.processing import normalization_manager, load_image
+from functions.inference import load_trained_model, load_preprocessing, inference_engine, predict_scene, spectrum_memo
+from models.cnn_1d import JustoLiuNet1D_torch
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Benchmark of spectrum deduplication in predict_scene(): for every scene the dedup ratio
+(pixels per classified spectrum), the unique spectra per tile, the cross-tile cache hits and the
+speedup of predict_scene() with a spectrum_memo over the plain path. The class maps of both
+paths are checked to be identical.
+
+    python benchmarks/dedup.py --glob "raw_data/**/*.bip" --checkpoint models/best_model.pth
+"""
+
+def seconds(fn, repeats=2):
+    """
+    Return the result and the best time of fn() over a few repeats.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description="Spectrum deduplication: dedup ratio and speedup per scene.")
+    parser.add_argument("--glob", required=True, help="Glob pattern of .bip files.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint written by save_model(). Random weights if not given.")
+    parser.add_argument("--memo-entries", type=int, default=100_000)
+    parser.add_argument("--mode", default="fused", choices=["eager", "fused", "script", "compile"])
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    image_paths = sorted(glob.glob(args.glob, recursive=True))
+
+    if args.checkpoint is not None:
+        model, normalizer = load_trained_model(args.checkpoint, "cpu")
+        preprocessing = load_preprocessing(args.checkpoint)
+    else:
+        model = JustoLiuNet1D_torch(114).eval()
+        normalizer = normalization_manager().partial_fit(load_image(image_paths[0], rows=(0, 64)))
+        preprocessing = {}
+    engine = inference_engine(model, normalizer, args.mode) if args.mode != "eager" else model
+
+    print(f"{'scene':>30} {'dedup':>7} {'unique/tile':>12} {'cache hits':>11} {'plain [s]':>10} {'dedup [s]':>10} {'speedup':>8}")
+    for image_path in image_paths:
+        plain, plain_seconds = seconds(lambda: predict_scene(image_path, engine, normalizer, **preprocessing))
+
+        memo = spectrum_memo(args.memo_entries)
+        def deduplicated():
+            # Every repeat starts cold, so cross-tile hits within the scene are counted but not hits from a previous repeat
+            memo.cache.clear()
+            memo.reset_stats()
+            return predict_scene(image_path, engine, normalizer, memo=memo, **preprocessing)
+        classes, dedup_seconds = seconds(deduplicated)
+
+        if not np.array_equal(plain, classes):
+            print(colored(f"{os.path.basename(image_path)}: class maps differ!", "red"))
+
+        tiles = -(-plain.shape[0] // 64)
+        print(f"{os.path.basename(image_path)[-30:]:>30} {memo.dedup_ratio():>6.2f}x {memo.unique / tiles:>12,.0f} "
+              f"{memo.hits:>11,} {plain_seconds:>10.3f} {dedup_seconds:>10.3f} {plain_seconds / dedup_seconds:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
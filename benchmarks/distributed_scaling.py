@@ -0,0 +1,106 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+from libraries.training import *
+import argparse
+from manage_data import read_csv_file
+from dataset import merged_hyperspectral_dataset
+from samplers import permutation_batch_sampler
+from functions.processing import normalization_manager
+from functions.metrics import confusion_matrix_accumulator
+from functions.train_functions import train_subloop, eval_subloop
+from functions.distributed import init_distributed, wrap_model, unwrap_model, cleanup_distributed
+from models.cnn_1d import JustoLiuNet1D_torch
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Scaling of data-parallel CPU training (DistributedDataParallel, gloo) with the number of local
+ranks. For every rank count the same model is trained for --epochs epochs over the same data,
+with BATCH_SIZE per rank, and evaluated after every epoch. The table reports the training
+throughput summed over the ranks, the speedup against one rank, and the training wall-clock time
+(evaluation excluded) until the validation accuracy first reaches --target.
+
+    python benchmarks/distributed_scaling.py --ranks 1 2 4 8 --epochs 5 --target 0.95
+"""
+
+def worker(rank, world_size, args, results):
+    os.environ.update({"RANK": str(rank), "LOCAL_RANK": str(rank), "WORLD_SIZE": str(world_size),
+                       "LOCAL_WORLD_SIZE": str(world_size), "MASTER_ADDR": "127.0.0.1",
+                       "MASTER_PORT": str(args.port + world_size)})
+    init_distributed(backend="gloo")
+    device = torch.device("cpu")
+
+    train_bip_paths, train_labels_paths, _ = read_csv_file(args.train_csv)
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+    normalizer = normalization_manager()
+    train_dataset = merged_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer,
+                                                 storage="compact", fit_normalizer=True)
+    eval_dataset = merged_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer, storage="compact")
+
+    train_sampler = permutation_batch_sampler(len(train_dataset), args.batch_size, rank=rank, num_replicas=world_size)
+    train_loader = DataLoader(train_dataset, batch_sampler=train_sampler, collate_fn=train_dataset.collate_fn)
+    eval_loader = DataLoader(eval_dataset, collate_fn=eval_dataset.collate_fn,
+                             batch_sampler=permutation_batch_sampler(len(eval_dataset), 8192, shuffle=False,
+                                                                     rank=rank, num_replicas=world_size, pad=False))
+
+    torch.manual_seed(0)
+    model = wrap_model(JustoLiuNet1D_torch(num_features=train_dataset.images.shape[1]), device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
+
+    elapsed = 0.0
+    reached = None
+    best_accuracy = 0.0
+    for epoch in range(args.epochs):
+        train_sampler.set_epoch(epoch)
+        model.train()
+        start = time.perf_counter()
+        train_subloop(train_loader, model, criterion, optimizer, device)
+        elapsed += time.perf_counter() - start
+
+        model.eval()
+        with torch.no_grad():
+            metrics, _ = eval_subloop(eval_loader, unwrap_model(model), criterion, device,
+                                      confusion_matrix_accumulator(3, device))
+        accuracy = metrics.accuracy()
+        best_accuracy = max(best_accuracy, accuracy)
+        if reached is None and accuracy >= args.target:
+            reached = elapsed
+
+    if rank == 0:
+        samples = len(train_sampler) * args.batch_size * world_size * args.epochs
+        results.put((world_size, samples / elapsed, reached, elapsed, best_accuracy))
+    cleanup_distributed()
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and time-to-accuracy of DDP CPU training.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--ranks", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--target", type=float, default=0.95, help="Validation accuracy to reach.")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Pixels per step of every rank.")
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--port", type=int, default=29500)
+    args = parser.parse_args()
+
+    results = mp.get_context("spawn").SimpleQueue()
+    print(f"{'ranks':>6} {'samples/s':>12} {'speedup':>8} {'target [s]':>10} {'total [s]':>10} {'accuracy':>10}")
+    baseline = None
+    for world_size in args.ranks:
+        mp.spawn(worker, args=(world_size, args, results), nprocs=world_size, join=True)
+        world_size, throughput, reached, elapsed, accuracy = results.get()
+        baseline = baseline or throughput
+        reached = f"{reached:>10.1f}" if reached is not None else f"{'-':>10}"
+        print(f"{world_size:>6} {throughput:>12,.0f} {throughput / baseline:>7.2f}x {reached} {elapsed:>10.1f} "
+              f"{accuracy*100:>9.2f}%")
+
+if __name__ == "__main__":
+    main()
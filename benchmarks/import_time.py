@@ -0,0 +1,82 @@
+import sys
+import os
+import argparse
+import subprocess
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Import-time benchmark of the entry points. Every module is imported in a fresh interpreter, and
+the wall-clock import time and the heavy backends it loaded are reported. A backend listed in
+the `forbidden` column of an entry point makes the benchmark exit with status 1, so a stray
+eager import (e.g. matplotlib or mlflow pulled into the inference path) is caught.
+
+    python benchmarks/import_time.py --repeats 3
+"""
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+BACKENDS = ["torch", "sklearn", "pandas", "matplotlib", "seaborn", "PIL", "spectral", "cupy", "hypso",
+            "torchvision", "mlflow", "ranger_adabelief", "joblib"]
+
+OPTIONAL = ["pandas", "matplotlib", "seaborn", "PIL", "spectral", "cupy", "hypso", "torchvision", "mlflow",
+            "ranger_adabelief", "joblib"]
+
+# Entry point: backends it must not load at import time
+ENTRY_POINTS = {
+    "manage_data": BACKENDS,
+    "functions.scene_cache": OPTIONAL + ["sklearn"],
+    "functions.processing": OPTIONAL + ["sklearn"],
+    "models.cnn_1d": OPTIONAL + ["sklearn"],
+    "functions.inference": OPTIONAL + ["sklearn"],
+    "functions.triage": OPTIONAL + ["sklearn"],
+    "infer": OPTIONAL + ["sklearn"],
+    "infer_batch": OPTIONAL + ["sklearn"],
+    "export_numpy": OPTIONAL + ["sklearn"],
+    "quantize": OPTIONAL + ["sklearn"],
+    "dataset": OPTIONAL + ["sklearn"],
+    "functions.train_functions": ["pandas", "matplotlib", "seaborn", "cupy", "hypso", "torchvision", "mlflow"],
+    "select_bands": ["pandas", "matplotlib", "seaborn", "cupy", "hypso", "torchvision", "mlflow"],
+}
+
+PROBE = """
+import sys, time
+sys.path[:0] = [{root!r}, {scripts!r}]
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(f"{{seconds}}\t" + ",".join(name for name in {backends!r} if name in sys.modules))
+"""
+
+def import_once(module):
+    """
+    Import a module in a fresh interpreter and return the import time and the loaded backends.
+    """
+    code = PROBE.format(root=ROOT, scripts=os.path.join(ROOT, "scripts"), module=module, backends=BACKENDS)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=ROOT)
+    seconds, loaded = output.stdout.rstrip("\n").splitlines()[-1].split("\t")
+    return float(seconds), [name for name in loaded.split(",") if name]
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and loaded backends of every entry point.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh imports per module, the best time is reported.")
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS), help="Entry points to import.")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':>26} {'seconds':>8}   loaded backends")
+    for module in args.modules:
+        results = [import_once(module) for _ in range(args.repeats)]
+        seconds = min(result[0] for result in results)
+        loaded = results[0][1]
+        forbidden = [name for name in loaded if name in ENTRY_POINTS.get(module, [])]
+        failed = failed or bool(forbidden)
+        note = f"   FORBIDDEN: {', '.join(forbidden)}" if forbidden else ""
+        print(f"{module:>26} {seconds:>8.3f}   {', '.join(loaded) or '-'}{note}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import argparse
+from functions.processing import normalization_manager
+from functions.inference import inference_engine, predict_pixels
+from models.cnn_1d import JustoLiuNet1D_torch, export_weights
+from models.cnn_1d_numpy import JustoLiuNet1D_numpy
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+CPU inference benchmark: pixels/s of the eager model (predict_pixels), the optimized
+inference_engine modes (fused, script, compile) and the NumPy engine, over a grid of batch
+sizes and thread counts, on raw uint16 spectra. Predictions of every mode are checked against
+the eager model, and the best configuration per thread count is printed at the end.
+
+    python benchmarks/inference_cpu.py --checkpoint models/best_model.pth --threads 1 2 4 8
+    python benchmarks/inference_cpu.py --bands 30 --stages 2 --modes eager fused
+"""
+
+MODES = ["eager", "fused", "script", "compile", "numpy"]
+
+#######################################################################################
+
+def build_predictor(mode, model, normalizer, batch_size):
+    """
+    Return a function that classifies raw spectra with the given mode and batch size.
+    """
+    if mode == "eager":
+        return lambda spectra: predict_pixels(model, normalizer, spectra, "cpu", batch_size)
+    if mode == "numpy":
+        engine = JustoLiuNet1D_numpy(export_weights(model, normalizer))
+        return lambda spectra: engine.predict(spectra, batch_size)
+    engine = inference_engine(model, normalizer, mode, batch_size)
+    return engine.predict
+
+def pixels_per_second(predict, spectra, repeats=3):
+    """
+    Return the predictions and the best pixels/s over a few repeats, after one warm-up call.
+    """
+    classes = predict(spectra)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(spectra)
+        best = min(best, time.perf_counter() - start)
+    return classes, spectra.shape[0] / best
+
+#######################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU inference throughput by mode, batch size and threads.")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint written by save_model(). Random weights if not given.")
+    parser.add_argument("--bands", type=int, default=114, help="Bands of the random model.")
+    parser.add_argument("--kernel-size", type=int, default=6, help="Kernel size of the random model.")
+    parser.add_argument("--stages", type=int, default=4, help="Conv/pool stages of the random model.")
+    parser.add_argument("--pixels", type=int, default=65536)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1024, 4096, 16384])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    if args.checkpoint is not None:
+        checkpoint = torch.load(args.checkpoint, map_location="cpu")
+        model = JustoLiuNet1D_torch.from_config(checkpoint.get("model_config", {"num_features": args.bands}))
+        model.load_state_dict(checkpoint["model_state_dict"])
+    else:
+        model = JustoLiuNet1D_torch(args.bands, kernel_size=args.kernel_size, num_stages=args.stages)
+    model.eval()
+    args.bands = model.config["num_features"]
+
+    rng = np.random.default_rng(0)
+    spectra = rng.integers(0, 4096, size=(args.pixels, args.bands), dtype=np.uint16)
+    normalizer = normalization_manager()
+    normalizer.partial_fit(spectra)
+
+    torch.set_num_threads(max(args.threads))
+    reference = predict_pixels(model, normalizer, spectra, "cpu")
+
+    results = {}
+    unavailable = set()
+    print(f"{'mode':>8} {'threads':>8} {'batch':>8} {'pixels/s':>12} {'agreement':>10}")
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for mode in args.modes:
+            for batch_size in args.batch_sizes:
+                if mode in unavailable:
+                    continue
+                try:
+                    predict = build_predictor(mode, model, normalizer, batch_size)
+                    classes, speed = pixels_per_second(predict, spectra)
+                except Exception as error:
+                    # torch.compile needs a working C++ compiler
+                    print(colored(f"{mode:>8} unavailable: {type(error).__name__}: {str(error).splitlines()[0][:80]}", "red"))
+                    unavailable.add(mode)
+                    continue
+                agreement = (classes == reference).mean()
+                results[(mode, threads, batch_size)] = speed
+                print(f"{mode:>8} {threads:>8} {batch_size:>8} {speed:>12,.0f} {agreement*100:>9.2f}%")
+
+    print("\nBest configuration per thread count:")
+    for threads in args.threads:
+        candidates = {key: speed for key, speed in results.items() if key[1] == threads}
+        if not candidates:
+            continue
+        mode, _, batch_size = max(candidates, key=candidates.get)
+        eager = max((speed for key, speed in candidates.items() if key[0] == "eager"), default=None)
+        speedup = f", {candidates[(mode, threads, batch_size)] / eager:.2f}x eager" if eager else ""
+        print(colored(f"{threads} threads: {mode}, batch {batch_size}, "
+                      f"{candidates[(mode, threads, batch_size)]:,.0f} pixels/s{speedup}", "green"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import argparse
+import subprocess
+import tempfile
+from models.cnn_1d import JustoLiuNet1D_torch, export_to_npz
+from models.cnn_1d_numpy import JustoLiuNet1D_numpy
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Check and benchmark of the standalone NumPy engine against JustoLiuNet1D_torch:
+maximum logit deviation and prediction agreement, pixels/s of both engines on one tile,
+and the start-up time (imports plus weight loading) of each in a fresh interpreter.
+
+    python benchmarks/numpy_engine.py --checkpoint models/best_model.pth --pixels 65536
+"""
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+NUMPY_STARTUP = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+from models.cnn_1d_numpy import JustoLiuNet1D_numpy
+engine = JustoLiuNet1D_numpy.load({weights!r})
+print(time.perf_counter() - start)
+"""
+
+TORCH_STARTUP = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+from models.cnn_1d import JustoLiuNet1D_torch
+import torch
+checkpoint = torch.load({checkpoint!r}, map_location="cpu")
+model = JustoLiuNet1D_torch.from_config(checkpoint.get("model_config", {{"num_features": {bands}}}))
+model.load_state_dict(checkpoint["model_state_dict"])
+print(time.perf_counter() - start)
+"""
+
+#######################################################################################
+
+def startup_seconds(code):
+    """
+    Run code in a fresh interpreter and return the seconds it prints on its last line.
+    """
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def pixels_per_second(fn, x, repeats=3):
+    """
+    Return the best pixels/s of fn(x) over a few repeats.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(x)
+        best = min(best, time.perf_counter() - start)
+    return x.shape[0] / best
+
+#######################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy engine vs torch: accuracy, throughput and start-up.")
+    parser.add_argument("--checkpoint", default="models/best_model.pth")
+    parser.add_argument("--bands", type=int, default=114, help="Bands, for checkpoints without a model config.")
+    parser.add_argument("--pixels", type=int, default=65536, help="Pixels per tile.")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads (NumPy uses its BLAS setting).")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    checkpoint = torch.load(args.checkpoint, map_location="cpu")
+    model = JustoLiuNet1D_torch.from_config(checkpoint.get("model_config", {"num_features": args.bands}))
+    model.load_state_dict(checkpoint["model_state_dict"])
+    model.eval()
+    args.bands = model.config["num_features"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        weights_path = os.path.join(tmp, "weights.npz")
+        export_to_npz(model, weights_path)
+        engine = JustoLiuNet1D_numpy.load(weights_path)
+
+        x = np.random.default_rng(0).random((args.pixels, args.bands), dtype=np.float32)
+        with torch.inference_mode():
+            reference = model(torch.from_numpy(x).unsqueeze(1)).numpy()
+        logits = engine.forward(x)
+
+        deviation = np.abs(logits - reference).max()
+        agreement = (logits.argmax(1) == reference.argmax(1)).mean()
+        print(colored(f"Max |logit difference|: {deviation:.2e}, prediction agreement: {agreement*100:.3f}%",
+                      "green" if deviation < 1e-4 else "red"))
+
+        def torch_forward(batch):
+            with torch.inference_mode():
+                return model(torch.from_numpy(batch).unsqueeze(1))
+
+        print(f"torch: {pixels_per_second(torch_forward, x):>12,.0f} pixels/s")
+        print(f"numpy: {pixels_per_second(engine.forward, x):>12,.0f} pixels/s")
+
+        numpy_start = startup_seconds(NUMPY_STARTUP.format(repo=REPO, weights=weights_path))
+        torch_start = startup_seconds(TORCH_STARTUP.format(repo=REPO, bands=args.bands,
+                                                           checkpoint=os.path.abspath(args.checkpoint)))
+        print(f"Start-up (imports + weights): numpy {numpy_start*1000:.0f} ms, "
+              f"torch + libraries.py {torch_start*1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
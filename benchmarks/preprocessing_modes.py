@@ -0,0 +1,98 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+import argparse
+from manage_data import read_csv_file
+from functions.processing import normalization_manager, load_image, load_label, bin_bands, num_input_features
+from functions.inference import inference_engine, predict_scene
+from functions.band_selection import sample_labeled_pixels, lda_accuracy
+from models.cnn_1d import JustoLiuNet1D_torch, max_stages
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Accuracy/throughput trade-off of spectral binning and spatial striding.
+For every (bin_size, stride) pair it reports:
+- the accuracy of a linear discriminant analysis on binned spectra (a cheap proxy for a model
+  retrained on that binning),
+- the quick-look agreement: the fraction of full-resolution labels equal to the label of their
+  nearest pixel on the decimated grid, i.e. the accuracy lost by striding alone,
+- the full-resolution-equivalent pixels/s of predict_scene() with the fused inference engine and
+  a model sized for the binned spectra, and the speedup over bin_size=1, stride=1.
+
+    python benchmarks/preprocessing_modes.py --bin-sizes 1 2 3 4 --strides 1 2 4 --threads 4
+"""
+
+HEIGHT, WIDTH = 598, 1092
+
+def scene_seconds(image_path, bin_size, stride, kernel_size, threads, repeats=2):
+    """
+    Return the best predict_scene() time of an untrained model sized for the binned spectra.
+    """
+    num_features = num_input_features(bin_size=bin_size)
+    model = JustoLiuNet1D_torch(num_features, kernel_size=kernel_size,
+                                num_stages=max_stages(num_features, kernel_size)).eval()
+    normalizer = normalization_manager().set_preprocessing(bin_size=bin_size)
+    normalizer.partial_fit(load_image(image_path, rows=(0, 64), bin_size=bin_size))
+    engine = inference_engine(model, normalizer, "fused", 2048, threads)
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict_scene(image_path, engine, normalizer, bin_size=bin_size, stride=stride, batch_size=2048)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def quick_look_agreement(label_paths, stride):
+    """
+    Fraction of labels equal to the label of their nearest pixel on the decimated grid.
+    """
+    agree = 0
+    total = 0
+    for label_path in label_paths:
+        label = load_label(label_path).reshape(HEIGHT, WIDTH)
+        upsampled = np.repeat(np.repeat(label[::stride, ::stride], stride, axis=0), stride, axis=1)[:HEIGHT, :WIDTH]
+        valid = label < 3
+        agree += int((upsampled[valid] == label[valid]).sum())
+        total += int(valid.sum())
+    return agree / max(total, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Spectral binning and spatial stride: accuracy vs throughput.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--pixels", type=int, default=100_000, help="Labeled pixels sampled from each split.")
+    parser.add_argument("--bin-sizes", type=int, nargs="+", default=[1, 2, 3, 4])
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--kernel-size", type=int, default=6)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    train_bip_paths, train_labels_paths, _ = read_csv_file(args.train_csv)
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+    train_spectra, train_labels = sample_labeled_pixels(train_bip_paths, train_labels_paths, args.pixels)
+    eval_spectra, eval_labels = sample_labeled_pixels(eval_bip_paths, eval_labels_paths, args.pixels, seed=1)
+
+    baseline = None
+    print("\n" + f"{'bin':>4} {'stride':>7} {'features':>9} {'LDA accuracy':>13} {'quick-look':>11} "
+          f"{'pixels/s':>12} {'speedup':>8}")
+    for bin_size in args.bin_sizes:
+        train_binned, eval_binned = bin_bands(train_spectra, bin_size), bin_bands(eval_spectra, bin_size)
+        columns = list(range(train_binned.shape[1]))
+        accuracy = lda_accuracy(train_binned, train_labels, eval_binned, eval_labels, columns)
+
+        for stride in args.strides:
+            agreement = quick_look_agreement(eval_labels_paths, stride)
+            speed = HEIGHT * WIDTH / scene_seconds(eval_bip_paths[0], bin_size, stride, args.kernel_size, args.threads)
+            baseline = baseline or speed
+            print(f"{bin_size:>4} {stride:>7} {len(columns):>9} {accuracy*100:>12.2f}% {agreement*100:>10.2f}% "
+                  f"{speed:>12,.0f} {speed / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
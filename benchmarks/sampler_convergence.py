@@ -0,0 +1,101 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+from libraries.training import *
+import argparse
+from manage_data import read_csv_file
+from dataset import merged_hyperspectral_dataset
+from samplers import permutation_batch_sampler, stratified_batch_sampler, loss_tracker
+from functions.processing import normalization_manager
+from functions.metrics import confusion_matrix_accumulator
+from functions.train_functions import train_subloop, eval_subloop, class_histograms
+from models.cnn_1d import JustoLiuNet1D_torch
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Time-to-accuracy of the training samplers: uniform shuffling of all pixels per epoch against
+class-balanced epochs of a fixed pixel budget, with and without hard-example oversampling.
+Every run trains the same model for --epochs epochs and is evaluated after every epoch; the
+table reports the training wall-clock time (evaluation excluded) until the validation accuracy
+first reaches --target, and the best accuracy and mean class recall of the run.
+
+    python benchmarks/sampler_convergence.py --budget 500000 --epochs 10 --target 0.95
+"""
+
+def run(name, train_dataset, eval_loader, sampler, tracker, args, device):
+    torch.manual_seed(0)
+    model = JustoLiuNet1D_torch(num_features=train_dataset.images.shape[1]).to(device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
+    loader = DataLoader(train_dataset, batch_sampler=sampler, num_workers=0, collate_fn=train_dataset.collate_fn)
+
+    elapsed = 0.0
+    reached = None
+    best_accuracy = 0.0
+    best_recall = 0.0
+    for epoch in range(args.epochs):
+        model.train()
+        start = time.perf_counter()
+        train_subloop(loader, model, criterion, optimizer, device, loss_tracker=tracker)
+        if tracker is not None:
+            tracker.update()
+        elapsed += time.perf_counter() - start
+
+        model.eval()
+        with torch.no_grad():
+            metrics, _ = eval_subloop(eval_loader, model, criterion, device, confusion_matrix_accumulator(3, device))
+        accuracy = metrics.accuracy()
+        recall = metrics.classification_report(["Cloud", "Land", "Sea"], output_dict=True)["macro avg"]["recall"]
+        best_accuracy = max(best_accuracy, accuracy)
+        best_recall = max(best_recall, recall)
+        if reached is None and accuracy >= args.target:
+            reached = elapsed
+
+    reached = f"{reached:>10.1f}" if reached is not None else f"{'-':>10}"
+    print(f"{name:>10} {len(sampler) * args.batch_size:>14,} {reached} {elapsed:>10.1f} "
+          f"{best_accuracy*100:>9.2f}% {best_recall*100:>9.2f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-accuracy of uniform, balanced and hard-example sampling.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--budget", type=int, default=500_000, help="Pixels per epoch of the balanced samplers.")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--target", type=float, default=0.95, help="Validation accuracy to reach.")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    train_bip_paths, train_labels_paths, _ = read_csv_file(args.train_csv)
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+
+    normalizer = normalization_manager()
+    train_dataset = merged_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer,
+                                                 storage="compact", fit_normalizer=True)
+    eval_dataset = merged_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer, storage="compact")
+    eval_loader = DataLoader(eval_dataset, batch_sampler=permutation_batch_sampler(len(eval_dataset), 8192, shuffle=False),
+                             collate_fn=eval_dataset.collate_fn)
+    class_counts = class_histograms(train_labels_paths, 3).sum(axis=0)
+    print(f"Training pixels per class: {class_counts.tolist()}")
+
+    print(f"{'sampler':>10} {'pixels/epoch':>14} {'target [s]':>10} {'total [s]':>10} {'accuracy':>10} {'recall':>10}")
+    run("uniform", train_dataset, eval_loader,
+        permutation_batch_sampler(len(train_dataset), args.batch_size), None, args, device)
+    run("balanced", train_dataset, eval_loader,
+        stratified_batch_sampler(train_dataset.labels, args.batch_size, class_counts, args.budget), None, args, device)
+    tracker = loss_tracker(len(train_dataset), initial_loss=np.log(3))
+    run("hard", train_dataset, eval_loader,
+        stratified_batch_sampler(train_dataset.labels, args.batch_size, class_counts, args.budget,
+                                 loss_tracker=tracker), tracker, args, device)
+
+if __name__ == "__main__":
+    main()
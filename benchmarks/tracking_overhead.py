@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import argparse
+import tempfile
+from functions.tracking import tracking_worker, file_backend
+from functions.train_functions import log_metrics, render_confusion_matrix
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Benchmark of the tracking work at the end of an epoch in train_loop(): the metrics of a
+classification report and the confusion matrix plot, done synchronously or handed to a
+tracking_worker. The time reported is the time the training path is blocked; the worker
+time overlaps with the next epoch. Both paths write to a file_backend.
+
+    python benchmarks/tracking_overhead.py --epochs 10
+"""
+
+def epoch_metrics(num_classes, rng):
+    """
+    Metrics of one epoch, as many as log_classification_report_mlflow() logs.
+    """
+    metrics = {"train_accuracy": rng.random(), "val_accuracy": rng.random(),
+               "train_loss": rng.random(), "val_loss": rng.random()}
+    for c in range(num_classes):
+        for name in ("precision", "recall", "f1-score", "support"):
+            metrics[f"class_{c}_{name}"] = rng.random()
+    return metrics
+
+def run(epochs, num_classes, directory, tracker=None):
+    rng = np.random.default_rng(0)
+    backend = file_backend(directory)
+    classes = [f"class_{c}" for c in range(num_classes)]
+    blocked = 0.0
+    for epoch in range(epochs):
+        metrics = epoch_metrics(num_classes, rng)
+        cm = rng.integers(0, 10000, (num_classes, num_classes))
+        filepath = os.path.join(directory, f"confusion_matrix_EPOCH_{epoch+1}.png")
+
+        start = time.perf_counter()
+        if tracker is None:
+            backend.log_batch([(key, value, epoch) for key, value in metrics.items()], {})
+            render_confusion_matrix(cm, classes, filepath)
+            backend.log_artifact(filepath, "confusion_matrices")
+        else:
+            log_metrics(metrics, epoch, tracker)
+            tracker.log_plot(render_confusion_matrix, (cm, classes), filepath, "confusion_matrices")
+        blocked += time.perf_counter() - start
+
+    if tracker is not None:
+        start = time.perf_counter()
+        tracker.close()
+        print(f"  final flush {time.perf_counter() - start:.3f} s")
+    return blocked
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--classes", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync = run(args.epochs, args.classes, os.path.join(directory, "sync"))
+        print(f"synchronous   {sync:.3f} s blocked ({sync / args.epochs * 1000:.1f} ms per epoch)")
+        worker_dir = os.path.join(directory, "worker")
+        worker = run(args.epochs, args.classes, worker_dir, tracking_worker(file_backend(worker_dir)))
+        print(f"worker thread {worker:.3f} s blocked ({worker / args.epochs * 1000:.1f} ms per epoch)")
@@ -0,0 +1,122 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+import argparse
+from functions.train_functions import train_subloop
+from models.cnn_1d import JustoLiuNet1D_torch
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Benchmark of one training epoch with the previous train_subloop (loss.item() and .sum().item()
+on every batch, outputs and labels of every batch stored on the host) against the current
+train_subloop (on-device accumulation, no stored outputs). Reports samples/s and the growth of
+the resident memory over the epoch. Synthetic normalized spectra are used.
+
+    python benchmarks/train_step.py --batches 2000 --batch-size 128
+"""
+
+def legacy_train_subloop(loop, model, criterion, optimizer, device,
+                         predictions_per_epoch, labels_per_epoch, total_loss):
+    """
+    Copy of the previous train_subloop, kept here as the baseline.
+    """
+    correct = 0
+    total = 0
+    for spectrum, labels in loop:
+        spectrum = spectrum.unsqueeze(1).to(device, non_blocking=True)
+        labels = labels.view(-1).to(device, non_blocking=True)
+
+        optimizer.zero_grad()
+        output = model(spectrum)
+
+        loss = criterion(output, labels)
+        loss.backward()
+        optimizer.step()
+
+        predictions_per_epoch.append(output.detach().cpu())
+        labels_per_epoch.append(labels.detach().cpu())
+
+        total_loss += loss.item()
+        _, predicted = output.max(1)
+        correct += (predicted == labels).sum().item()
+        total += labels.size(0)
+
+    return 100 * correct / total, total_loss
+
+#######################################################################################
+
+def resident_memory_mb():
+    """
+    Return the resident set size of this process in MB (Linux).
+    """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+class memory_tracking_batches:
+    """
+    Iterable over synthetic batches that records the resident memory every 100 batches.
+    """
+    def __init__(self, batches):
+        self.batches = batches
+        self.memory = []
+
+    def __iter__(self):
+        for i, batch in enumerate(self.batches):
+            if i % 100 == 0:
+                self.memory.append(resident_memory_mb())
+            yield batch
+        self.memory.append(resident_memory_mb())
+
+#######################################################################################
+
+def run(name, subloop, batches, device, args):
+    torch.manual_seed(0)
+    model = JustoLiuNet1D_torch(num_features=args.bands).to(device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.001, weight_decay=1e-4)
+    criterion = nn.CrossEntropyLoss(label_smoothing=0.1)
+
+    loop = memory_tracking_batches(batches)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    if subloop is legacy_train_subloop:
+        subloop(loop, model, criterion, optimizer, device, [], [], 0.0)
+    else:
+        subloop(loop, model, criterion, optimizer, device)
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    samples = len(batches) * args.batch_size
+    growth = loop.memory[-1] - loop.memory[0]
+    print(f"{name:>8} {samples / elapsed:>14,.0f} {growth:>16.1f}   "
+          + " ".join(f"{m - loop.memory[0]:.0f}" for m in loop.memory[::max(1, len(loop.memory) // 8)]))
+    return samples / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Training step throughput and memory, legacy vs current train_subloop.")
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--bands", type=int, default=114)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    generator = torch.Generator().manual_seed(0)
+    batches = [(torch.rand(args.batch_size, args.bands, generator=generator),
+                torch.randint(0, 3, (args.batch_size,), generator=generator)) for _ in range(args.batches)]
+
+    print(f"{'path':>8} {'samples/s':>14} {'RSS growth [MB]':>16}   RSS growth curve [MB]")
+    legacy = run("legacy", legacy_train_subloop, batches, device, args)
+    current = run("current", train_subloop, batches, device, args)
+    print(f"Speedup: {current / legacy:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+import json
+from functions.processing import open_cube, load_label, band_indices
+from functions.inference import predict_pixels
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Spectral band selection. Bands (or groups of adjacent bands) are ranked by how much they
+contribute to the Sea/Land/Cloud separability, either with the Fisher score of every band or by
+occluding band groups in a trained model, and the best subset is written to a bands.json file
+that the datasets, the scene cache, train.py and the inference scripts consume.
+"""
+
+CANDIDATE_BANDS = np.arange(3, 117) # Bands kept by processing.cut_bands()
+
+#######################################################################################
+
+def sample_labeled_pixels(image_paths, label_paths, num_pixels, num_classes=3, HEIGHT=598, WIDTH=1092,
+                          BANDS=120, seed=0):
+    """
+    Draw random labeled pixels evenly from a list of scenes, reading only the sampled spectra.
+    Args:
+        image_paths (list of str): Paths to the .bip (/.bip@) files.
+        label_paths (list of str): Paths to the .dat label files.
+        num_pixels (int): Total number of pixels to draw.
+        num_classes (int): Pixels with a label outside [0, num_classes) are dropped.
+        HEIGHT, WIDTH, BANDS (int): Dimensions of the raw cube.
+        seed (int): Seed of the random generator.
+    Returns:
+        tuple: uint16 spectra of shape (pixels, len(CANDIDATE_BANDS)) and uint8 labels of shape (pixels,).
+    """
+    rng = np.random.default_rng(seed)
+    per_scene = max(1, num_pixels // max(1, len(image_paths)))
+    all_spectra = []
+    all_labels = []
+
+    for image_path, label_path in tqdm(list(zip(image_paths, label_paths)), desc="Sampling labeled pixels"):
+        labels = load_label(label_path, HEIGHT, WIDTH)
+        valid = np.flatnonzero(labels < num_classes)
+        indices = np.sort(rng.choice(valid, size=min(per_scene, valid.size), replace=False))
+
+        cube = open_cube(image_path, HEIGHT, WIDTH, BANDS)
+        rows, cols = np.divmod(indices, WIDTH)
+        all_spectra.append(np.asarray(cube[CANDIDATE_BANDS[0]:CANDIDATE_BANDS[-1] + 1][:, rows, cols]).T)
+        all_labels.append(labels[indices])
+
+    return np.concatenate(all_spectra), np.concatenate(all_labels)
+
+#######################################################################################
+
+def fisher_scores(spectra, labels, num_classes=3):
+    """
+    Fisher score of every band: variance of the class means over the mean within-class variance.
+    Args:
+        spectra (numpy.ndarray): Spectra of shape (pixels, bands).
+        labels (numpy.ndarray): Labels of shape (pixels,).
+        num_classes (int): Number of classes.
+    Returns:
+        numpy.ndarray: float64 scores of shape (bands,), higher is more discriminative.
+    """
+    spectra = np.asarray(spectra, dtype=np.float64)
+    mean = spectra.mean(axis=0)
+    between = np.zeros(spectra.shape[1])
+    within = np.zeros(spectra.shape[1])
+
+    for c in range(num_classes):
+        class_spectra = spectra[labels == c]
+        if class_spectra.shape[0] == 0:
+            continue
+        between += class_spectra.shape[0] * (class_spectra.mean(axis=0) - mean) ** 2
+        within += class_spectra.shape[0] * class_spectra.var(axis=0)
+
+    return between / np.maximum(within, 1e-12)
+
+def check_candidate_preprocessing(preprocessing):
+    """
+    Raise a ValueError unless a model was trained on all CANDIDATE_BANDS without spectral binning,
+    which occlusion_scores() needs to occlude the sampled spectra band by band.
+    Args:
+        preprocessing (dict): Input preprocessing of the checkpoint, see inference.load_preprocessing().
+    """
+    bands = band_indices(preprocessing.get('bands'))
+    bin_size = preprocessing.get('bin_size', 1)
+    if bands != CANDIDATE_BANDS.tolist() or bin_size != 1:
+        raise ValueError(f"Occlusion needs a model trained on all {len(CANDIDATE_BANDS)} candidate bands without "
+                         f"binning, but the checkpoint was trained on {len(bands)} bands with bin_size={bin_size}. "
+                         "Use --method fisher or a checkpoint trained without BANDS_FILE and BIN_SIZE.")
+
+def occlusion_scores(model, normalizer, spectra, labels, group_size=1, device="cpu", batch_size=8192):
+    """
+    Accuracy drop of a trained model when a group of adjacent bands is replaced by its mean.
+    Args:
+        model (torch.nn.Module): Trained model that takes all candidate bands, see check_candidate_preprocessing().
+        normalizer (normalization_manager): Fitted normalizer of the model.
+        spectra (numpy.ndarray): Raw uint16 spectra of shape (pixels, bands).
+        labels (numpy.ndarray): Labels of shape (pixels,).
+        group_size (int): Number of adjacent bands occluded together.
+        device (torch.device or str): Device the model is on.
+        batch_size (int): Number of pixels per forward pass.
+    Returns:
+        numpy.ndarray: float64 scores of shape (bands,), every band gets the drop of its group.
+    """
+    baseline = (predict_pixels(model, normalizer, spectra, device, batch_size) == labels).mean()
+    band_means = spectra.mean(axis=0).round().astype(spectra.dtype)
+    scores = np.zeros(spectra.shape[1])
+
+    for start in tqdm(range(0, spectra.shape[1], group_size), desc="Occluding band groups"):
+        stop = min(start + group_size, spectra.shape[1])
+        occluded = spectra.copy()
+        occluded[:, start:stop] = band_means[start:stop]
+        scores[start:stop] = baseline - (predict_pixels(model, normalizer, occluded, device, batch_size) == labels).mean()
+
+    return scores
+
+#######################################################################################
+
+def select_bands(scores, num_bands, group_size=1, candidate_bands=CANDIDATE_BANDS):
+    """
+    Select the best groups of adjacent bands.
+    Args:
+        scores (numpy.ndarray): Score of every candidate band, from fisher_scores() or occlusion_scores().
+        num_bands (int): Number of bands to keep.
+        group_size (int): Number of adjacent bands ranked and kept together. Groups make contiguous
+            band runs, which the memory-mapped reader reads with fewer, larger reads.
+        candidate_bands (numpy.ndarray): Absolute band index of every score.
+    Returns:
+        list of int: Sorted absolute band indices.
+    """
+    starts = np.arange(0, len(scores), group_size)
+    group_scores = np.add.reduceat(np.asarray(scores, dtype=np.float64), starts) / np.diff(np.append(starts, len(scores)))
+
+    selected = []
+    for start in starts[np.argsort(-group_scores, kind="stable")]:
+        selected.extend(range(start, min(start + group_size, len(scores))))
+        if len(selected) >= num_bands:
+            break
+
+    return sorted(int(candidate_bands[i]) for i in selected[:num_bands])
+
+def lda_accuracy(train_spectra, train_labels, test_spectra, test_labels, columns):
+    """
+    Accuracy of a linear discriminant analysis on a subset of bands, a cheap proxy for the
+    accuracy of a model trained on that subset.
+    Args:
+        columns (list of int): Column indices of the bands in the spectra.
+    Returns:
+        float: Test accuracy in [0, 1].
+    """
+    lda = LinearDiscriminantAnalysis()
+    lda.fit(np.asarray(train_spectra[:, columns], dtype=np.float32), train_labels)
+    return float(lda.score(np.asarray(test_spectra[:, columns], dtype=np.float32), test_labels))
+
+#######################################################################################
+
+def save_bands(path, bands, **info):
+    """
+    Write a band subset to a JSON file.
+    Args:
+        path (str): Output .json file.
+        bands (list of int): Absolute band indices.
+        **info: Extra entries stored with the bands, e.g. method and group_size.
+    """
+    with open(path, 'w') as f:
+        json.dump({"bands": [int(band) for band in bands], **info}, f, indent=2)
+
+def load_bands(path):
+    """
+    Read the band subset written by save_bands().
+    Returns:
+        list of int: Absolute band indices.
+    """
+    with open(path) as f:
+        return json.load(f)["bands"]
@@ -0,0 +1,232 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+from libraries.model import *
+import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from manage_data import read_csv_file
+from functions.inference import load_trained_model, load_preprocessing, predict_scene, inference_engine, spectrum_memo
+from functions.triage import quick_look, triage_scenes
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Multi-scene batch inference. Scenes are spread over a pool of worker processes, every worker
+loads the model once and limits torch to a fixed number of intra-op threads, and scenes whose
+class maps are newer than the scene and the checkpoint are skipped. Optionally, every scene is
+triaged first with a strided quick-look, scenes that are almost certainly cloud are skipped, and
+the rest are classified clearest first.
+"""
+
+# Model, normalizer and input preprocessing of the current worker process, loaded once by init_worker()
+worker_state = {}
+
+#######################################################################################
+
+def find_scenes(csv_path=None, pattern=None):
+    """
+    Collect the .bip (/.bip@) files to classify.
+    Args:
+        csv_path (str, optional): CSV file written by manage_data.create_csv_file().
+        pattern (str, optional): Glob pattern, e.g. "raw_data/**/*.bip". Recursive patterns are supported.
+    Returns:
+        list of str: Paths of the scenes, without duplicates.
+    """
+    image_paths = []
+
+    if csv_path is not None:
+        bip_paths, _, _ = read_csv_file(csv_path)
+        image_paths.extend(bip_paths)
+
+    if pattern is not None:
+        image_paths.extend(sorted(glob.glob(pattern, recursive=True)))
+
+    return list(dict.fromkeys(image_paths))
+
+#######################################################################################
+
+def scene_output_path(image_path, output_dir, stride=1, kind="classes"):
+    """
+    Return the path of the class map (or probability map, kind="probabilities") of a scene.
+    Decimated maps get the stride in their name (<scene>_classes_s4.npy), so a run with another
+    stride neither overwrites them nor counts them as up to date.
+    """
+    name = os.path.basename(image_path).rstrip("@")
+    suffix = f"_{kind}" if stride == 1 else f"_{kind}_s{stride}"
+    return os.path.join(output_dir, os.path.splitext(name)[0] + suffix + ".npy")
+
+def is_up_to_date(output_path, dependencies):
+    """
+    Check if an output exists and is newer than all files it was computed from.
+    """
+    if not os.path.exists(output_path):
+        return False
+    output_time = os.path.getmtime(output_path)
+    return all(os.path.getmtime(path) <= output_time for path in dependencies if path is not None)
+
+#######################################################################################
+
+def init_worker(checkpoint_path, normalizer_path, threads_per_worker, mode="fused", batch_size=2048, memo_entries=None):
+    """
+    Initialize a worker process: cap the torch threads and load (and optimize) the model once.
+    With memo_entries, the worker keeps a spectrum_memo shared by all its scenes.
+    """
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    model, normalizer = load_trained_model(checkpoint_path, "cpu", normalizer_path)
+    if mode != "eager":
+        model = inference_engine(model, normalizer, mode, batch_size)
+    worker_state['model'], worker_state['normalizer'] = model, normalizer
+    worker_state['preprocessing'] = load_preprocessing(checkpoint_path)
+    worker_state['memo'] = spectrum_memo(memo_entries) if memo_entries is not None else None
+
+def classify_scene(image_path, output_path, probabilities_path, predict_kwargs):
+    """
+    Classify one scene in a worker process. The outputs are written to temporary files and renamed
+    when they are complete, so an interrupted run never leaves an output that looks up to date.
+    Returns:
+        tuple: (image_path, seconds, dedup ratio or None).
+    """
+    start = time.perf_counter()
+    memo = worker_state['memo']
+    if memo is not None:
+        memo.reset_stats()
+
+    partial_output = output_path + ".partial.npy"
+    partial_probabilities = probabilities_path + ".partial.npy" if probabilities_path is not None else None
+
+    predict_scene(image_path, worker_state['model'], worker_state['normalizer'], output_path=partial_output,
+                  probabilities_path=partial_probabilities, memo=memo,
+                  **{**worker_state['preprocessing'], **predict_kwargs})
+
+    if partial_probabilities is not None:
+        os.replace(partial_probabilities, probabilities_path)
+    os.replace(partial_output, output_path)
+
+    return image_path, time.perf_counter() - start, memo.dedup_ratio() if memo is not None else None
+
+def triage_jobs(jobs, checkpoint_path, normalizer_path, output_dir, max_cloud_fraction, stride=16, confidence=0.95):
+    """
+    Estimate the cloud fraction of every scene with a strided quick-look, drop the scenes that
+    are almost certainly cloud and order the rest clearest first. The estimates are written to
+    <output_dir>/triage.csv.
+    Args:
+        jobs (list of tuple): (image_path, output_path, probabilities_path) of every scene.
+        max_cloud_fraction (float): Scenes whose cloud fraction lower bound is above it are skipped.
+        stride (int): Sampling stride of the quick-look.
+        confidence (float): Confidence level of the fraction intervals.
+    Returns:
+        list of tuple: The kept jobs in priority order.
+    """
+    model, normalizer = load_trained_model(checkpoint_path, "cpu", normalizer_path)
+    engine = inference_engine(model, normalizer, "fused")
+    preprocessing = load_preprocessing(checkpoint_path)
+
+    estimates = {}
+    for image_path, _, _ in tqdm(jobs, desc="Quick-look triage", colour="blue"):
+        estimates[image_path] = quick_look(image_path, engine, normalizer, stride, confidence, **preprocessing)
+
+    kept, skipped = triage_scenes(estimates, max_cloud_fraction)
+
+    with open(os.path.join(output_dir, "triage.csv"), mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["bip_file", "cloud", "cloud_lower", "cloud_upper", "land", "sea", "pixels", "skipped"])
+        for image_path, estimate in estimates.items():
+            writer.writerow([image_path] + [f"{value:.4f}" for value in (estimate['fractions'][0], estimate['lower'][0],
+                             estimate['upper'][0], estimate['fractions'][1], estimate['fractions'][2])]
+                            + [estimate['n_pixels'], image_path in skipped])
+
+    seconds = sum(estimate['seconds'] for estimate in estimates.values())
+    print(colored(f"Triage: skipped {len(skipped)} of {len(jobs)} scenes with more than "
+                  f"{max_cloud_fraction*100:.0f}% cloud, {seconds / max(len(jobs), 1) * 1000:.0f} ms per scene.", "blue"))
+
+    jobs_by_path = {job[0]: job for job in jobs}
+    return [jobs_by_path[image_path] for image_path in kept]
+
+#######################################################################################
+
+def run_batch_inference(image_paths, checkpoint_path, output_dir, normalizer_path=None, num_workers=4,
+                        threads_per_worker=2, save_probabilities=False, force=False, mode="fused",
+                        max_cloud_fraction=None, triage_stride=16, memo_entries=None, **predict_kwargs):
+    """
+    Classify many scenes with a pool of worker processes.
+    Args:
+        image_paths (list of str): Scenes to classify.
+        checkpoint_path (str): Checkpoint written by save_model().
+        output_dir (str): Directory for the class maps (<scene>_classes.npy, or <scene>_classes_s<stride>.npy).
+        normalizer_path (str, optional): Normalizer file, if the checkpoint has none.
+        num_workers (int): Number of worker processes.
+        threads_per_worker (int): Intra-op torch threads per worker.
+        save_probabilities (bool): Also write <scene>_probabilities.npy.
+        force (bool): Classify scenes even if their outputs are up to date.
+        mode (str): CPU inference mode, see models.cnn_1d.optimize_for_inference().
+        max_cloud_fraction (float, optional): If given, scenes are triaged with a quick-look first, see
+            triage_jobs(). Defaults to None (no triage).
+        triage_stride (int): Sampling stride of the quick-look.
+        memo_entries (int, optional): If given, identical spectra are classified once, with a cross-tile
+            cache of this many spectra per worker, see inference.spectrum_memo. Defaults to None.
+        **predict_kwargs: Passed to predict_scene(), e.g. tile_rows, batch_size or prefetch.
+    Returns:
+        dict: Mapping from scene path to its latency in seconds, for the classified scenes.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    skipped = 0
+    for image_path in image_paths:
+        stride = predict_kwargs.get("stride", 1)
+        output_path = scene_output_path(image_path, output_dir, stride)
+        probabilities_path = scene_output_path(image_path, output_dir, stride, "probabilities") if save_probabilities else None
+        outputs = [output_path] + ([probabilities_path] if probabilities_path is not None else [])
+
+        if not force and all(is_up_to_date(path, [image_path, checkpoint_path, normalizer_path]) for path in outputs):
+            skipped += 1
+            continue
+        jobs.append((image_path, output_path, probabilities_path))
+
+    print(colored(f"{len(jobs)} scenes to classify, {skipped} up to date.", "blue"))
+
+    if jobs and max_cloud_fraction is not None:
+        jobs = triage_jobs(jobs, checkpoint_path, normalizer_path, output_dir, max_cloud_fraction, triage_stride)
+
+    latencies = {}
+    if not jobs:
+        return latencies
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=init_worker,
+                             initargs=(checkpoint_path, normalizer_path, threads_per_worker, mode,
+                                       predict_kwargs.get("batch_size", 2048), memo_entries)) as pool:
+        futures = [pool.submit(classify_scene, image_path, output_path, probabilities_path, predict_kwargs)
+                   for image_path, output_path, probabilities_path in jobs]
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Classifying scenes", colour="green"):
+            try:
+                image_path, seconds, dedup_ratio = future.result()
+            except Exception as error:
+                print(colored(f"Failed: {error}", "red"))
+                continue
+            latencies[image_path] = seconds
+            tqdm.write(f"{os.path.basename(image_path)}: {seconds:.2f} s"
+                       + (f", dedup {dedup_ratio:.2f}x" if dedup_ratio is not None else ""))
+
+    elapsed = time.perf_counter() - start
+    if latencies:
+        seconds = np.array(list(latencies.values()))
+        print(colored(f"Classified {len(latencies)} scenes in {elapsed:.1f} s, "
+                      f"{len(latencies) / elapsed * 3600:.0f} scenes/hour. Latency per scene: "
+                      f"mean {seconds.mean():.2f} s, median {np.median(seconds):.2f} s, max {seconds.max():.2f} s.",
+                      "green"))
+
+    return latencies
@@ -0,0 +1,239 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+import queue
+import threading
+from functions.distributed import is_main_process
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Training-state checkpoints for resuming an interrupted run. Unlike save_model(), which keeps the
+best model for inference, a training checkpoint holds everything train_loop() needs to continue
+where it stopped: model, optimizer and scheduler state, the fitted normalizer, the epoch and the
+step within it, the partial metrics of the epoch, the per-pixel losses of hard-example sampling
+and the RNG states. The checkpoint_writer takes a copy of the state on the training thread and
+writes it atomically from a background thread.
+"""
+
+#######################################################################################
+
+def cpu_copy(value):
+    """
+    Recursively copy every tensor of a (nested) state dict to the CPU, so the training step can
+    keep updating the originals while the copy is written.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: cpu_copy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(cpu_copy(item) for item in value)
+    return value
+
+def rng_state():
+    """
+    Return the states of the Python, NumPy and torch (CPU and CUDA) random number generators.
+    """
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    """
+    Restore the random number generators from a dictionary created by rng_state().
+    """
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+#######################################################################################
+
+def training_state(model, optimizer, scheduler, epoch, step, best_accuracy, progress=None,
+                   normalizer=None, preprocessing=None, loss_tracker=None):
+    """
+    Collect the full training state as a dictionary of CPU tensors and plain values.
+    Args:
+        model (torch.nn.Module): The model being trained.
+        optimizer (torch.optim.Optimizer): Optimizer, e.g. AdamW.
+        scheduler (torch.optim.lr_scheduler): Learning rate scheduler, e.g. StepLR.
+        epoch (int): Current epoch, 0-based.
+        step (int): Training steps done in the current epoch, 0 at the start of an epoch.
+        best_accuracy (float): Best validation accuracy so far.
+        progress (dict, optional): Partial sums of the epoch ('loss_sum', 'correct', 'total').
+        normalizer (normalization_manager, optional): Fitted normalizer, reused instead of refitting.
+        preprocessing (dict, optional): Spectral input preprocessing, see save_model().
+        loss_tracker (loss_tracker, optional): Per-pixel losses of hard-example sampling.
+    Returns:
+        dict: The checkpoint, see checkpoint_writer.save().
+    """
+    checkpoint = {
+        'model_state_dict': model.state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'scheduler_state_dict': scheduler.state_dict(),
+        'epoch': epoch,
+        'step': step,
+        'best_accuracy': best_accuracy,
+        'progress': progress or {'loss_sum': 0.0, 'correct': 0, 'total': 0},
+        'rng_state': rng_state()
+    }
+    if hasattr(model, 'config'):
+        checkpoint['model_config'] = model.config
+    if normalizer is not None:
+        checkpoint['normalizer_state_dict'] = normalizer.state_dict()
+    if preprocessing is not None:
+        checkpoint['preprocessing'] = preprocessing
+    if loss_tracker is not None:
+        checkpoint['loss_tracker_state_dict'] = loss_tracker.state_dict()
+    return cpu_copy(checkpoint)
+
+def load_training_state(checkpoint, model, optimizer, scheduler, normalizer=None, loss_tracker=None, device="cpu"):
+    """
+    Restore a training checkpoint written by checkpoint_writer into the given objects.
+    The normalizer is usually restored earlier from load_checkpoint(), before the datasets are built.
+    Args:
+        checkpoint (str or dict): Checkpoint file, or a checkpoint read with load_checkpoint().
+        model, optimizer, scheduler: Objects built like in the interrupted run.
+        normalizer (normalization_manager, optional): Restored if given.
+        loss_tracker (loss_tracker, optional): Restored if given.
+        device (torch.device or str): Device the model lives on.
+    Returns:
+        dict: The resume point {'epoch', 'step', 'best_accuracy', 'progress'} to pass to train_loop().
+    """
+    if not isinstance(checkpoint, dict):
+        checkpoint = load_checkpoint(checkpoint, device)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+    scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+    if normalizer is not None and 'normalizer_state_dict' in checkpoint:
+        normalizer.load_state_dict(checkpoint['normalizer_state_dict'])
+    if loss_tracker is not None and 'loss_tracker_state_dict' in checkpoint:
+        loss_tracker.load_state_dict(checkpoint['loss_tracker_state_dict'])
+    set_rng_state(checkpoint['rng_state'])
+    resume = {key: checkpoint[key] for key in ('epoch', 'step', 'best_accuracy', 'progress')}
+
+    # Checkpoints are written by rank 0, so its partial sums and pending losses are only restored there
+    if not is_main_process():
+        resume['progress'] = None
+        if loss_tracker is not None:
+            loss_tracker.pending = []
+    return resume
+
+def load_checkpoint(path, device="cpu"):
+    """
+    Read a training checkpoint. It holds RNG states and NumPy arrays, so it is loaded with
+    weights_only=False; only resume from checkpoints you wrote yourself.
+    """
+    return torch.load(path, map_location=device, weights_only=False)
+
+def save_checkpoint(state, path):
+    """
+    Write a checkpoint to a temporary file, flush it to disk and rename it over the previous one,
+    so a crash during the write leaves the previous checkpoint intact.
+    """
+    path = Path(path)
+    tmp_path = path.with_suffix(f"{path.suffix}.tmp")
+    with open(tmp_path, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+#######################################################################################
+
+class checkpoint_writer:
+    """
+    Writes training checkpoints from a background thread.
+    save() copies the state to the CPU on the calling thread, which takes milliseconds for this
+    model, and hands the copy to the writer thread. The file is written to a temporary file,
+    flushed to disk and renamed over the previous checkpoint, so a crash during a write leaves the
+    previous checkpoint intact. At most one write is pending: if the writer is still busy, save()
+    waits for it instead of piling up copies. A checkpoint is due every `every_steps` training
+    steps or `every_seconds` seconds, whichever comes first.
+    """
+    def __init__(self, path="checkpoints/last.pt", every_steps=0, every_seconds=300):
+        """
+        Initializes and starts the writer.
+        Args:
+            path (str): Checkpoint file, overwritten by every save.
+            every_steps (int): Training steps between checkpoints, 0 to disable.
+            every_seconds (float): Seconds between checkpoints, 0 to disable.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.last_step = 0
+        self.last_time = time.monotonic()
+        self.error = None
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name="checkpoint_writer", daemon=True)
+        self.thread.start()
+
+    def due(self, global_step):
+        """
+        Return True if a checkpoint is due at this global training step.
+        """
+        if self.every_steps and global_step - self.last_step >= self.every_steps:
+            return True
+        return bool(self.every_seconds) and time.monotonic() - self.last_time >= self.every_seconds
+
+    def save(self, state, global_step=0):
+        """
+        Queue a checkpoint created by training_state() for writing.
+        Raises the error of a previous write, so a broken checkpoint path stops the run early.
+        """
+        if self.error is not None:
+            raise RuntimeError(f"Writing the checkpoint {self.path} failed.") from self.error
+        self.queue.put(state)
+        self.last_step = global_step
+        self.last_time = time.monotonic()
+
+    def flush(self):
+        """
+        Block until the queued checkpoint has been written.
+        """
+        self.queue.join()
+
+    def close(self):
+        """
+        Write the pending checkpoint and stop the writer.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Writing the checkpoint {self.path} failed.") from self.error
+
+    def run(self):
+        """
+        Writer loop: write every queued state atomically.
+        """
+        while True:
+            state = self.queue.get()
+            try:
+                if state is None:
+                    return
+                self.write(state)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def write(self, state):
+        """
+        Write a checkpoint atomically, see save_checkpoint().
+        """
+        save_checkpoint(state, self.path)
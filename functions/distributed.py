@@ -0,0 +1,140 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+import torch.distributed as dist
+from contextlib import contextmanager
+from datetime import timedelta
+from torch.nn.parallel import DistributedDataParallel
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Data-parallel training with torch.distributed. Every rank is a separate process with a replica
+of the model; the samplers give every rank its own shard of the pixels of an epoch, and
+DistributedDataParallel all-reduces the gradients after every backward pass. The ranks are
+started by torchrun, which sets RANK, WORLD_SIZE, LOCAL_RANK and LOCAL_WORLD_SIZE, on one or
+several nodes:
+
+    torchrun --nproc_per_node=8 scripts/train.py
+    torchrun --nnodes=2 --node_rank=0 --nproc_per_node=8 --master_addr=node0 --master_port=29500 scripts/train.py
+
+All helpers also work in a plain single-process run, where they do nothing.
+"""
+
+def init_distributed(backend="gloo", timeout=timedelta(hours=2)):
+    """
+    Join the process group described by the torchrun environment variables, if any, and split
+    the CPU cores of the node between its local ranks.
+    Args:
+        backend (str): "gloo" for CPU training, "nccl" for one GPU per rank.
+        timeout (timedelta): How long collectives and barriers wait for the other ranks. The
+            other ranks wait in main_process_first() while rank 0 fills the scene cache, which
+            takes far longer than the 30 minute default on a cold cache.
+    Returns:
+        bool: True if running with more than one rank.
+    """
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1:
+        return False
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend, timeout=timeout)
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return True
+
+def is_distributed():
+    """
+    Return True if a process group with more than one rank is initialized.
+    """
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+def get_rank():
+    """
+    Return the rank of this process, 0 without a process group.
+    """
+    return dist.get_rank() if is_distributed() else 0
+
+def get_world_size():
+    """
+    Return the number of ranks, 1 without a process group.
+    """
+    return dist.get_world_size() if is_distributed() else 1
+
+def get_local_rank():
+    """
+    Return the rank of this process within its node, 0 without a process group.
+    """
+    return int(os.environ.get("LOCAL_RANK", 0)) if is_distributed() else 0
+
+def is_main_process():
+    """
+    Return True on rank 0, which prints, logs and saves the models and checkpoints.
+    """
+    return get_rank() == 0
+
+def barrier():
+    """
+    Wait until every rank gets here.
+    """
+    if is_distributed():
+        dist.barrier()
+
+@contextmanager
+def main_process_first(local=False):
+    """
+    Run the body on rank 0 first and on the other ranks once it is done, e.g. to fill the scene
+    cache once instead of letting every rank parse the same scenes. Rank 0 reaches the barrier
+    even if the body raises, so the other ranks are released instead of waiting for the timeout.
+    Args:
+        local (bool): Run the body first on local rank 0 of every node, e.g. to fill a cache on
+            node-local disk, instead of on global rank 0 only.
+    """
+    first = (get_local_rank() if local else get_rank()) == 0
+    if not first:
+        barrier()
+    try:
+        yield
+    finally:
+        if first:
+            barrier()
+
+def all_reduce_sum(tensor):
+    """
+    Sum a tensor over all ranks, in place, and return it. gloo reduces CPU tensors, so device
+    tensors are reduced through a CPU copy.
+    """
+    if not is_distributed():
+        return tensor
+    if tensor.device.type == "cpu" or dist.get_backend() != "gloo":
+        dist.all_reduce(tensor)
+        return tensor
+    reduced = tensor.cpu()
+    dist.all_reduce(reduced)
+    return tensor.copy_(reduced)
+
+def wrap_model(model, device):
+    """
+    Wrap the model in DistributedDataParallel when running with several ranks.
+    """
+    if not is_distributed():
+        return model
+    device_ids = [device.index] if device.type == "cuda" else None
+    return DistributedDataParallel(model, device_ids=device_ids)
+
+def unwrap_model(model):
+    """
+    Return the model inside a DistributedDataParallel wrapper, or the model itself.
+    """
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+def cleanup_distributed():
+    """
+    Leave the process group at the end of training.
+    """
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
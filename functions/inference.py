@@ -0,0 +1,410 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import queue
+import threading
+from collections import OrderedDict
+from functions.processing import load_image, normalization_manager
+from models.cnn_1d import JustoLiuNet1D_torch, optimize_for_inference
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+def load_trained_model(checkpoint_path, device="cpu", normalizer_path=None,
+                       num_features=114, num_classes=3, kernel_size=6, starting_kernels=6):
+    """
+    Load a trained JustoLiuNet1D_torch and its fitted normalizer from a checkpoint written by save_model().
+    Args:
+        checkpoint_path (str): Path to the checkpoint.
+        device (torch.device or str): Device to load the model on.
+        normalizer_path (str, optional): File written by normalization_manager.save(), used when the
+            checkpoint does not contain the normalizer. Defaults to None.
+        num_features, num_classes, kernel_size, starting_kernels (int): Model architecture, only used
+            for checkpoints saved without a 'model_config'.
+    Returns:
+        model (torch.nn.Module): The model in evaluation mode.
+        normalizer (normalization_manager): The fitted normalizer.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location=device)
+
+    if 'model_config' in checkpoint:
+        model = JustoLiuNet1D_torch.from_config(checkpoint['model_config'])
+    else:
+        model = JustoLiuNet1D_torch(num_features=num_features, num_classes=num_classes,
+                                    kernel_size=kernel_size, starting_kernels=starting_kernels)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.to(device).eval()
+
+    if normalizer_path is not None:
+        normalizer = normalization_manager.load(normalizer_path)
+    elif 'normalizer_state_dict' in checkpoint:
+        normalizer = normalization_manager().load_state_dict(checkpoint['normalizer_state_dict'])
+    else:
+        raise ValueError(f"{checkpoint_path} has no normalizer, pass the fitted normalizer file.")
+
+    normalizer.min_vals = normalizer.min_vals.to(device)
+    normalizer.max_vals = normalizer.max_vals.to(device)
+
+    return model, normalizer
+
+def load_preprocessing(checkpoint_path):
+    """
+    Return the input preprocessing a model was trained with, stored by save_model().
+    Args:
+        checkpoint_path (str): Path to the checkpoint.
+    Returns:
+        dict: Keyword arguments for predict_scene(), e.g. {'bands': [...], 'bin_size': 2}. Empty for
+            checkpoints saved without preprocessing, which used the default cut_bands() range.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    return dict(checkpoint.get('preprocessing') or {})
+
+#######################################################################################
+
+class inference_engine:
+    """
+    Optimized CPU inference for raw spectra.
+    The model is wrapped by models.cnn_1d.optimize_for_inference(), the input and class buffers
+    are allocated once for the largest batch and reused for every batch, the raw uint16 counts are
+    converted and normalized in place in the input buffer, and every batch runs under
+    torch.inference_mode.
+    """
+    def __init__(self, model, normalizer, mode="fused", max_batch_size=2048, num_threads=None):
+        """
+        Initializes the engine.
+        Args:
+            model (JustoLiuNet1D_torch): Trained model on the CPU.
+            normalizer (normalization_manager): Fitted normalizer.
+            mode (str): "eager", "fused", "script" or "compile", see optimize_for_inference().
+            max_batch_size (int): Number of pixels per forward pass, size of the reused buffers.
+            num_threads (int, optional): Number of intra-op threads used by torch.
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.module = optimize_for_inference(model, mode)
+        self.num_classes = model.classifier.out_features
+        self.max_batch_size = max_batch_size
+
+        self.min_vals = normalizer.min_vals.detach().cpu().float()
+        self.inv_range = 1.0 / (normalizer.max_vals.detach().cpu().float() - self.min_vals + normalizer.epsilon)
+
+        num_features = self.min_vals.shape[0]
+        self.input_buffer = torch.empty((max_batch_size, 1, num_features), dtype=torch.float32)
+        self.class_buffer = torch.empty(max_batch_size, dtype=torch.long)
+
+    def predict(self, spectra, return_probabilities=False):
+        """
+        Classify raw spectra.
+        Args:
+            spectra (numpy.ndarray): Raw uint16 spectra of shape (pixels, bands).
+            return_probabilities (bool): Also return the softmax probabilities.
+        Returns:
+            numpy.ndarray: uint8 class indices of shape (pixels,), and float32 probabilities of shape
+                (pixels, classes) if return_probabilities is True.
+        """
+        classes = np.empty(spectra.shape[0], dtype=np.uint8)
+        probabilities = np.empty((spectra.shape[0], self.num_classes), dtype=np.float32) if return_probabilities else None
+
+        with torch.inference_mode():
+            for start in range(0, spectra.shape[0], self.max_batch_size):
+                chunk = spectra[start:start + self.max_batch_size]
+                n = chunk.shape[0]
+
+                x = self.input_buffer[:n]
+                x[:, 0].copy_(torch.from_numpy(chunk.astype(np.float32, copy=False)))
+                x.sub_(self.min_vals).mul_(self.inv_range)
+
+                output = self.module(x)
+                torch.argmax(output, dim=1, out=self.class_buffer[:n])
+                classes[start:start + n] = self.class_buffer[:n].numpy()
+
+                if return_probabilities:
+                    probabilities[start:start + n] = torch.softmax(output, dim=1).numpy()
+
+        if return_probabilities:
+            return classes, probabilities
+        return classes
+
+#######################################################################################
+
+def predict_pixels(model, normalizer, spectra, device="cpu", batch_size=2048, return_probabilities=False):
+    """
+    Classify raw spectra in batches without tracking gradients.
+    Args:
+        model (torch.nn.Module or inference_engine): Trained model in evaluation mode, or an optimized
+            inference_engine (which then uses its own normalizer and batch size).
+        normalizer (normalization_manager): Fitted normalizer.
+        spectra (numpy.ndarray): Raw uint16 spectra of shape (pixels, bands).
+        device (torch.device or str): Device the model is on.
+        batch_size (int): Number of pixels per forward pass.
+        return_probabilities (bool): Also return the softmax probabilities.
+    Returns:
+        numpy.ndarray: uint8 class indices of shape (pixels,), and float32 probabilities of shape
+            (pixels, classes) if return_probabilities is True.
+    """
+    if isinstance(model, inference_engine):
+        return model.predict(spectra, return_probabilities)
+
+    classes = np.empty(spectra.shape[0], dtype=np.uint8)
+    probabilities = None
+
+    with torch.inference_mode():
+        for start in range(0, spectra.shape[0], batch_size):
+            batch = torch.from_numpy(spectra[start:start + batch_size].astype(np.float32)).to(device)
+            batch = normalizer.transform(batch)
+            output = model(batch.unsqueeze(1))
+
+            classes[start:start + batch_size] = output.argmax(1).to(torch.uint8).cpu().numpy()
+
+            if return_probabilities:
+                if probabilities is None:
+                    probabilities = np.empty((spectra.shape[0], output.shape[1]), dtype=np.float32)
+                probabilities[start:start + batch_size] = torch.softmax(output, dim=1).cpu().numpy()
+
+    if return_probabilities:
+        return classes, probabilities
+    return classes
+
+#######################################################################################
+
+class spectrum_memo:
+    """
+    Inference with deduplication of identical spectra.
+    Saturated clouds, dark sea and fill regions contain many bit-identical uint16 spectra. Every
+    tile is reduced to its unique rows with np.unique, only those are classified, and the classes
+    are scattered back. A bounded LRU cache maps spectra to classes across tiles (and scenes), so
+    a spectrum repeated in an earlier tile is not classified again. A memo is tied to one model and
+    normalizer. It pays off when the dedup ratio is high; on noisy tiles with few duplicates the
+    np.unique call is pure overhead, so after such a tile the next few tiles skip deduplication.
+    """
+    def __init__(self, max_entries=100_000, max_unique_fraction=0.9, skip_tiles=4):
+        """
+        Initializes the memo.
+        Args:
+            max_entries (int): Maximum number of spectra kept in the LRU cache, 0 disables the cache
+                and only deduplicates within every tile.
+            max_unique_fraction (float): A tile whose unique spectra exceed this fraction of its
+                pixels is considered noisy.
+            skip_tiles (int): Number of tiles classified directly after a noisy tile.
+        """
+        self.max_entries = max_entries
+        self.max_unique_fraction = max_unique_fraction
+        self.skip_tiles = skip_tiles
+        self.cache = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the counters: pixels seen, unique spectra per tile (every pixel of a skipped tile
+        counts as unique), cache hits and classified spectra.
+        """
+        self.pixels = 0
+        self.unique = 0
+        self.hits = 0
+        self.computed = 0
+        self.skipping = 0
+
+    def dedup_ratio(self):
+        """
+        Return the number of pixels per spectrum that was actually classified.
+        """
+        return self.pixels / max(self.computed, 1)
+
+    def predict(self, model, normalizer, spectra, device="cpu", batch_size=2048, return_probabilities=False):
+        """
+        Classify raw spectra, running the model only on spectra that were not seen before.
+        Same arguments and return values as predict_pixels(). With return_probabilities the
+        spectra are deduplicated within the tile only, the cache holds classes.
+        """
+        spectra = np.ascontiguousarray(spectra)
+        if self.skipping > 0:
+            self.skipping -= 1
+            self.pixels += spectra.shape[0]
+            self.unique += spectra.shape[0]
+            self.computed += spectra.shape[0]
+            return predict_pixels(model, normalizer, spectra, device, batch_size, return_probabilities)
+
+        rows = spectra.view(np.dtype((np.void, spectra.dtype.itemsize * spectra.shape[1]))).ravel()
+        unique_rows, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        unique_spectra = spectra[first]
+        inverse = inverse.ravel()
+
+        self.pixels += spectra.shape[0]
+        self.unique += unique_rows.shape[0]
+        if unique_rows.shape[0] > self.max_unique_fraction * spectra.shape[0]:
+            self.skipping = self.skip_tiles
+
+        if return_probabilities or self.max_entries == 0:
+            self.computed += unique_rows.shape[0]
+            if return_probabilities:
+                classes, probabilities = predict_pixels(model, normalizer, unique_spectra, device, batch_size, True)
+                return classes[inverse], probabilities[inverse]
+            return predict_pixels(model, normalizer, unique_spectra, device, batch_size)[inverse]
+
+        # Only spectra repeated within the tile go through the cache: a spectrum seen once is
+        # unlikely to come back, and skipping it keeps the bookkeeping small on noisy tiles
+        classes = np.empty(unique_rows.shape[0], dtype=np.uint8)
+        repeated = np.flatnonzero(np.bincount(inverse, minlength=unique_rows.shape[0]) > 1)
+        keys = {i: unique_rows[i].tobytes() for i in repeated}
+        missing = np.ones(unique_rows.shape[0], dtype=bool)
+        for i, key in keys.items():
+            cached = self.cache.get(key)
+            if cached is not None:
+                classes[i] = cached
+                missing[i] = False
+                self.cache.move_to_end(key)
+        self.hits += len(keys) - int(missing[repeated].sum())
+
+        missing = np.flatnonzero(missing)
+        if missing.size:
+            classes[missing] = predict_pixels(model, normalizer, unique_spectra[missing], device, batch_size)
+            self.computed += missing.shape[0]
+            for i in repeated[np.isin(repeated, missing)]:
+                self.cache[keys[i]] = classes[i]
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+        return classes[inverse]
+
+#######################################################################################
+
+def predict_scene(image_path, model, normalizer, output_path=None, probabilities_path=None,
+                  HEIGHT=598, WIDTH=1092, BANDS=120, bands=None, tile_rows=64, batch_size=2048,
+                  num_threads=None, device="cpu", prefetch=2, bin_size=1, stride=1, memo=None):
+    """
+    Classify a full HYPSO scene into a (HEIGHT, WIDTH) Sea/Land/Cloud map, or a decimated
+    quick-look map if stride > 1.
+    The cube is streamed in tiles of `tile_rows` rows through the memory-mapped reader, so the
+    peak memory is bounded by the tile size and not by the scene size. The outputs are written
+    to .npy files through memmaps when paths are given.
+    Args:
+        image_path (str): Path to the .bip (/.bip@) file.
+        model (torch.nn.Module or inference_engine): Trained model in evaluation mode, or an
+            optimized inference_engine.
+        normalizer (normalization_manager): Fitted normalizer.
+        output_path (str, optional): .npy file for the uint8 class map. If None, the map is kept in memory.
+        probabilities_path (str, optional): .npy file for the float32 (HEIGHT, WIDTH, classes)
+            probabilities. If None, no probabilities are computed.
+        HEIGHT, WIDTH, BANDS (int): Dimensions of the raw cube.
+        bands (slice or list of int, optional): Bands fed to the model, see processing.load_image().
+        tile_rows (int): Number of rows read and classified at once.
+        batch_size (int): Number of pixels per forward pass.
+        num_threads (int, optional): Number of intra-op threads used by torch. Defaults to torch's setting.
+        device (torch.device or str): Device the model is on.
+        prefetch (int): Number of tiles read ahead by a background thread, so reading overlaps with
+            inference. 0 reads every tile when it is needed.
+        bin_size (int): Spectral binning, must match the preprocessing the model was trained with.
+        stride (int): Spatial stride, only every stride-th row and column is classified.
+        memo (spectrum_memo, optional): Deduplicate identical spectra, see spectrum_memo. Defaults to None.
+    Returns:
+        numpy.ndarray: uint8 class map of shape (ceil(HEIGHT / stride), ceil(WIDTH / stride)), class
+            indices in the training order (0 = Cloud, 1 = Land, 2 = Sea).
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    normalizer.check_preprocessing(bands, bin_size)
+    predict = memo.predict if memo is not None else predict_pixels
+
+    # Tiles start on the decimated grid
+    tile_rows = -(-tile_rows // stride) * stride
+    height, width = len(range(0, HEIGHT, stride)), len(range(0, WIDTH, stride))
+
+    if output_path is not None:
+        class_map = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=(height, width))
+    else:
+        class_map = np.empty((height, width), dtype=np.uint8)
+
+    probability_map = None
+    if probabilities_path is not None:
+        num_classes = model.num_classes if isinstance(model, inference_engine) else model.classifier.out_features
+        probability_map = np.lib.format.open_memmap(probabilities_path, mode='w+', dtype=np.float32,
+                                                    shape=(height, width, num_classes))
+
+    for row_start, _, tile in read_tiles(image_path, HEIGHT, WIDTH, BANDS, bands, tile_rows, prefetch,
+                                         bin_size, stride):
+        row_start, row_stop = row_start // stride, row_start // stride + tile.shape[0] // width
+        if probability_map is not None:
+            classes, probabilities = predict(model, normalizer, tile, device, batch_size,
+                                             return_probabilities=True)
+            probability_map[row_start:row_stop] = probabilities.reshape(row_stop - row_start, width, -1)
+        else:
+            classes = predict(model, normalizer, tile, device, batch_size)
+
+        class_map[row_start:row_stop] = classes.reshape(row_stop - row_start, width)
+
+    if output_path is not None:
+        class_map.flush()
+    if probability_map is not None:
+        probability_map.flush()
+
+    return class_map
+
+#######################################################################################
+
+def read_tiles(image_path, HEIGHT=598, WIDTH=1092, BANDS=120, bands=None, tile_rows=64, prefetch=2,
+               bin_size=1, stride=1):
+    """
+    Yield the row tiles of a scene as contiguous (pixels, bands) uint16 arrays.
+    With prefetch > 0 the tiles are read by a background thread into a bounded queue, so the
+    file reads overlap with the work done on the previous tiles. Reading from a memmap releases
+    the GIL, so the thread runs in parallel with torch.
+    Args:
+        image_path (str): Path to the .bip (/.bip@) file.
+        HEIGHT, WIDTH, BANDS (int): Dimensions of the raw cube.
+        bands (slice or list of int, optional): Bands to read, see processing.load_image().
+        tile_rows (int): Number of rows per tile.
+        prefetch (int): Maximum number of tiles read ahead.
+        bin_size, stride (int): Spectral binning and spatial stride, see processing.load_image().
+            tile_rows must be a multiple of stride.
+    Yields:
+        tuple: (row_start, row_stop, tile), the rows are rows of the full-resolution scene.
+    """
+    def read(row_start):
+        row_stop = min(row_start + tile_rows, HEIGHT)
+        tile = np.ascontiguousarray(load_image(image_path, HEIGHT, WIDTH, BANDS, bands=bands,
+                                               rows=(row_start, row_stop), bin_size=bin_size, stride=stride))
+        return row_start, row_stop, tile
+
+    if prefetch <= 0:
+        for row_start in range(0, HEIGHT, tile_rows):
+            yield read(row_start)
+        return
+
+    tiles = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for row_start in range(0, HEIGHT, tile_rows):
+                if stop.is_set():
+                    return
+                tiles.put(read(row_start))
+            tiles.put(None)
+        except Exception as error:
+            tiles.put(error)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = tiles.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the reader if it waits on a full queue
+        while thread.is_alive():
+            try:
+                tiles.get(timeout=0.1)
+            except queue.Empty:
+                pass
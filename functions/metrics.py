@@ -0,0 +1,143 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+class confusion_matrix_accumulator:
+    """
+    Streaming confusion matrix for multi-class classification.
+    Every batch is added with a single torch.bincount on the device where the predictions live,
+    so the cost of evaluation does not depend on Python list handling. Accuracy, per-class
+    precision/recall/F1 and the plotted matrix are all computed from the (N, N) count matrix,
+    where rows are the real labels and columns the predicted labels.
+    """
+    def __init__(self, num_classes, device="cpu"):
+        """
+        Initializes the accumulator.
+        Args:
+            num_classes (int): Number of classes.
+            device (torch.device or str): Device holding the count matrix, same as the predictions.
+        """
+        self.num_classes = num_classes
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        """
+        Set all counts to zero.
+        """
+        self.matrix = torch.zeros((self.num_classes, self.num_classes), dtype=torch.long, device=self.device)
+
+    def update(self, predictions, labels):
+        """
+        Add a batch of predictions to the counts. Labels outside [0, num_classes) are ignored.
+        Args:
+            predictions (torch.Tensor): Predicted class indices of shape (batch,).
+            labels (torch.Tensor): Real class indices of shape (batch,).
+        """
+        labels = labels.view(-1).long()
+        predictions = predictions.view(-1).long()
+        valid = (labels >= 0) & (labels < self.num_classes)
+        pairs = labels[valid] * self.num_classes + predictions[valid]
+        counts = torch.bincount(pairs, minlength=self.num_classes ** 2)
+        self.matrix += counts.view(self.num_classes, self.num_classes).to(self.matrix.device)
+
+    def compute(self):
+        """
+        Return the confusion matrix as a numpy array (one host sync).
+        """
+        return self.matrix.cpu().numpy()
+
+    def accuracy(self):
+        """
+        Return the overall accuracy as a fraction.
+        """
+        cm = self.compute()
+        return float(np.trace(cm) / max(cm.sum(), 1))
+
+    def present_labels(self):
+        """
+        Return the sorted class indices that occur as labels.
+        """
+        return np.flatnonzero(self.compute().sum(axis=1)).tolist()
+
+    def present_predictions(self):
+        """
+        Return the sorted class indices that occur as predictions.
+        """
+        return np.flatnonzero(self.compute().sum(axis=0)).tolist()
+
+    def classification_report(self, target_names, output_dict=False):
+        """
+        Build a classification report with the same layout as sklearn.metrics.classification_report.
+        Args:
+            target_names (list of str): Class names.
+            output_dict (bool): Return a dictionary instead of a formatted string.
+        Returns:
+            dict or str: Per-class precision, recall, F1 and support, accuracy, macro and weighted averages.
+        """
+        cm = self.compute().astype(np.float64)
+        true_positives = np.diag(cm)
+        support = cm.sum(axis=1)
+        predicted = cm.sum(axis=0)
+
+        precision = np.divide(true_positives, predicted, out=np.zeros_like(true_positives), where=predicted > 0)
+        recall = np.divide(true_positives, support, out=np.zeros_like(true_positives), where=support > 0)
+        denominator = precision + recall
+        f1 = np.divide(2 * precision * recall, denominator, out=np.zeros_like(true_positives), where=denominator > 0)
+
+        total = support.sum()
+        weights = support / total if total > 0 else np.zeros_like(support)
+
+        report = {}
+        for i, name in enumerate(target_names):
+            report[name] = {"precision": float(precision[i]), "recall": float(recall[i]),
+                            "f1-score": float(f1[i]), "support": int(support[i])}
+        report["accuracy"] = float(true_positives.sum() / total) if total > 0 else 0.0
+        report["macro avg"] = {"precision": float(precision.mean()), "recall": float(recall.mean()),
+                               "f1-score": float(f1.mean()), "support": int(total)}
+        report["weighted avg"] = {"precision": float((precision * weights).sum()),
+                                  "recall": float((recall * weights).sum()),
+                                  "f1-score": float((f1 * weights).sum()), "support": int(total)}
+
+        if output_dict:
+            return report
+        return format_classification_report(report, target_names)
+
+#######################################################################################
+
+def format_classification_report(report, target_names, digits=2):
+    """
+    Format a classification report dictionary as text, like sklearn.metrics.classification_report.
+    Args:
+        report (dict): Report created by confusion_matrix_accumulator.classification_report(output_dict=True).
+        target_names (list of str): Class names.
+        digits (int): Number of digits of the metrics.
+    Returns:
+        str: The formatted report.
+    """
+    width = max(len(name) for name in list(target_names) + ["weighted avg"])
+    headers = ["precision", "recall", "f1-score", "support"]
+    lines = [f"{'':>{width}} " + "".join(f" {h:>9}" for h in headers), ""]
+
+    def row(name, values):
+        return (f"{name:>{width}} " + "".join(f" {values[h]:>9.{digits}f}" for h in headers[:3])
+                + f" {values['support']:>9}")
+
+    for name in target_names:
+        lines.append(row(name, report[name]))
+    lines.append("")
+
+    support = report["macro avg"]["support"]
+    lines.append(f"{'accuracy':>{width}} " + f" {'':>9}" * 2 + f" {report['accuracy']:>9.{digits}f} {support:>9}")
+    for name in ["macro avg", "weighted avg"]:
+        lines.append(row(name, report[name]))
+
+    return "\n".join(lines) + "\n"
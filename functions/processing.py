@@ -3,43 +3,155 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
+from libraries.data_io import *
+from libraries.model import *
 
 #######################################################################################
 #######################################################################################
 #######################################################################################
 
-def load_image(image_path, HEIGHT=598, WIDTH=1092, BANDS=120):
+def open_cube(image_path, HEIGHT=598, WIDTH=1092, BANDS=120):
     """
-    Load a hyperspectral image from a .bip file and reshape it to (pixels, bands).
-    The image is reshaped to (bands, height, width) and then transposed to (height, width, bands).
-    The bands are then cut to remove the first 3 and last 117 bands.
+    Memory-map a raw HYPSO cube without reading it.
+    The file is stored band-sequential, so the returned np.memmap has the shape
+    (bands, height, width) and every band plane is a contiguous block on disk.
+    Slicing the memmap only touches the pages of the planes and rows that are used.
     """
-    with open(image_path, 'rb') as f:
-        image = cp.fromfile(f, dtype=cp.uint16)
-        image = cp.asnumpy(image)
-        image = image.reshape((BANDS, HEIGHT, WIDTH))
-        image = image.transpose((1, 2, 0))
-        image = image.reshape((-1, BANDS))
+    return np.memmap(image_path, dtype=np.uint16, mode='r', shape=(BANDS, HEIGHT, WIDTH))
+
+#######################################################################################
+
+def load_image(image_path, HEIGHT=598, WIDTH=1092, BANDS=120, bands=None, rows=None, bin_size=1, stride=1):
+    """
+    Load a hyperspectral image from a .bip file as a (pixels, bands) view.
+    The cube is memory-mapped as (bands, height, width) and only the selected band
+    planes and rows are read. By default the bands kept by cut_bands() are selected,
+    that is, the first 3 and last 3 bands are removed. Optionally, every bin_size adjacent
+    selected bands are averaged (spectral binning) and only every stride-th row and column
+    is read (spatial decimation for quick-looks).
+    Args:
+        image_path (str): Path to the .bip (/.bip@) file.
+        HEIGHT (int): Number of rows in the capture.
+        WIDTH (int): Number of columns in the capture.
+        BANDS (int): Number of bands stored in the file.
+        bands (slice or list of int, optional): Bands to keep, as absolute band indices.
+            Defaults to slice(3, 117).
+        rows (tuple of int, optional): Row window (start, stop) to read. Defaults to all rows.
+            With stride > 1, start should be a multiple of stride to stay on the decimated grid.
+        bin_size (int): Number of adjacent selected bands averaged into one, see bin_bands().
+        stride (int): Spatial step, every stride-th row and column is kept.
+    Returns:
+        numpy.ndarray: uint16 array of shape (pixels, bands). For contiguous band ranges without
+            binning this is a lazy view on the memmap; use np.ascontiguousarray() to materialize it.
+    """
+    cube = open_cube(image_path, HEIGHT, WIDTH, BANDS)
+
+    if bands is None:
+        bands = slice(3, 117)
+    bands = band_selector(bands)
+
+    row_start, row_stop = rows if rows is not None else (0, HEIGHT)
+
+    # Fancy indexing reads only the requested planes, slicing keeps a view
+    image = cube[bands, row_start:row_stop:stride, ::stride]
+    image = image.transpose((1, 2, 0))
+    image = image.reshape((-1, image.shape[2]))
+
+    if bin_size > 1:
+        image = bin_bands(image, bin_size)
 
-    image = cut_bands(image)
-    
     return image
 
+def bin_bands(image, bin_size):
+    """
+    Spectral binning: average every bin_size adjacent bands of a (pixels, bands) uint16 image.
+    The trailing bands that do not fill a whole bin are dropped. The mean is rounded to the
+    nearest integer, so the result stays uint16 like the raw counts.
+    Args:
+        image (numpy.ndarray): uint16 array of shape (pixels, bands).
+        bin_size (int): Number of bands per bin.
+    Returns:
+        numpy.ndarray: uint16 array of shape (pixels, bands // bin_size).
+    """
+    num_bins = image.shape[1] // bin_size
+    if num_bins == 0:
+        raise ValueError(f"Cannot bin {image.shape[1]} bands into bins of {bin_size}.")
+
+    binned = np.zeros((image.shape[0], num_bins), dtype=np.uint32)
+    for i in range(bin_size):
+        binned += image[:, i:num_bins * bin_size:bin_size]
+    return ((binned + bin_size // 2) // bin_size).astype(np.uint16)
+
+def band_indices(bands=None, BANDS=120):
+    """
+    Return a band subset as a list of absolute band indices.
+    Args:
+        bands (slice or list of int, optional): Bands, see load_image(). Defaults to slice(3, 117).
+        BANDS (int): Number of bands stored in the file.
+    Returns:
+        list of int: Absolute band indices.
+    """
+    if bands is None:
+        bands = slice(3, 117)
+    return np.arange(BANDS)[band_selector(bands)].tolist()
+
+def num_input_features(bands=None, bin_size=1, BANDS=120):
+    """
+    Return the number of features per pixel after band selection and spectral binning,
+    i.e. the num_features of a model trained on that preprocessing.
+    """
+    return len(band_indices(bands, BANDS)) // bin_size
+
 #######################################################################################
 
-def load_label(label_path, HEIGHT=598, WIDTH=1092):
+def band_selector(bands):
+    """
+    Turn a band subset into the cheapest index for a (bands, height, width) memmap.
+    Sorted, evenly spaced band lists are turned into slices so that indexing stays a view.
+    Args:
+        bands (slice or list of int): Absolute band indices.
+    Returns:
+        slice or numpy.ndarray: Index for the band axis.
+    """
+    if isinstance(bands, slice):
+        return bands
+
+    bands = np.asarray(bands, dtype=np.int64)
+    if bands.ndim != 1 or bands.size == 0:
+        raise ValueError("bands must be a non-empty 1D list of band indices.")
+
+    if bands.size == 1:
+        return slice(int(bands[0]), int(bands[0]) + 1)
+
+    steps = np.diff(bands)
+    if steps[0] > 0 and np.all(steps == steps[0]):
+        return slice(int(bands[0]), int(bands[-1]) + 1, int(steps[0]))
+
+    return bands
+
+#######################################################################################
+
+def load_label(label_path, HEIGHT=598, WIDTH=1092, stride=1):
     """
     Load a label file and reshape it to (pixels,).
-    The label is reshaped to (height, width) and then flattened.
-    The labels are then adjusted to start from 0.
+    The label is reshaped to (height, width), decimated like load_image() if stride > 1,
+    and then flattened. The labels are then adjusted to start from 0.
     """
     label = np.fromfile(label_path, dtype=np.uint8)
-    label = label.reshape((HEIGHT, WIDTH))
+    label = label.reshape((HEIGHT, WIDTH))[::stride, ::stride]
     label = label - 1
     label = label.flatten()
     return label
 
+def label_histogram(label_path, HEIGHT=598, WIDTH=1092, stride=1):
+    """
+    Count every label value of a label file with np.bincount on the uint8 array.
+    Returns:
+        numpy.ndarray: int64 counts of shape (256,) indexed by the label returned by load_label(),
+            so unlabeled pixels (0 in the file) are counted at 255.
+    """
+    return np.bincount(load_label(label_path, HEIGHT, WIDTH, stride), minlength=256)
+
 #######################################################################################
 
 def global_min_max_normalization(images, verbose=False):
@@ -117,8 +229,11 @@ class normalization_manager:
     """
     A class to manage the normalization of hyperspectral images using min-max normalization.
     The normalization is done per band across all pixels in the dataset.
-    The class provides methods to fit the normalization parameters, transform the images,
-    verify the normalization, and check the normalization of the first 10 pixels.
+    The class provides methods to fit the normalization parameters (at once or chunk by chunk),
+    transform the images, save and load the fitted parameters, verify the normalization,
+    and check the normalization of the first 10 pixels. The spectral preprocessing the
+    parameters were fitted on (band subset and binning) is recorded, so it can be checked
+    against the preprocessing of the data that is later normalized.
     """
     def __init__(self, epsilon=1e-8):
         """
@@ -127,16 +242,146 @@ class normalization_manager:
         self.min_vals = None
         self.max_vals = None
         self.epsilon = epsilon
+        self.n_samples_seen = 0
+        self.preprocessing = None
 
     def fit(self, images):
         """
         Fit the normalization parameters (min and max values) from the training data.
         The min and max values are calculated separately for each spectral band across all pixels.
+        The images can be a float tensor or a raw uint16 numpy array of shape (pixels, bands).
         """
-        self.min_vals = images.min(dim=0).values
-        self.max_vals = images.max(dim=0).values
+        self.reset()
+        self.partial_fit(images)
         print(colored("Fitted normalization parameters from training data.", "green"))
 
+    def partial_fit(self, images):
+        """
+        Update the normalization parameters with one chunk of the training data, e.g. one scene
+        or one tile. Calling partial_fit() on every chunk gives the same result as fit() on
+        the concatenation of all chunks.
+        Args:
+            images (torch.Tensor or numpy.ndarray): Chunk of shape (pixels, bands).
+        Returns:
+            normalization_manager: self.
+        """
+        if images.shape[0] == 0:
+            return self
+
+        if isinstance(images, np.ndarray):
+            # Compact uint16 storage, the per-band extrema are exact in float32
+            chunk_min = torch.from_numpy(images.min(axis=0).astype(np.float32))
+            chunk_max = torch.from_numpy(images.max(axis=0).astype(np.float32))
+        else:
+            chunk_min = images.min(dim=0).values
+            chunk_max = images.max(dim=0).values
+
+        return self.partial_fit_stats(chunk_min, chunk_max, images.shape[0])
+
+    def partial_fit_stats(self, chunk_min, chunk_max, n_samples=0):
+        """
+        Update the normalization parameters from precomputed per-band statistics of a chunk,
+        so cached per-scene statistics can be merged without touching the pixels again.
+        Args:
+            chunk_min (torch.Tensor or numpy.ndarray): Per-band minimum of the chunk.
+            chunk_max (torch.Tensor or numpy.ndarray): Per-band maximum of the chunk.
+            n_samples (int, optional): Number of pixels in the chunk. Defaults to 0.
+        Returns:
+            normalization_manager: self.
+        """
+        chunk_min = torch.as_tensor(chunk_min, dtype=torch.float32)
+        chunk_max = torch.as_tensor(chunk_max, dtype=torch.float32)
+
+        if self.min_vals is None:
+            self.min_vals = chunk_min.clone()
+            self.max_vals = chunk_max.clone()
+        else:
+            if chunk_min.shape != self.min_vals.shape:
+                raise ValueError(f"Chunk has {chunk_min.shape[0]} bands, expected {self.min_vals.shape[0]}.")
+            self.min_vals = torch.minimum(self.min_vals, chunk_min.to(self.min_vals.device))
+            self.max_vals = torch.maximum(self.max_vals, chunk_max.to(self.max_vals.device))
+
+        self.n_samples_seen += int(n_samples)
+        return self
+
+    def reset(self):
+        """
+        Forget the fitted normalization parameters.
+        """
+        self.min_vals = None
+        self.max_vals = None
+        self.n_samples_seen = 0
+        self.preprocessing = None
+
+    def set_preprocessing(self, bands=None, bin_size=1):
+        """
+        Record the spectral preprocessing (see load_image()) of the data the parameters are fitted on.
+        Returns:
+            normalization_manager: self.
+        """
+        self.preprocessing = {'bands': band_indices(bands), 'bin_size': int(bin_size)}
+        return self
+
+    def check_preprocessing(self, bands=None, bin_size=1):
+        """
+        Check that data loaded with the given spectral preprocessing can be normalized with the
+        fitted parameters: the recorded preprocessing (if any) must be the same, and the number
+        of features must match the number of fitted bands.
+        Raises:
+            ValueError: If the preprocessing does not match.
+        """
+        expected = {'bands': band_indices(bands), 'bin_size': int(bin_size)}
+        if self.preprocessing is not None and self.preprocessing != expected:
+            def describe(preprocessing):
+                bands = preprocessing['bands']
+                return f"{len(bands)} bands ({bands[0]}..{bands[-1]}) with bin size {preprocessing['bin_size']}"
+            raise ValueError(f"The normalizer was fitted on {describe(self.preprocessing)}, "
+                             f"got {describe(expected)}.")
+        num_features = len(expected['bands']) // expected['bin_size']
+        if self.min_vals is not None and self.min_vals.shape[0] != num_features:
+            raise ValueError(f"The normalizer has {self.min_vals.shape[0]} bands, the preprocessing gives {num_features}.")
+        return self
+
+    def state_dict(self):
+        """
+        Return the fitted normalization parameters as a dictionary that can be stored with torch.save,
+        e.g. alongside the model checkpoint.
+        """
+        if self.min_vals is None or self.max_vals is None:
+            raise ValueError("NormalizationManager not fitted. Call fit(images) first.")
+        return {
+            'min_vals': self.min_vals.detach().cpu(),
+            'max_vals': self.max_vals.detach().cpu(),
+            'epsilon': self.epsilon,
+            'n_samples_seen': self.n_samples_seen,
+            'preprocessing': self.preprocessing,
+        }
+
+    def load_state_dict(self, state_dict):
+        """
+        Restore the normalization parameters from a dictionary created by state_dict().
+        """
+        self.min_vals = torch.as_tensor(state_dict['min_vals'], dtype=torch.float32)
+        self.max_vals = torch.as_tensor(state_dict['max_vals'], dtype=torch.float32)
+        self.epsilon = state_dict.get('epsilon', self.epsilon)
+        self.n_samples_seen = state_dict.get('n_samples_seen', 0)
+        self.preprocessing = state_dict.get('preprocessing')
+        return self
+
+    def save(self, path):
+        """
+        Save the fitted normalization parameters to a file.
+        """
+        torch.save(self.state_dict(), path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Create a normalization manager from a file written by save().
+        """
+        state_dict = torch.load(path, map_location="cpu")
+        return cls(epsilon=state_dict.get('epsilon', 1e-8)).load_state_dict(state_dict)
+
     def transform(self, images, verify=False, verbose=False):
         """
         Normalize the images using the fitted min and max values.
@@ -0,0 +1,279 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import hashlib
+import json
+import threading
+from functions.processing import load_image, load_label, label_histogram
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+class scene_cache:
+    """
+    A persistent on-disk cache of preprocessed HYPSO scenes.
+    Every scene is stored once as a uint16 (pixels, bands) .npy file and every label file as a
+    uint8 (pixels,) .npy file, so later runs can memory-map them instead of parsing the raw
+    .bip/.dat files again. Entries are keyed by the content hash of the source file and the
+    preprocessing parameters (band selection, binning, stride and HEIGHT/WIDTH/BANDS), and the cache is kept
+    below a size limit by evicting the least recently used entries.
+    """
+    def __init__(self, cache_dir="cache/scenes", max_bytes=100 * 1024**3):
+        """
+        Initializes the scene cache.
+        Args:
+            cache_dir (str): Directory where the cached arrays are stored.
+            max_bytes (int): Maximum total size of the cached arrays and their sidecars in bytes.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hash_index_path = self.cache_dir / "hashes.json"
+        self.hash_index = self.read_hash_index()
+        self.hash_index_lock = threading.Lock() # Files may be hashed from several threads
+        self.sidecar_suffixes = (".stats.npz", ".hist.npz") # Written next to an entry, deleted with it
+        self.pinned = {} # Entries in use by this process, never evicted, absolute path -> bytes
+
+    #######################################################################################
+
+    def load_image(self, image_path, HEIGHT=598, WIDTH=1092, BANDS=120, bands=None, bin_size=1, stride=1):
+        """
+        Return the preprocessed (pixels, bands) uint16 array of a scene, memory-mapped from the cache.
+        The scene is read with processing.load_image() and stored on a cache miss.
+        Args:
+            image_path (str): Path to the .bip (/.bip@) file.
+            HEIGHT, WIDTH, BANDS (int): Dimensions of the raw cube.
+            bands (slice or list of int, optional): Bands to keep, see processing.load_image().
+            bin_size, stride (int): Spectral binning and spatial stride, see processing.load_image().
+        Returns:
+            numpy.memmap: Read-only array of shape (pixels, bands).
+        """
+        key = self.image_key(image_path, HEIGHT, WIDTH, BANDS, bands, bin_size, stride)
+        return self.get_or_create(key, lambda: load_image(image_path, HEIGHT, WIDTH, BANDS, bands=bands,
+                                                          bin_size=bin_size, stride=stride))
+
+    def load_label(self, label_path, HEIGHT=598, WIDTH=1092, stride=1):
+        """
+        Return the preprocessed (pixels,) uint8 labels of a scene, memory-mapped from the cache.
+        The labels are read with processing.load_label() and stored on a cache miss.
+        """
+        key = self.label_key(label_path, HEIGHT, WIDTH, stride)
+        return self.get_or_create(key, lambda: load_label(label_path, HEIGHT, WIDTH, stride))
+
+    def label_histogram(self, label_path, HEIGHT=598, WIDTH=1092, stride=1):
+        """
+        Return the label value counts of a label file, see processing.label_histogram().
+        The counts are stored next to the cached labels, so class weights and dataset statistics
+        are answered without reading the label file again.
+        Returns:
+            numpy.ndarray: int64 counts of shape (256,).
+        """
+        hist_path = self.cache_dir / f"{self.label_key(label_path, HEIGHT, WIDTH, stride)}.hist.npz"
+
+        if not hist_path.exists():
+            tmp_path = self.tmp_path(hist_path)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, counts=label_histogram(label_path, HEIGHT, WIDTH, stride))
+            os.replace(tmp_path, hist_path)
+
+        return np.load(hist_path)['counts']
+
+    def image_stats(self, image_path, HEIGHT=598, WIDTH=1092, BANDS=120, bands=None, bin_size=1, stride=1):
+        """
+        Return the per-band minimum, maximum and pixel count of a cached scene.
+        The statistics are stored next to the scene, so a normalizer can be fitted with
+        normalization_manager.partial_fit_stats() without reading the pixels again.
+        Returns:
+            tuple: (min_vals, max_vals, n_pixels), the first two as float32 numpy arrays.
+        """
+        key = self.image_key(image_path, HEIGHT, WIDTH, BANDS, bands, bin_size, stride)
+        stats_path = self.cache_dir / f"{key}.stats.npz"
+
+        if not stats_path.exists():
+            image = self.load_image(image_path, HEIGHT, WIDTH, BANDS, bands, bin_size, stride)
+            tmp_path = self.tmp_path(stats_path)
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, min_vals=image.min(axis=0).astype(np.float32),
+                         max_vals=image.max(axis=0).astype(np.float32),
+                         n_pixels=np.int64(image.shape[0]))
+            os.replace(tmp_path, stats_path)
+
+        stats = np.load(stats_path)
+        return stats['min_vals'], stats['max_vals'], int(stats['n_pixels'])
+
+    #######################################################################################
+
+    def image_key(self, image_path, HEIGHT, WIDTH, BANDS, bands, bin_size=1, stride=1):
+        """
+        Build the cache key of a scene from its content hash and the preprocessing parameters.
+        Binning and stride are only part of the key when they are used, so existing entries stay valid.
+        """
+        if bands is None:
+            bands = slice(3, 117)
+        band_ids = np.arange(BANDS)[bands]
+        band_digest = hashlib.blake2b(band_ids.astype(np.int64).tobytes(), digest_size=6).hexdigest()
+        key = f"image_{self.file_hash(image_path)}_{HEIGHT}x{WIDTH}x{BANDS}_b{band_digest}"
+        if bin_size != 1 or stride != 1:
+            key += f"_k{bin_size}s{stride}"
+        return key
+
+    def label_key(self, label_path, HEIGHT, WIDTH, stride=1):
+        """
+        Build the cache key of a label file from its content hash, its shape and the stride.
+        """
+        return f"label_{self.file_hash(label_path)}_{HEIGHT}x{WIDTH}" + (f"_s{stride}" if stride != 1 else "")
+
+    def file_hash(self, path):
+        """
+        Return the content hash of a file. Hashes are remembered by (path, size, mtime),
+        so an unchanged file is only hashed once.
+        """
+        stat = os.stat(path)
+        index_key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+        if index_key not in self.hash_index:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 24), b""):
+                    digest.update(chunk)
+            with self.hash_index_lock:
+                self.hash_index[index_key] = digest.hexdigest()
+                self.write_hash_index()
+
+        return self.hash_index[index_key]
+
+    def get_or_create(self, key, build_fn):
+        """
+        Memory-map the cache entry of a key, creating it with build_fn() on a miss.
+        Entries are written to a temporary file first and renamed, so an interrupted
+        write never leaves a corrupt entry behind.
+        """
+        path = self.cache_dir / f"{key}.npy"
+
+        if path.exists():
+            os.utime(path) # Mark as recently used
+        else:
+            array = np.ascontiguousarray(build_fn())
+            tmp_path = self.tmp_path(path)
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+            del array
+            self.evict(keep=path)
+
+        return np.load(path, mmap_mode='r')
+
+    def pin(self, array):
+        """
+        Protect the entry of a memory-mapped array returned by load_image()/load_label() from eviction,
+        e.g. while a dataset indexes its scenes or its workers reopen them by path.
+        Raises:
+            ValueError: If the pinned entries alone do not fit into max_bytes.
+        """
+        path = os.path.abspath(array.filename)
+        self.pinned[path] = os.path.getsize(path)
+        pinned_bytes = sum(self.pinned.values())
+        if pinned_bytes > self.max_bytes:
+            raise ValueError(f"The cached scenes in use need {pinned_bytes / 1024**3:.2f} GB, more than the cache "
+                             f"limit of {self.max_bytes / 1024**3:.2f} GB. Raise max_bytes of the scene_cache.")
+
+    def evict(self, keep=None):
+        """
+        Delete the least recently used entries, with their .stats.npz/.hist.npz sidecars, until the
+        cache is below max_bytes, and drop the remembered hashes of files that no longer exist.
+        Args:
+            keep (Path, optional): Entry that must not be evicted, e.g. the one just written.
+                Pinned entries are never evicted either.
+        """
+        entries = [(p.stat().st_mtime, self.entry_size(p), p) for p in self.cache_dir.glob("*.npy")]
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if (keep is not None and path == keep) or os.path.abspath(path) in self.pinned:
+                continue
+            for sidecar in self.sidecars(path):
+                sidecar.unlink(missing_ok=True)
+            path.unlink(missing_ok=True)
+            total -= size
+
+        self.prune_hash_index()
+
+    def prune_hash_index(self):
+        """
+        Drop the remembered hashes of source files that were deleted or changed since they were hashed.
+        """
+        with self.hash_index_lock:
+            stale = []
+            for index_key in self.hash_index:
+                path, size, mtime_ns = index_key.rsplit("|", 2)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    stale.append(index_key)
+                    continue
+                if f"{stat.st_size}|{stat.st_mtime_ns}" != f"{size}|{mtime_ns}":
+                    stale.append(index_key)
+            for index_key in stale:
+                del self.hash_index[index_key]
+            if stale:
+                self.write_hash_index()
+
+    def sidecars(self, path):
+        """
+        Return the paths of the .stats.npz/.hist.npz files written next to the entry at path.
+        """
+        return [Path(str(path)[:-len(".npy")] + suffix) for suffix in self.sidecar_suffixes]
+
+    def entry_size(self, path):
+        """
+        Return the size of an entry in bytes, including its sidecars, which are evicted with it.
+        """
+        size = path.stat().st_size
+        for sidecar in self.sidecars(path):
+            try:
+                size += sidecar.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def size(self):
+        """
+        Return the total size of the cached arrays and their sidecars in bytes.
+        """
+        return sum(self.entry_size(p) for p in self.cache_dir.glob("*.npy"))
+
+    def tmp_path(self, path):
+        """
+        Return a temporary path next to path, unique per process and thread, for atomic writes.
+        """
+        return Path(path).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+    #######################################################################################
+
+    def read_hash_index(self):
+        """
+        Read the remembered file hashes from disk.
+        """
+        if self.hash_index_path.exists():
+            try:
+                with open(self.hash_index_path, 'r') as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+
+    def write_hash_index(self):
+        """
+        Write the remembered file hashes to disk atomically.
+        """
+        tmp_path = self.tmp_path(self.hash_index_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(self.hash_index, f)
+        os.replace(tmp_path, self.hash_index_path)
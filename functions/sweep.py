@@ -0,0 +1,351 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'scripts')))
+
+from libraries.data_io import *
+from libraries.training import *
+from libraries.tracking import *
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from samplers import permutation_batch_sampler
+from functions.checkpointing import training_state, load_training_state, save_checkpoint
+from functions.inference import inference_engine
+from functions.metrics import confusion_matrix_accumulator
+from functions.tracking import mlflow_backend, file_backend
+from functions.train_functions import train_subloop, eval_subloop, FocalLoss
+from models.cnn_1d import JustoLiuNet1D_torch, max_stages, macs_per_pixel
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Parallel hyperparameter sweeps with successive halving. The datasets are built once in the parent
+process from the scene cache and sent to a pool of worker processes as file paths; every worker
+memory-maps the same cached scenes, so all trials share one copy of the data in the OS page cache.
+Every worker caps its torch threads. Trials run in rungs: all trials train on a small pixel
+budget (a fraction of an epoch), the best 1/eta continue with eta times the budget, and so on, so
+weak configurations are stopped early. Trials continue from their state file between rungs. At the
+end, the inference cost of every trial is measured and the trials are ranked in a Pareto table of
+validation accuracy against cost.
+"""
+
+# Datasets, evaluation subset and settings of the current worker process, set once by init_sweep_worker()
+worker_state = {}
+
+#######################################################################################
+
+def sample_trials(search_space, num_trials=None, seed=0):
+    """
+    Draw trial configs from a grid.
+    Args:
+        search_space (dict): Values of every hyperparameter, e.g. {'lr': [1e-3, 3e-3], 'batch_size': [128, 512]}.
+        num_trials (int, optional): Number of configs drawn without replacement. Defaults to the whole grid.
+        seed (int): Seed of the draw.
+    Returns:
+        list of dict: One config per trial.
+    """
+    keys = list(search_space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(search_space[key] for key in keys))]
+    if num_trials is None or num_trials >= len(grid):
+        return grid
+    chosen = np.random.default_rng(seed).choice(len(grid), size=num_trials, replace=False)
+    return [grid[i] for i in sorted(chosen)]
+
+def rung_budgets(min_fraction, max_fraction, eta=3):
+    """
+    Return the cumulative training budgets of the rungs in epochs, min_fraction * eta**r up to max_fraction.
+    """
+    budgets = [min_fraction]
+    while budgets[-1] * eta < max_fraction:
+        budgets.append(budgets[-1] * eta)
+    if budgets[-1] < max_fraction:
+        budgets.append(max_fraction)
+    return budgets
+
+def pareto_front(rows, maximize="val_accuracy", minimize="us_per_pixel"):
+    """
+    Mark the rows that no other row beats in both objectives.
+    Returns:
+        list of bool: True for the rows on the Pareto front.
+    """
+    front = []
+    for row in rows:
+        dominated = any(other[maximize] >= row[maximize] and other[minimize] <= row[minimize]
+                        and (other[maximize] > row[maximize] or other[minimize] < row[minimize]) for other in rows)
+        front.append(not dominated)
+    return front
+
+#######################################################################################
+
+def init_sweep_worker(train_dataset, eval_dataset, eval_indices, class_weights, trial_dir, threads_per_trial,
+                      eval_batch_size=8192):
+    """
+    Initialize a worker process: cap the torch threads and keep the datasets, which reopen their
+    memory-mapped scenes on first use.
+    """
+    torch.set_num_threads(threads_per_trial)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    worker_state['train_dataset'] = train_dataset
+    worker_state['eval_dataset'] = eval_dataset
+    worker_state['eval_indices'] = eval_indices
+    worker_state['eval_batches'] = np.array_split(eval_indices, max(1, -(-len(eval_indices) // eval_batch_size)))
+    worker_state['class_weights'] = class_weights
+    worker_state['trial_dir'] = trial_dir
+
+def build_trial(trial_id, config):
+    """
+    Build the model, optimizer, scheduler and loss of a trial, like scripts/train.py does.
+    """
+    num_features = worker_state['train_dataset'].normalizer.min_vals.shape[0]
+    torch.manual_seed(trial_id)
+    model = JustoLiuNet1D_torch(num_features=num_features, num_classes=3, kernel_size=config['kernel_size'],
+                                starting_kernels=config['starting_kernels'],
+                                num_stages=max_stages(num_features, config['kernel_size']))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=config['lr'], weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.5)
+    if config['loss'] == "focal":
+        criterion = FocalLoss(alpha=worker_state['class_weights'], gamma=2)
+    else:
+        criterion = nn.CrossEntropyLoss(label_smoothing=config['label_smoothing'])
+    return model, optimizer, scheduler, criterion
+
+def trial_path(trial_id):
+    """
+    Return the state file of a trial.
+    """
+    return os.path.join(worker_state['trial_dir'], f"trial_{trial_id}.pt")
+
+def run_trial(trial_id, config, epochs):
+    """
+    Train a trial up to a cumulative budget of `epochs` epochs (fractions allowed), continuing
+    from its state file, then evaluate it on the evaluation subset and save its state.
+    Returns:
+        dict: Metrics of the trial at this budget.
+    """
+    start = time.perf_counter()
+    model, optimizer, scheduler, criterion = build_trial(trial_id, config)
+    epoch, step = 0, 0
+    if os.path.exists(trial_path(trial_id)):
+        resume = load_training_state(trial_path(trial_id), model, optimizer, scheduler)
+        epoch, step = resume['epoch'], resume['step']
+
+    train_dataset = worker_state['train_dataset']
+    sampler = permutation_batch_sampler(len(train_dataset), config['batch_size'], shuffle=True, seed=trial_id)
+    loader = DataLoader(train_dataset, batch_sampler=sampler, collate_fn=train_dataset.collate_fn)
+    steps_per_epoch = len(sampler)
+    target = int(np.ceil(epochs * steps_per_epoch))
+    rung_steps = target - (epoch * steps_per_epoch + step)
+
+    # The rung may span several epoch chunks, the partial sums are carried over so the train
+    # metrics cover the whole rung and not only its last chunk
+    def keep_sums(step, loss_sum, correct, total):
+        sums.update({'loss_sum': loss_sum, 'correct': correct, 'total': total})
+
+    model.train()
+    sums = {}
+    train_accuracy, train_loss = 0.0, 0.0
+    while epoch * steps_per_epoch + step < target:
+        num_steps = min(target - epoch * steps_per_epoch - step, steps_per_epoch - step)
+        sampler.set_epoch(epoch, step)
+        progress = {'loss_sum': float(sums['loss_sum']), 'correct': int(sums['correct']),
+                    'total': sums['total']} if sums else None
+        train_accuracy, train_loss = train_subloop(itertools.islice(loader, num_steps), model, criterion,
+                                                   optimizer, "cpu", progress=progress, on_step=keep_sums)
+        step += num_steps
+        if step == steps_per_epoch:
+            epoch, step = epoch + 1, 0
+            scheduler.step()
+
+    model.eval()
+    eval_dataset = worker_state['eval_dataset']
+    eval_loader = DataLoader(eval_dataset, batch_sampler=worker_state['eval_batches'], collate_fn=eval_dataset.collate_fn)
+    with torch.no_grad():
+        metrics, val_loss = eval_subloop(eval_loader, model, criterion, "cpu", confusion_matrix_accumulator(3),
+                                         progress=False)
+
+    save_checkpoint(training_state(model, optimizer, scheduler, epoch, step, metrics.accuracy()), trial_path(trial_id))
+
+    report = metrics.classification_report(["Cloud", "Land", "Sea"], output_dict=True)
+    return {
+        'trial': trial_id,
+        'pixels': (epoch * steps_per_epoch + step) * config['batch_size'],
+        'train_accuracy': train_accuracy / 100,
+        'train_loss': train_loss / max(rung_steps, 1), # Sum of batch means -> mean per pixel, comparable across batch sizes
+        'val_accuracy': metrics.accuracy(),
+        'val_recall': report['macro avg']['recall'],
+        'val_loss': val_loss,
+        'seconds': time.perf_counter() - start
+    }
+
+def trial_cost(trial_id, config, num_pixels=65536, repeats=3):
+    """
+    Measure the inference cost of a trial's model with the fused CPU inference engine, on raw
+    spectra of the evaluation set and the thread limit of the worker.
+    Returns:
+        dict: Parameters, multiply-accumulates per pixel and the best latency in microseconds per pixel.
+    """
+    model, _, _, _ = build_trial(trial_id, config)
+    model.load_state_dict(torch.load(trial_path(trial_id), map_location="cpu", weights_only=False)['model_state_dict'])
+    model.eval()
+
+    eval_dataset = worker_state['eval_dataset']
+    spectra, _ = eval_dataset.__getitems__(worker_state['eval_indices'][:num_pixels])
+    engine = inference_engine(model, eval_dataset.normalizer, "fused")
+    engine.predict(spectra)
+
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine.predict(spectra)
+        seconds.append(time.perf_counter() - start)
+
+    return {
+        'trial': trial_id,
+        'params': sum(p.numel() for p in model.parameters()),
+        'macs_per_pixel': macs_per_pixel(model.config),
+        'us_per_pixel': min(seconds) / len(spectra) * 1e6
+    }
+
+#######################################################################################
+
+def trial_backends(trials, tracking_dir=None):
+    """
+    Create one tracking backend per trial: a child run of the active MLflow run, or a
+    subdirectory of tracking_dir with the file backend. The config is logged as the params.
+    The child runs are created with MlflowClient and stay RUNNING until run_sweep() ends them,
+    when the trial finishes, fails or is stopped by the halving.
+    """
+    if tracking_dir is None:
+        client = mlflow.tracking.MlflowClient()
+        parent = mlflow.active_run()
+    backends = []
+    for trial_id, config in enumerate(trials):
+        if tracking_dir is None:
+            run = client.create_run(parent.info.experiment_id, run_name=f"trial_{trial_id}",
+                                    tags={"mlflow.parentRunId": parent.info.run_id})
+            backend = mlflow_backend(run.info.run_id)
+        else:
+            backend = file_backend(os.path.join(tracking_dir, f"trial_{trial_id}"))
+        backend.log_batch([], config)
+        backends.append(backend)
+    return backends
+
+def run_sweep(trials, train_dataset, eval_dataset, class_weights, output_dir="sweeps/sweep", num_workers=4,
+              threads_per_trial=2, min_fraction=0.1, max_fraction=3.0, eta=3, eval_pixels=200_000,
+              tracking_dir=None):
+    """
+    Run a sweep with successive halving in a pool of worker processes.
+    Args:
+        trials (list of dict): Trial configs with kernel_size, starting_kernels, lr, label_smoothing,
+            loss ("cross_entropy" or "focal") and batch_size, see sample_trials().
+        train_dataset, eval_dataset (lazy_hyperspectral_dataset): Datasets built once from the scene cache.
+        class_weights (torch.Tensor): Class weights of the focal loss, see get_class_weights().
+        output_dir (str): Directory for the trial state files and pareto.csv.
+        num_workers (int): Trials trained at the same time.
+        threads_per_trial (int): Intra-op torch threads per worker.
+        min_fraction (float): Training budget of the first rung, in epochs.
+        max_fraction (float): Training budget of the last rung, in epochs.
+        eta (int): Budget factor between rungs; the best 1/eta of the trials continue.
+        eval_pixels (int): Size of the fixed random evaluation subset.
+        tracking_dir (str, optional): Log with the file backend here instead of as nested MLflow runs.
+    Returns:
+        list of dict: One row per trial, with its config, last metrics, cost and Pareto flag.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for path in Path(output_dir).glob("trial_*.pt"): # States of a previous sweep, trials would continue from them
+        path.unlink()
+    eval_indices = np.sort(np.random.default_rng(0).choice(len(eval_dataset), min(eval_pixels, len(eval_dataset)),
+                                                            replace=False))
+    backends = trial_backends(trials, tracking_dir)
+    ended = set() # Trials whose run was terminated
+    budgets = rung_budgets(min_fraction, max_fraction, eta)
+    results = {}
+    alive = list(range(len(trials)))
+
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=init_sweep_worker,
+                                 initargs=(train_dataset, eval_dataset, eval_indices, class_weights, output_dir,
+                                           threads_per_trial)) as pool:
+            for rung, epochs in enumerate(budgets):
+                futures = {trial_id: pool.submit(run_trial, trial_id, trials[trial_id], epochs) for trial_id in alive}
+                for trial_id, future in tqdm(futures.items(), desc=f"Rung {rung} ({epochs:g} epochs)", colour="green"):
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        print(colored(f"Trial {trial_id} failed: {error}", "red"))
+                        backends[trial_id].end("FAILED")
+                        ended.add(trial_id)
+                        continue
+                    results[trial_id] = {**result, 'rung': rung}
+                    backends[trial_id].log_batch([(key, result[key], result['pixels']) for key in
+                                                  ('train_accuracy', 'train_loss', 'val_accuracy', 'val_recall', 'val_loss')]
+                                                 + [("rung", rung, result['pixels'])], {})
+
+                finished = sorted((trial_id for trial_id in alive if trial_id in results and results[trial_id]['rung'] == rung),
+                                  key=lambda trial_id: results[trial_id]['val_accuracy'], reverse=True)
+                alive = finished[:max(1, len(finished) // eta)] if rung + 1 < len(budgets) else finished
+                for trial_id in finished:
+                    if trial_id not in alive: # Stopped by the halving
+                        backends[trial_id].end("KILLED")
+                        ended.add(trial_id)
+                if finished:
+                    print(colored(f"Rung {rung}: best accuracy {results[finished[0]]['val_accuracy']*100:.2f}% "
+                                  f"(trial {finished[0]}), {len(alive)} of {len(finished)} trials continue.", "blue"))
+
+            for trial_id in alive:
+                backends[trial_id].end("FINISHED")
+                ended.add(trial_id)
+
+            costs = {trial_id: pool.submit(trial_cost, trial_id, trials[trial_id]) for trial_id in results}
+            for trial_id, future in costs.items():
+                try:
+                    results[trial_id].update(future.result())
+                except Exception as error: # Dropped from the table, like a failed rung
+                    print(colored(f"Measuring the cost of trial {trial_id} failed: {error}", "red"))
+                    backends[trial_id].end("FAILED")
+                    del results[trial_id]
+    except BaseException as error:
+        for trial_id in range(len(trials)):
+            if trial_id not in ended:
+                backends[trial_id].end("KILLED" if isinstance(error, KeyboardInterrupt) else "FAILED")
+        raise
+
+    rows = [{**trials[trial_id], **results[trial_id]} for trial_id in sorted(results)]
+    for row, on_front in zip(rows, pareto_front(rows)):
+        row['pareto'] = on_front
+        backends[row['trial']].log_batch([(key, float(row[key]), row['pixels']) for key in
+                                          ('params', 'macs_per_pixel', 'us_per_pixel', 'pareto')], {})
+
+    write_pareto_table(rows, os.path.join(output_dir, "pareto.csv"), final_rung=len(budgets) - 1)
+    return rows
+
+def write_pareto_table(rows, path, final_rung):
+    """
+    Print the trials sorted by accuracy with their cost and write them to a CSV file.
+    Trials stopped before the final rung were evaluated on a smaller budget.
+    """
+    rows = sorted(rows, key=lambda row: row['val_accuracy'], reverse=True)
+    columns = list(rows[0].keys()) if rows else []
+    with open(path, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{'trial':>5} {'rung':>5} {'accuracy':>9} {'recall':>8} {'us/pixel':>9} {'MACs':>8} {'params':>7}  config")
+    for row in rows:
+        config = ", ".join(f"{key}={row[key]}" for key in ('kernel_size', 'starting_kernels', 'lr',
+                                                            'label_smoothing', 'loss', 'batch_size'))
+        line = (f"{row['trial']:>5} {row['rung']:>4}{' ' if row['rung'] == final_rung else '*'} "
+                f"{row['val_accuracy']*100:>8.2f}% {row['val_recall']*100:>7.2f}% {row['us_per_pixel']:>9.3f} "
+                f"{row['macs_per_pixel']:>8,} {row['params']:>7,}  {config}")
+        print(colored(line, "green") if row['pareto'] else line)
+    print(f"Pareto-optimal trials in green, * stopped early. Table written to {path}.")
@@ -0,0 +1,240 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.tracking import *
+import atexit
+import json
+import queue
+import shutil
+import threading
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Asynchronous experiment tracking. train_loop() hands metrics, parameters, artifacts and plots
+to a tracking_worker, a background thread fed through a bounded queue. The worker renders the
+plots and sends everything to a backend in batches, so the tracking work of an epoch overlaps
+with the next epoch. The backend is either MLflow or a local directory of JSON lines.
+"""
+
+#######################################################################################
+
+class mlflow_backend:
+    """
+    Tracking backend that logs to an MLflow run with MlflowClient.log_batch().
+    The run is resolved when the backend is created, because the active run of the fluent API is
+    local to the thread that started it and the worker thread would not see it.
+    """
+    def __init__(self, run_id=None):
+        """
+        Initializes the backend.
+        Args:
+            run_id (str, optional): Run to log to. Defaults to the active run of the calling thread.
+        """
+        if run_id is None:
+            run = mlflow.active_run()
+            if run is None:
+                raise RuntimeError("mlflow_backend needs an active MLflow run or a run_id.")
+            run_id = run.info.run_id
+        self.run_id = run_id
+        self.client = mlflow.tracking.MlflowClient()
+
+    def log_batch(self, metrics, params):
+        """
+        Log a batch of metrics [(key, value, step)] and params {key: value}.
+        MLflow accepts at most 1000 metrics and 100 params per call.
+        """
+        timestamp = int(time.time() * 1000)
+        metrics = [mlflow.entities.Metric(key, float(value), timestamp, step) for key, value, step in metrics]
+        params = [mlflow.entities.Param(key, str(value)) for key, value in params.items()]
+        for start in range(0, len(metrics), 1000):
+            self.client.log_batch(self.run_id, metrics=metrics[start:start + 1000])
+        for start in range(0, len(params), 100):
+            self.client.log_batch(self.run_id, params=params[start:start + 100])
+
+    def log_artifact(self, path, artifact_path=None):
+        """
+        Upload a local file to the run.
+        """
+        self.client.log_artifact(self.run_id, path, artifact_path)
+
+    def end(self, status="FINISHED"):
+        """
+        Terminate the run with a status ("FINISHED", "FAILED" or "KILLED"), for runs created with
+        MlflowClient.create_run() that no fluent `with mlflow.start_run()` block ends.
+        """
+        self.client.set_terminated(self.run_id, status)
+
+class file_backend:
+    """
+    Local stand-in for MLflow: metrics are appended to metrics.jsonl, params are merged into
+    params.json and artifacts are copied to artifacts/<artifact_path>/ under a directory.
+    """
+    def __init__(self, directory="tracking"):
+        """
+        Initializes the backend.
+        Args:
+            directory (str): Directory the run is written to.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def log_batch(self, metrics, params):
+        """
+        Log a batch of metrics [(key, value, step)] and params {key: value}.
+        """
+        if metrics:
+            with open(self.directory / "metrics.jsonl", 'a') as f:
+                for key, value, step in metrics:
+                    f.write(json.dumps({"key": key, "value": float(value), "step": step}) + "\n")
+        if params:
+            params_path = self.directory / "params.json"
+            stored = json.loads(params_path.read_text()) if params_path.exists() else {}
+            stored.update({key: str(value) for key, value in params.items()})
+            params_path.write_text(json.dumps(stored, indent=2))
+
+    def log_artifact(self, path, artifact_path=None):
+        """
+        Copy a local file into the artifacts directory.
+        """
+        target_dir = self.directory / "artifacts" / (artifact_path or "")
+        target_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target_dir / os.path.basename(path))
+
+    def end(self, status="FINISHED"):
+        """
+        Record the final status of the run and its end time in status.json.
+        """
+        (self.directory / "status.json").write_text(json.dumps({"status": status,
+                                                                "end_time": int(time.time() * 1000)}))
+
+#######################################################################################
+
+class tracking_worker:
+    """
+    Background thread that logs metrics, params, artifacts and plots to a tracking backend.
+    Calls only put a message on a bounded queue, so they return immediately unless the worker
+    is more than `max_queue` messages behind. The worker merges all queued metrics and params
+    into one backend.log_batch() call, and renders plots with the function it is given. It is
+    flushed by close(), which also runs at interpreter exit.
+    """
+    def __init__(self, backend, max_queue=256):
+        """
+        Initializes and starts the worker.
+        Args:
+            backend (mlflow_backend or file_backend): Where the tracking data is sent.
+            max_queue (int): Maximum number of pending messages.
+        """
+        self.backend = backend
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.errors = []
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="tracking_worker", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    #######################################################################################
+
+    def log_params(self, params):
+        """
+        Log a dict of parameters.
+        """
+        self.put("params", dict(params))
+
+    def log_metrics(self, metrics, step=None):
+        """
+        Log a dict of metrics at a step.
+        """
+        self.put("metrics", [(key, float(value), step or 0) for key, value in metrics.items()])
+
+    def log_artifact(self, path, artifact_path=None):
+        """
+        Log a local file. The file must not change until the worker has logged it.
+        """
+        self.put("artifact", (path, artifact_path))
+
+    def log_plot(self, render_fn, args, path, artifact_path=None):
+        """
+        Render a plot in the worker with render_fn(*args, path) and log the written file.
+        The args must not be modified after the call, pass copies of arrays that are reused.
+        """
+        self.put("plot", (render_fn, args, path, artifact_path))
+
+    def put(self, kind, payload):
+        """
+        Queue a message, blocking while the queue is full.
+        """
+        if self.closed:
+            raise RuntimeError("The tracking worker is closed.")
+        self.queue.put((kind, payload))
+
+    def flush(self):
+        """
+        Block until every queued message has been sent to the backend.
+        """
+        self.queue.join()
+
+    def close(self):
+        """
+        Flush the queue and stop the worker. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(("stop", None))
+        self.thread.join()
+        atexit.unregister(self.close)
+        if self.errors:
+            print(colored(f"Tracking: {len(self.errors)} messages could not be logged, "
+                          f"first error: {self.errors[0]}", "red"))
+
+    #######################################################################################
+
+    def run(self):
+        """
+        Worker loop: drain the queue, batch metrics and params, send them, handle artifacts and plots.
+        """
+        stop = False
+        while not stop:
+            messages = [self.queue.get()]
+            while True:
+                try:
+                    messages.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            metrics = []
+            params = {}
+            for kind, payload in messages:
+                if kind == "metrics":
+                    metrics.extend(payload)
+                elif kind == "params":
+                    params.update(payload)
+                elif kind == "stop":
+                    stop = True
+            self.handle(lambda: self.backend.log_batch(metrics, params) if metrics or params else None)
+
+            for kind, payload in messages:
+                if kind == "artifact":
+                    self.handle(lambda: self.backend.log_artifact(*payload))
+                elif kind == "plot":
+                    render_fn, args, path, artifact_path = payload
+                    self.handle(lambda: (render_fn(*args, path), self.backend.log_artifact(path, artifact_path)))
+
+            for _ in messages:
+                self.queue.task_done()
+
+    def handle(self, fn):
+        """
+        Run a backend call, keeping the error instead of stopping the worker (tracking must not
+        break training).
+        """
+        try:
+            fn()
+        except Exception as error:
+            self.errors.append(error)
@@ -3,17 +3,29 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
-from functions.processing import load_label
+from libraries.data_io import *
+from libraries.training import *
+from libraries.visualization import *
+from libraries.tracking import *
+from concurrent.futures import ThreadPoolExecutor
+from functions.processing import label_histogram
+from functions.metrics import confusion_matrix_accumulator
+from functions.checkpointing import training_state
+from functions.distributed import is_main_process, all_reduce_sum, unwrap_model
 
 #######################################################################################
 #######################################################################################
 #######################################################################################
 
 def train_loop(model, train_loader, val_loader, criterion, optimizer, scheduler, device,
-               save_path="models/best_model.pth", num_epochs=30):
+               save_path="models/best_model.pth", num_epochs=30, normalizer=None,
+               sync_every=0, store_outputs=False, preprocessing=None, loss_tracker=None, tracker=None,
+               checkpointer=None, resume=None):
     """
     Train the model using the provided training and validation data loaders.
+    In a distributed run every rank calls train_loop with its own shard of the data and a model wrapped
+    in DistributedDataParallel; the metrics are summed over the ranks, and only rank 0 prints, logs,
+    saves the best model and writes checkpoints.
     Args:
         model (torch.nn.Module): The model to be trained.
         train_loader (torch.utils.data.DataLoader): DataLoader for the training dataset.
@@ -24,184 +36,282 @@ def train_loop(model, train_loader, val_loader, criterion, optimizer, scheduler,
         device (torch.device): Device to perform training on (CPU or GPU).
         save_path (str): Path to save the best model.
         num_epochs (int): Number of epochs to train the model.
+        normalizer (normalization_manager, optional): Fitted normalizer, saved with the best model.
+        sync_every (int): Number of training steps between host syncs for the progress bar, 0 for once per epoch.
+        store_outputs (bool): Keep the outputs and labels of every training batch of an epoch on the host.
+        preprocessing (dict, optional): Spectral input preprocessing (band subset and binning), saved with the best model.
+        loss_tracker (loss_tracker, optional): Per-pixel losses of hard-example sampling, updated after every epoch.
+        tracker (tracking_worker, optional): Background worker for metrics and plots, flushed when training
+            ends. If None, everything is logged synchronously to the active MLflow run.
+        checkpointer (checkpoint_writer, optional): Writes the full training state in the background
+            whenever a checkpoint is due and after every epoch.
+        resume (dict, optional): Resume point returned by checkpointing.load_training_state(). Training
+            continues at its epoch and step; the train loader must use a sampler from samplers.py, which
+            can skip the batches already trained on.
     """
-    best_accuracy = 0.0
+    best_accuracy = resume['best_accuracy'] if resume is not None else 0.0
+    start_epoch = resume['epoch'] if resume is not None else 0
+    start_step = resume['step'] if resume is not None else 0
+    progress = resume['progress'] if resume is not None else None
+    sampler = train_loader.batch_sampler
+    steps_per_epoch = len(train_loader)
+    main = is_main_process()
+    net = unwrap_model(model) # Saved and evaluated without the DistributedDataParallel wrapper
+    if not main:
+        tracker, checkpointer = None, None
 
     classes = ["Cloud", "Land", "Sea"]
-    print(f"DEBUG - Number of training batches: {len(train_loader)}")
+    if main:
+        print(f"DEBUG - Number of training batches: {len(train_loader)}")
 
-    for epoch in range(num_epochs):
+    for epoch in range(start_epoch, num_epochs):
         model.train()
+        if hasattr(sampler, "set_epoch"):
+            sampler.set_epoch(epoch, start_step)
+        elif start_step:
+            raise ValueError("Resuming mid-epoch needs a batch sampler with set_epoch(epoch, start_batch).")
         total_loss = 0.0
-        labels_per_epoch = []
-        predictions_per_epoch = []
-
-        loop = tqdm(train_loader, desc=f"Epoch {epoch+1}/{num_epochs}", leave=False, colour="red")
+        labels_per_epoch = [] if store_outputs else None
+        predictions_per_epoch = [] if store_outputs else None
+
+        loop = tqdm(train_loader, desc=f"Epoch {epoch+1}/{num_epochs}", leave=False, colour="red",
+                    initial=start_step, disable=not main)
+
+        # Checkpoint (only syncs with the device when a checkpoint is due)
+        on_step = None
+        if checkpointer is not None:
+            def on_step(step, loss_sum, correct, total):
+                global_step = epoch * steps_per_epoch + step
+                if checkpointer.due(global_step):
+                    step_progress = {'loss_sum': loss_sum.item(), 'correct': correct.item(), 'total': total}
+                    checkpointer.save(training_state(net, optimizer, scheduler, epoch, step, best_accuracy,
+                                                     step_progress, normalizer, preprocessing, loss_tracker),
+                                      global_step)
 
         # Training
         train_accuracy, total_loss = train_subloop(
             loop, model, criterion, optimizer, device,
-            predictions_per_epoch, labels_per_epoch, total_loss
+            predictions_per_epoch, labels_per_epoch, total_loss, sync_every, loss_tracker,
+            start_step, progress, on_step
             )
+        start_step, progress = 0, None
+        if loss_tracker is not None:
+            loss_tracker.update()
 
         # Evaluation
         model.eval()
-        all_labels_eval = []
-        all_preds_eval = []
+        metrics = confusion_matrix_accumulator(len(classes), device)
 
         with torch.no_grad():
-            all_labels_eval, all_preds_eval, val_loss = eval_subloop(
-                val_loader, model, criterion, device,
-                all_labels_eval, all_preds_eval
-                )
+            metrics, val_loss = eval_subloop(val_loader, net, criterion, device, metrics)
+
+        val_accuracy = metrics.accuracy()
+        scheduler.step()
 
-        val_accuracy = accuracy_score(all_labels_eval, all_preds_eval)
+        if not main:
+            continue
+        report = metrics.classification_report(classes, output_dict=True)
 
         # Print results
-        print("Unique labels in eval-data:", sorted(set(all_labels_eval)))
-        print("Unique predictions:", sorted(set(all_preds_eval)))
+        print("Unique labels in eval-data:", metrics.present_labels())
+        print("Unique predictions:", metrics.present_predictions())
         print(colored(f"TRAIN - Epoch {epoch+1}, Loss: {total_loss:.4f}, Accuracy: {train_accuracy:.2f}%", "magenta"))
         print(colored(f"EVAL  - Epoch {epoch+1}, Accuracy: {val_accuracy*100:.2f}%", "green"))
-        print(classification_report(all_labels_eval, all_preds_eval, target_names=classes))
+        print(metrics.classification_report(classes))
 
         # Log MLflow
-        log_mlflow_train(train_accuracy, val_accuracy, total_loss, val_loss, epoch)
-        log_classification_report_mlflow(classification_report(all_labels_eval, all_preds_eval,
-                                                                target_names=classes, output_dict=True),
-                                                                epoch)
+        log_mlflow_train(train_accuracy, val_accuracy, total_loss, val_loss, epoch, tracker)
+        log_classification_report_mlflow(report, epoch, tracker)
 
         # Save model
         if val_accuracy > best_accuracy:
             best_accuracy = val_accuracy
-            save_model(model, best_accuracy, save_path)
+            save_model(net, best_accuracy, save_path, normalizer, preprocessing)
             print(f"Model saved with accuracy: {best_accuracy:.2f}%")
 
         # Confusion Matrix
-        confusion_matrix_plot(all_labels_eval, all_preds_eval, classes, epoch)
+        confusion_matrix_plot(metrics.compute(), classes, epoch, tracker)
 
-        scheduler.step()
         print(colored(f"Learning rate: {scheduler.get_last_lr()[0]:.6f}", "yellow"))
 
+        if checkpointer is not None:
+            checkpointer.save(training_state(net, optimizer, scheduler, epoch + 1, 0, best_accuracy,
+                                             None, normalizer, preprocessing, loss_tracker),
+                              (epoch + 1) * steps_per_epoch)
+
         print("\n")
 
+    if tracker is not None:
+        tracker.flush()
+    if checkpointer is not None:
+        checkpointer.flush()
+
 #######################################################################################
 
 def train_subloop(loop, model, criterion, optimizer, device,
-                  predictions_per_epoch, labels_per_epoch, total_loss):
+                  predictions_per_epoch=None, labels_per_epoch=None, total_loss=0.0, sync_every=0,
+                  loss_tracker=None, start_step=0, progress=None, on_step=None):
     """
     Train the model for one epoch.
+    The loss and the number of correct predictions are accumulated in tensors on the device,
+    so the host only waits for the device every `sync_every` steps and at the end of the epoch.
     Args:
         loop (tqdm): Progress bar for the training loop.
         model (torch.nn.Module): The model to be trained.
         criterion (torch.nn.Module): Loss function.
         optimizer (torch.optim.Optimizer): Optimizer for training.
         device (torch.device): Device to perform training on (CPU or GPU).
-        predictions_per_epoch (list): List to store predictions for the epoch.
-        labels_per_epoch (list): List to store labels for the epoch.
+        predictions_per_epoch (list, optional): If given, the outputs of every batch are stored in it.
+        labels_per_epoch (list, optional): If given, the labels of every batch are stored in it.
         total_loss (float): Total loss for the epoch.
+        sync_every (int): Number of steps between updates of the progress bar, which need a host sync.
+            0 syncs only once at the end of the epoch.
+        loss_tracker (loss_tracker, optional): If given, the per-sample losses of every batch are recorded
+            in it. The loader must use the stratified_batch_sampler that issues batches to the tracker.
+        start_step (int): Steps of the epoch already done before a resume, the loader skips them.
+        progress (dict, optional): Partial sums ('loss_sum', 'correct', 'total') of those steps.
+        on_step (callable, optional): Called as on_step(step, loss_sum, correct, total) after every step,
+            with the running sums still on the device, e.g. to write checkpoints.
     Returns:
         train_accuracy (float): Training accuracy for the epoch.
         total_loss (float): Total loss for the epoch.
     """
-    correct = 0
-    total = 0
-    for batch in loop:
+    progress = progress or {}
+    loss_sum = torch.full((), float(progress.get('loss_sum', 0.0)), device=device)
+    correct = torch.full((), int(progress.get('correct', 0)), dtype=torch.long, device=device)
+    total = progress.get('total', 0)
+    for step, batch in enumerate(loop, start_step + 1):
         spectrum, labels = batch
         spectrum = spectrum.unsqueeze(1).to(device, non_blocking=True)
         labels = labels.view(-1).to(device, non_blocking=True)
 
-        optimizer.zero_grad()
+        optimizer.zero_grad(set_to_none=True)
         output = model(spectrum)
 
         loss = criterion(output, labels)
         loss.backward()
         optimizer.step()
 
-        predictions_per_epoch.append(output.detach().cpu())
-        labels_per_epoch.append(labels.detach().cpu())
+        if loss_tracker is not None:
+            loss_tracker.record(F.cross_entropy(output.detach(), labels, reduction='none'))
+        if predictions_per_epoch is not None:
+            predictions_per_epoch.append(output.detach().cpu())
+        if labels_per_epoch is not None:
+            labels_per_epoch.append(labels.detach().cpu())
 
-        total_loss += loss.item()
-        _, predicted = output.max(1)
-        correct += (predicted == labels).sum().item()
+        loss_sum += loss.detach()
+        correct += (output.detach().argmax(1) == labels).sum()
         total += labels.size(0)
 
-    train_accuracy = 100 * correct / total
+        if sync_every and step % sync_every == 0 and hasattr(loop, "set_postfix"):
+            loop.set_postfix(loss=f"{loss_sum.item():.4f}", acc=f"{100 * correct.item() / total:.2f}%")
+
+        if on_step is not None:
+            on_step(step, loss_sum, correct, total)
+
+    # Sums over all ranks in a distributed run, with one host sync
+    sums = torch.stack([loss_sum.double(), correct.double(), torch.tensor(total, dtype=torch.float64, device=device)])
+    loss_sum, correct, total = all_reduce_sum(sums).tolist()
+    total_loss += loss_sum
+    train_accuracy = 100 * correct / max(total, 1)
     
     return train_accuracy, total_loss
 
 #######################################################################################
 
-def eval_subloop(val_loader, model, criterion, device,
-                 all_labels_eval, all_preds_eval):
+def eval_subloop(val_loader, model, criterion, device, metrics, progress=True):
     """
     Evaluate the model on the validation dataset.
+    In a distributed run every rank evaluates its shard, and the counts and loss are summed over the ranks.
     Args:
         val_loader (torch.utils.data.DataLoader): DataLoader for the validation dataset.
         model (torch.nn.Module): The model to be evaluated.
         criterion (torch.nn.Module): Loss function.
         device (torch.device): Device to perform evaluation on (CPU or GPU).
-        all_labels_eval (list): List to store labels for evaluation.
-        all_preds_eval (list): List to store predictions for evaluation.
+        metrics (confusion_matrix_accumulator): Accumulator the predictions are added to.
+        progress (bool): Show a progress bar (on rank 0).
     Returns:
-        all_labels_eval (list): List of labels for evaluation.
-        all_preds_eval (list): List of predictions for evaluation.
+        metrics (confusion_matrix_accumulator): The accumulator with the counts of the whole dataset.
         val_loss (float): Total loss for the validation dataset.
     """
-    val_loss = 0.0
-    for spectrum, labels in tqdm(val_loader, desc="Evaluation", leave=True, colour="blue"):
-        spectrum = spectrum.unsqueeze(1).to(device)
-        labels = labels.view(-1).to(device)
+    val_loss = torch.zeros((), device=device)
+    for spectrum, labels in tqdm(val_loader, desc="Evaluation", leave=True, colour="blue",
+                                 disable=not (progress and is_main_process())):
+        spectrum = spectrum.unsqueeze(1).to(device, non_blocking=True)
+        labels = labels.view(-1).to(device, non_blocking=True)
         output = model(spectrum)
-        _, predicted = torch.max(output, 1)
         loss = criterion(output, labels)
 
-        all_labels_eval.extend(labels.cpu().numpy())
-        all_preds_eval.extend(predicted.cpu().numpy())
-        val_loss += loss.item()
-    
-    return all_labels_eval, all_preds_eval, val_loss
+        metrics.update(output.argmax(1), labels)
+        val_loss += loss
+
+    all_reduce_sum(metrics.matrix)
+    return metrics, all_reduce_sum(val_loss).item()
 
 #######################################################################################
 
-def confusion_matrix_plot(all_labels_eval, all_preds_eval, classes, epoch):
+def confusion_matrix_plot(cm, classes, epoch, tracker=None):
     """
     Plot and save the confusion matrix.
     Args:
-        all_labels_eval (list): List of labels for evaluation.
-        all_preds_eval (list): List of predictions for evaluation.
+        cm (numpy.ndarray): Confusion matrix, rows are real labels and columns predicted labels.
         classes (list): List of class names.
         epoch (int): Current epoch number.
+        tracker (tracking_worker, optional): If given, the plot is rendered and logged in the
+            background. Otherwise it is rendered here and logged to the active MLflow run.
     """
-    cm = confusion_matrix(all_labels_eval, all_preds_eval)
-    plt.figure(figsize=(6, 5))
-    sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=classes, yticklabels=classes)
-    plt.xlabel("Predicted Labels")
-    plt.ylabel("Real Labels")
-    plt.title("Confusion Matrix")
-
     output_dir = "plots/validation_plots"
     os.makedirs(output_dir, exist_ok=True)
     filename = f"confusion_matrix_EPOCH_{epoch+1}.png"
     filepath = os.path.join(output_dir, filename)
-    plt.savefig(filepath)
-    plt.close()
 
+    if tracker is not None:
+        tracker.log_plot(render_confusion_matrix, (np.array(cm), list(classes)), filepath, "confusion_matrices")
+        return
+
+    render_confusion_matrix(cm, classes, filepath)
     mlflow.log_artifact(filepath, artifact_path="confusion_matrices")
 
+def render_confusion_matrix(cm, classes, filepath):
+    """
+    Render the confusion matrix heatmap to a PNG file. A pyplot-free Figure is used, so it can
+    run in the tracking worker thread.
+    """
+    fig = Figure(figsize=(6, 5))
+    ax = fig.subplots()
+    sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=classes, yticklabels=classes, ax=ax)
+    ax.set_xlabel("Predicted Labels")
+    ax.set_ylabel("Real Labels")
+    ax.set_title("Confusion Matrix")
+    fig.savefig(filepath)
+
 #######################################################################################
 
-def save_model(model, best_accuracy, save_path):
+def save_model(model, best_accuracy, save_path, normalizer=None, preprocessing=None):
     """
-    Save the model state dictionary and best accuracy to a file.
+    Save the model state dictionary, its config and the best accuracy to a file.
     Args:
         model (torch.nn.Module): The model to be saved.
         best_accuracy (float): Best accuracy achieved during training.
         save_path (str): Path to save the model.
+        normalizer (normalization_manager, optional): Fitted normalizer, stored under
+            'normalizer_state_dict' so inference can reuse it without refitting.
+        preprocessing (dict, optional): Input preprocessing the model was trained with, e.g.
+            {'bands': [...], 'bin_size': 2}, stored under 'preprocessing' and passed to predict_scene()
+            at inference.
     """
-    torch.save({
+    checkpoint = {
         'model_state_dict': model.state_dict(),
         'best_accuracy': best_accuracy
-    }, save_path)
+    }
+    if hasattr(model, 'config'):
+        checkpoint['model_config'] = model.config
+    if normalizer is not None:
+        checkpoint['normalizer_state_dict'] = normalizer.state_dict()
+    if preprocessing is not None:
+        checkpoint['preprocessing'] = preprocessing
+
+    torch.save(checkpoint, save_path)
 
 #######################################################################################
 
@@ -254,23 +364,41 @@ class FocalLoss(nn.Module):
     
 #######################################################################################
 
-def get_class_weights(label_paths, num_classes):
+def class_histograms(label_paths, num_classes, cache=None, stride=1, num_workers=8):
+    """
+    Count the pixels of every class in every label file.
+    The files are counted in parallel with np.bincount on their uint8 arrays. With a scene cache the
+    counts are stored next to the cached labels and later calls do not read the label files again.
+    Args:
+        label_paths (list): List of paths to label files.
+        num_classes (int): Number of classes in the dataset, other label values are not counted.
+        cache (scene_cache, optional): Persistent cache of preprocessed scenes.
+        stride (int): Spatial stride of the training pixels, see processing.load_label().
+        num_workers (int): Number of threads reading label files.
+    Returns:
+        numpy.ndarray: int64 counts of shape (files, num_classes).
+    """
+    histogram = cache.label_histogram if cache is not None else label_histogram
+    if len(label_paths) == 0:
+        return np.zeros((0, num_classes), dtype=np.int64)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        counts = list(executor.map(lambda path: histogram(path, stride=stride), label_paths))
+
+    return np.stack(counts)[:, :num_classes]
+
+def get_class_weights(label_paths, num_classes, cache=None, stride=1):
     """
     Calculate class weights based on the frequency of each class in the dataset.
     Args:
         label_paths (list): List of paths to label files.
         num_classes (int): Number of classes in the dataset.
+        cache (scene_cache, optional): Persistent cache holding the label histograms, see class_histograms().
+        stride (int): Spatial stride of the training pixels.
     Returns:
         torch.Tensor: Class weights for each class.
     """
-    all_labels = []
-
-    for path in label_paths:
-        labels = load_label(path)
-        all_labels.extend(labels)
-
-    labels_tensor = torch.tensor(all_labels, dtype=torch.long)
-    class_counts = torch.bincount(labels_tensor, minlength=num_classes).float()
+    class_counts = torch.from_numpy(class_histograms(label_paths, num_classes, cache, stride).sum(axis=0)).float()
 
     # No zero division
     epsilon = 1e-6
@@ -290,7 +418,7 @@ def get_class_weights(label_paths, num_classes):
 
 def log_mlflow_pre_train(EPOCHS, BATCH_SIZE, LR, LABEL_SMOOTHING,
                KERNEL_SIZE, STARTING_KERNELS, NUM_FEATURES, NUM_CLASSES,
-               optimizer, scheduler, criterion, model, train_dataset, eval_dataset):
+               optimizer, scheduler, criterion, model, train_dataset, eval_dataset, tracker=None):
     """
     Log hyperparameters and model information to MLflow.
     Args:
@@ -308,25 +436,37 @@ def log_mlflow_pre_train(EPOCHS, BATCH_SIZE, LR, LABEL_SMOOTHING,
         model (torch.nn.Module): Model architecture used for training.
         train_dataset (torch.utils.data.Dataset): Training dataset.
         eval_dataset (torch.utils.data.Dataset): Evaluation dataset.
+        tracker (tracking_worker, optional): If given, the params are logged in the background.
     """
-    mlflow.log_param("EPOCHS", EPOCHS)
-    mlflow.log_param("BATCH_SIZE", BATCH_SIZE)
-    mlflow.log_param("LR", LR)
-    mlflow.log_param("LABEL_SMOOTHING", LABEL_SMOOTHING)
-    mlflow.log_param("KERNEL_SIZE", KERNEL_SIZE)
-    mlflow.log_param("STARTING_KERNELS", STARTING_KERNELS)
-    mlflow.log_param("NUM_FEATURES", NUM_FEATURES)
-    mlflow.log_param("NUM_CLASSES", NUM_CLASSES)
-    mlflow.log_param("optimizer", optimizer.__class__.__name__)
-    mlflow.log_param("scheduler", scheduler.__class__.__name__)
-    mlflow.log_param("loss_function", criterion.__class__.__name__)
-    mlflow.log_param("model", model.__class__.__name__)
-    mlflow.log_param("train_dataset_size", len(train_dataset)/653016)
-    mlflow.log_param("eval_dataset_size", len(eval_dataset)/653016)
+    params = {
+        "EPOCHS": EPOCHS,
+        "BATCH_SIZE": BATCH_SIZE,
+        "LR": LR,
+        "LABEL_SMOOTHING": LABEL_SMOOTHING,
+        "KERNEL_SIZE": KERNEL_SIZE,
+        "STARTING_KERNELS": STARTING_KERNELS,
+        "NUM_FEATURES": NUM_FEATURES,
+        "NUM_CLASSES": NUM_CLASSES
+    }
+    if hasattr(model, 'config'):
+        params["NUM_STAGES"] = model.config['num_stages']
+    params.update({
+        "optimizer": optimizer.__class__.__name__,
+        "scheduler": scheduler.__class__.__name__,
+        "loss_function": criterion.__class__.__name__,
+        "model": model.__class__.__name__,
+        "train_dataset_size": len(train_dataset)/653016,
+        "eval_dataset_size": len(eval_dataset)/653016
+    })
+
+    if tracker is not None:
+        tracker.log_params(params)
+    else:
+        mlflow.log_params(params)
 
 #######################################################################################
 
-def log_mlflow_train(train_accuracy, val_accuracy, train_loss, val_loss, epoch):
+def log_mlflow_train(train_accuracy, val_accuracy, train_loss, val_loss, epoch, tracker=None):
     """
     Log training and validation metrics to MLflow.
     Args:
@@ -335,26 +475,44 @@ def log_mlflow_train(train_accuracy, val_accuracy, train_loss, val_loss, epoch):
         train_loss (float): Training loss for the current epoch.
         val_loss (float): Validation loss for the current epoch.
         epoch (int): Current epoch number.
+        tracker (tracking_worker, optional): If given, the metrics are logged in the background.
     """
-    mlflow.log_metric(f"train_accuracy", train_accuracy/100, step=epoch)
-    mlflow.log_metric(f"val_accuracy", val_accuracy, step=epoch)
-    mlflow.log_metric(f"train_loss", train_loss, step=epoch)
-    mlflow.log_metric(f"val_loss", val_loss, step=epoch)
+    log_metrics({
+        "train_accuracy": train_accuracy/100,
+        "val_accuracy": val_accuracy,
+        "train_loss": train_loss,
+        "val_loss": val_loss
+    }, epoch, tracker)
 
 #######################################################################################
 
-def log_classification_report_mlflow(report_dict, epoch):
+def log_classification_report_mlflow(report_dict, epoch, tracker=None):
     """
-    Log classification report metrics to MLflow.
+    Log classification report metrics to MLflow, in one batch.
     Args:
         report_dict (dict): Classification report dictionary containing metrics.
         epoch (int): Current epoch number.
+        tracker (tracking_worker, optional): If given, the metrics are logged in the background.
     """
+    report_metrics = {}
     for class_name, metrics in report_dict.items():
         if isinstance(metrics, dict):
             for metric_name, value in metrics.items():
                 if "support" or "accuracy" not in metric_name:
-                    mlflow.log_metric(f"{class_name}_{metric_name}", value, step=epoch)
+                    report_metrics[f"{class_name}_{metric_name}"] = value
         else:
             if "support" or "accuracy" not in class_name:
-                mlflow.log_metric(f"{class_name}", metrics, step=epoch)
\ No newline at end of file
+                report_metrics[f"{class_name}"] = metrics
+    log_metrics(report_metrics, epoch, tracker)
+
+#######################################################################################
+
+def log_metrics(metrics, step, tracker=None):
+    """
+    Log a dict of metrics through the tracking worker, or synchronously to the active MLflow run.
+    """
+    metrics = {key: float(value) for key, value in metrics.items()}
+    if tracker is not None:
+        tracker.log_metrics(metrics, step)
+    else:
+        mlflow.log_metrics(metrics, step=step)
\ No newline at end of file
@@ -0,0 +1,125 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from statistics import NormalDist
+from functions.processing import load_image, load_label
+from functions.inference import predict_pixels, inference_engine
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+Quick-look cloud-cover triage. A sparse strided grid of pixels is read straight from the
+memory-mapped .bip cube (only the pages of every stride-th row of the used band planes are
+touched), classified with the trained model, and the Cloud/Land/Sea fractions of the scene
+are estimated with a confidence interval. Scenes that are almost certainly cloud can then be
+skipped, and the remaining scenes processed clearest first.
+"""
+
+CLASSES = ["Cloud", "Land", "Sea"]
+
+#######################################################################################
+
+def wilson_interval(counts, n, confidence=0.95):
+    """
+    Wilson score interval of binomial proportions.
+    Args:
+        counts (numpy.ndarray): Number of successes per class.
+        n (int): Number of trials.
+        confidence (float): Confidence level of the interval.
+    Returns:
+        tuple: (lower, upper) numpy arrays.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if n == 0:
+        return np.zeros_like(counts), np.ones_like(counts)
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = counts / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+    return np.clip(center - half_width, 0, 1), np.clip(center + half_width, 0, 1)
+
+def fraction_estimate(classes, num_classes=3, confidence=0.95):
+    """
+    Estimate the class fractions of a scene from the classes of a pixel sample.
+    Neighbouring pixels of a scene are correlated, so the interval is narrower than the true
+    uncertainty; a larger stride makes the sample closer to independent.
+    Args:
+        classes (numpy.ndarray): Class indices of the sampled pixels.
+        num_classes (int): Number of classes.
+        confidence (float): Confidence level of the interval.
+    Returns:
+        dict: 'fractions', 'lower' and 'upper' arrays of shape (num_classes,) and 'n_pixels'.
+    """
+    classes = np.asarray(classes).ravel()
+    classes = classes[classes < num_classes]
+    counts = np.bincount(classes, minlength=num_classes)
+    lower, upper = wilson_interval(counts, classes.size, confidence)
+    return {
+        'fractions': counts / max(classes.size, 1),
+        'lower': lower,
+        'upper': upper,
+        'n_pixels': int(classes.size)
+    }
+
+#######################################################################################
+
+def quick_look(image_path, model, normalizer, stride=16, confidence=0.95, HEIGHT=598, WIDTH=1092, BANDS=120,
+               bands=None, bin_size=1, device="cpu", batch_size=2048):
+    """
+    Estimate the class fractions of a scene from a strided pixel sample classified by the model.
+    Args:
+        image_path (str): Path to the .bip (/.bip@) file.
+        model (torch.nn.Module or inference_engine): Trained model, see inference.predict_pixels().
+        normalizer (normalization_manager): Fitted normalizer.
+        stride (int): Every stride-th row and column is sampled, stride=16 reads 0.4% of the pixels.
+        confidence (float): Confidence level of the fraction intervals.
+        HEIGHT, WIDTH, BANDS (int): Dimensions of the raw cube.
+        bands, bin_size: Spectral preprocessing of the model, see processing.load_image().
+        device (torch.device or str): Device the model is on.
+        batch_size (int): Number of pixels per forward pass.
+    Returns:
+        dict: See fraction_estimate(), plus 'seconds'.
+    """
+    start = time.perf_counter()
+    spectra = np.ascontiguousarray(load_image(image_path, HEIGHT, WIDTH, BANDS, bands=bands,
+                                              bin_size=bin_size, stride=stride))
+    classes = predict_pixels(model, normalizer, spectra, device, batch_size)
+
+    num_classes = model.num_classes if isinstance(model, inference_engine) else model.classifier.out_features
+    estimate = fraction_estimate(classes, num_classes, confidence)
+    estimate['seconds'] = time.perf_counter() - start
+    return estimate
+
+def label_quick_look(label_path, stride=16, confidence=0.95, HEIGHT=598, WIDTH=1092, num_classes=3):
+    """
+    Estimate the class fractions of a labeled scene from a strided sample of its labels, used to
+    filter training scenes before any spectra are read.
+    Returns:
+        dict: See fraction_estimate().
+    """
+    return fraction_estimate(load_label(label_path, HEIGHT, WIDTH, stride), num_classes, confidence)
+
+#######################################################################################
+
+def triage_scenes(estimates, max_cloud_fraction=0.9):
+    """
+    Decide which scenes to process and in which order.
+    A scene is skipped only if the lower bound of its cloud fraction is above max_cloud_fraction,
+    so uncertain scenes are always kept. The kept scenes are ordered by their estimated cloud
+    fraction, clearest first.
+    Args:
+        estimates (dict): Mapping from scene path to the estimate of quick_look() or label_quick_look().
+        max_cloud_fraction (float): Cloud fraction above which a scene is not worth processing.
+    Returns:
+        tuple: (kept scene paths in priority order, skipped scene paths).
+    """
+    kept = [path for path, estimate in estimates.items() if estimate['lower'][0] <= max_cloud_fraction]
+    skipped = [path for path, estimate in estimates.items() if estimate['lower'][0] > max_cloud_fraction]
+    kept.sort(key=lambda path: estimates[path]['fractions'][0])
+    return kept, skipped
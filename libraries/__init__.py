@@ -0,0 +1,31 @@
+# libraries – Common libraries, split into focused groups
+#
+#   libraries.data_io        system, numpy, csv, paths, progress bar, colored output (+ lazy pandas, cupy, spectral, hypso)
+#   libraries.model          torch, nn, F
+#   libraries.training       libraries.model + optimizers, DataLoader/Dataset (+ lazy torchvision, sklearn)
+#   libraries.visualization  lazy matplotlib, seaborn, PIL
+#   libraries.tracking       lazy mlflow
+#
+# Modules import only the groups they use. Heavy optional backends are lazy_import stand-ins
+# that import on first use, so e.g. manage_data.py does not load torch or mlflow.
+# Importing a group does not import the other groups. `from libraries import *` still provides
+# every name, for notebooks and old scripts.
+
+import importlib
+
+GROUPS = ["data_io", "training", "visualization", "tracking"]
+
+def __getattr__(name):
+    """
+    Resolve the names of the groups on first access, so `import libraries.data_io` stays cheap.
+    """
+    groups = [importlib.import_module(f"libraries.{group}") for group in GROUPS]
+
+    if name == "__all__":
+        print("Libraries are loaded!")
+        return [name for group in groups for name in group.__all__]
+
+    for group in groups:
+        if name in group.__all__:
+            return getattr(group, name)
+    raise AttributeError(f"module 'libraries' has no attribute '{name}'")
@@ -0,0 +1,45 @@
+# data_io.py – System, numerical and file I/O libraries
+
+# System libraries
+import os
+import sys
+import time
+import random
+import warnings
+import logging
+
+# Numerical calculations and data processing
+import numpy as np
+import csv
+import random as rd
+from pathlib import Path
+from collections import Counter
+
+# Progress bar and colored output
+from tqdm import tqdm
+from termcolor import colored
+
+# Optional backends, imported on first use
+from libraries.lazy import lazy_import
+pd = lazy_import("pandas")
+cp = lazy_import("cupy")
+spectral = lazy_import("spectral")
+joblib = lazy_import("joblib")
+
+# HYPSO Package
+hypso = lazy_import("hypso")
+Hypso2 = lazy_import("hypso", "Hypso2")
+load_l1a_nc_cube = lazy_import("hypso.load", "load_l1a_nc_cube") # Raw
+load_l1b_nc_cube = lazy_import("hypso.load", "load_l1b_nc_cube") # Radiance
+load_l1c_nc_cube = lazy_import("hypso.load", "load_l1c_nc_cube") # Reflectance
+load_l1d_nc_cube = lazy_import("hypso.load", "load_l1d_nc_cube") # Reflectance
+
+# Cache
+sys.dont_write_bytecode = True
+
+# Logger
+warnings.filterwarnings("ignore")
+
+__all__ = ["os", "sys", "time", "random", "warnings", "logging", "np", "csv", "rd", "Path", "Counter",
+           "tqdm", "colored", "pd", "cp", "spectral", "joblib", "hypso", "Hypso2",
+           "load_l1a_nc_cube", "load_l1b_nc_cube", "load_l1c_nc_cube", "load_l1d_nc_cube"]
@@ -0,0 +1,59 @@
+import importlib
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+class lazy_import:
+    """
+    Stand-in for a module, or for an attribute of a module, that is only imported on first use.
+    `plt = lazy_import("matplotlib.pyplot")` can be imported and passed around for free, and the
+    first `plt.figure()` imports matplotlib. Optional backends that are not installed only raise
+    an ImportError when they are actually used.
+    """
+    def __init__(self, module_name, attribute=None, submodules=()):
+        """
+        Initializes the stand-in.
+        Args:
+            module_name (str): Module to import, e.g. "matplotlib.pyplot".
+            attribute (str, optional): Attribute of the module to stand in for, e.g. a class.
+            submodules (tuple of str, optional): Submodules imported together with the module,
+                e.g. ("mlflow.pytorch",).
+        """
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_attribute'] = attribute
+        self.__dict__['_submodules'] = submodules
+        self.__dict__['_target'] = None
+
+    def _lazy_target(self):
+        """
+        Import the module on the first call and return the module or attribute.
+        The underscore name keeps it from hiding an attribute of the module, such as joblib.load.
+        """
+        target = self.__dict__['_target']
+        if target is None:
+            try:
+                target = importlib.import_module(self._module_name)
+                for submodule in self._submodules:
+                    importlib.import_module(submodule)
+            except ImportError as error:
+                raise ImportError(f"{self._module_name} is needed for this feature but could not be "
+                                  f"imported: {error}") from error
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            self.__dict__['_target'] = target
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_target(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_target(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._lazy_target()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module_name + (f".{self._attribute}" if self._attribute else "")
+        state = "loaded" if self.__dict__['_target'] is not None else "not loaded"
+        return f"<lazy_import {name} ({state})>"
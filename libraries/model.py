@@ -0,0 +1,7 @@
+# model.py – PyTorch libraries needed to build and run the models
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+__all__ = ["torch", "nn", "F"]
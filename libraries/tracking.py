@@ -0,0 +1,7 @@
+# tracking.py – Experiment tracking (MLflow), imported on first use
+
+from libraries.lazy import lazy_import
+
+mlflow = lazy_import("mlflow", submodules=("mlflow.pytorch",))
+
+__all__ = ["mlflow"]
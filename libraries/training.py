@@ -0,0 +1,35 @@
+# training.py – Libraries for training (PyTorch data loading and optimizers, scikit-learn)
+
+# Deep Learning (PyTorch)
+from libraries.model import *
+import torch.optim as optim
+from torch.utils.data import DataLoader, Dataset
+from torch.cuda.amp import autocast, GradScaler
+import torch.multiprocessing as mp
+from torch.cuda import amp
+from torch.optim.lr_scheduler import ReduceLROnPlateau
+
+# Optional backends, imported on first use
+from libraries.lazy import lazy_import
+transforms = lazy_import("torchvision.transforms")
+
+# Optimizers
+RangerAdaBelief = lazy_import("ranger_adabelief", "RangerAdaBelief")
+
+# Machine Learning
+train_test_split = lazy_import("sklearn.model_selection", "train_test_split")
+StandardScaler = lazy_import("sklearn.preprocessing", "StandardScaler")
+LabelEncoder = lazy_import("sklearn.preprocessing", "LabelEncoder")
+GaussianNB = lazy_import("sklearn.naive_bayes", "GaussianNB")
+SGDClassifier = lazy_import("sklearn.linear_model", "SGDClassifier")
+LinearDiscriminantAnalysis = lazy_import("sklearn.discriminant_analysis", "LinearDiscriminantAnalysis")
+QuadraticDiscriminantAnalysis = lazy_import("sklearn.discriminant_analysis", "QuadraticDiscriminantAnalysis")
+accuracy_score = lazy_import("sklearn.metrics", "accuracy_score")
+classification_report = lazy_import("sklearn.metrics", "classification_report")
+confusion_matrix = lazy_import("sklearn.metrics", "confusion_matrix")
+PCA = lazy_import("sklearn.decomposition", "PCA")
+
+__all__ = ["torch", "nn", "F", "optim", "DataLoader", "Dataset", "autocast", "GradScaler", "mp", "amp",
+           "ReduceLROnPlateau", "transforms", "RangerAdaBelief", "train_test_split", "StandardScaler",
+           "LabelEncoder", "GaussianNB", "SGDClassifier", "LinearDiscriminantAnalysis",
+           "QuadraticDiscriminantAnalysis", "accuracy_score", "classification_report", "confusion_matrix", "PCA"]
@@ -0,0 +1,16 @@
+# visualization.py – Plotting libraries, imported on first use
+
+import logging
+from libraries.lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+mpimg = lazy_import("matplotlib.image")
+mcolors = lazy_import("matplotlib.colors")
+mpatches = lazy_import("matplotlib.patches")
+Figure = lazy_import("matplotlib.figure", "Figure") # pyplot-free figures, safe to render outside the main thread
+sns = lazy_import("seaborn")
+Image = lazy_import("PIL.Image")
+
+logging.getLogger('matplotlib').setLevel(logging.ERROR)
+
+__all__ = ["plt", "mpimg", "mcolors", "mpatches", "Figure", "sns", "Image"]
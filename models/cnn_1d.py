@@ -3,7 +3,8 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
+from libraries.data_io import *
+from libraries.model import *
 
 #######################################################################################
 #######################################################################################
@@ -19,8 +20,10 @@ class JustoLiuNet1D_torch(nn.Module):
     - Max pooling layers to reduce the spatial dimensions.
     - A fully connected layer for classification.
     The model can be initialized with a specified number of input features, number of classes, kernel size, and starting number of kernels.
+    The input size of the classifier is derived from these, and the arguments are kept in self.config,
+    which save_model() stores in the checkpoint and from_config() rebuilds the model from.
     """
-    def __init__(self, num_features, num_classes=3, kernel_size=6, starting_kernels=6):
+    def __init__(self, num_features, num_classes=3, kernel_size=6, starting_kernels=6, num_stages=4):
         """
         Initializes the JustoLiuNet1D_torch model.
         Args:
@@ -28,16 +31,27 @@ class JustoLiuNet1D_torch(nn.Module):
             num_classes (int, optional): The number of output classes for classification. Defaults to 3.
             kernel_size (int, optional): The size of the convolutional kernels. Defaults to 6.
             starting_kernels (int, optional): The number of kernels in the first convolutional layer. Defaults to 6.
+            num_stages (int, optional): The number of conv/pool stages, stage i has starting_kernels * i kernels.
+                Defaults to 4. Fewer stages allow fewer bands, e.g. 2 stages for 30 bands.
         """
         super(JustoLiuNet1D_torch, self).__init__()
 
+        self.config = {
+            'num_features': num_features,
+            'num_classes': num_classes,
+            'kernel_size': kernel_size,
+            'starting_kernels': starting_kernels,
+            'num_stages': num_stages
+        }
+        self.num_stages = num_stages
+
         self.conv1 = nn.Conv1d(1, starting_kernels, kernel_size=kernel_size)
         self.pool = nn.MaxPool1d(kernel_size=2)
-        self.conv2 = nn.Conv1d(starting_kernels, starting_kernels * 2, kernel_size=kernel_size)
-        self.conv3 = nn.Conv1d(starting_kernels * 2, starting_kernels * 3, kernel_size=kernel_size)
-        self.conv4 = nn.Conv1d(starting_kernels * 3, starting_kernels * 4, kernel_size=kernel_size)
+        for i in range(2, num_stages + 1):
+            setattr(self, f"conv{i}", nn.Conv1d(starting_kernels * (i - 1), starting_kernels * i, kernel_size=kernel_size))
 
-        self.classifier = nn.Linear(48, num_classes) 
+        length = feature_length(num_features, kernel_size, num_stages)
+        self.classifier = nn.Linear(starting_kernels * num_stages * length, num_classes)
 
     def forward(self, x):
         """
@@ -47,23 +61,163 @@ class JustoLiuNet1D_torch(nn.Module):
         Returns:
             torch.Tensor: Output tensor of shape (batch_size, num_classes).
         """
-        x = F.relu(self.conv1(x))
-        x = self.pool(x)
+        for i in range(1, self.num_stages + 1):
+            x = F.relu(getattr(self, f"conv{i}")(x))
+            x = self.pool(x)
+
+        x = x.view(x.size(0), -1)
 
-        x = F.relu(self.conv2(x))
-        x = self.pool(x)
+        return self.classifier(x)
 
-        x = F.relu(self.conv3(x))
-        x = self.pool(x)
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build an untrained model from the config stored in a checkpoint by save_model().
+        Args:
+            config (dict): The model config, see self.config.
+        Returns:
+            JustoLiuNet1D_torch: The model.
+        """
+        return cls(**config)
 
-        x = F.relu(self.conv4(x))
-        x = self.pool(x)
+#######################################################################################
 
-        #print("DEBUG - Shape before flatten:", x.shape)
+def feature_length(num_features, kernel_size, num_stages=4):
+    """
+    Return the length of the feature maps after the last conv/pool stage, i.e. the classifier
+    input size per channel.
+    Args:
+        num_features (int): The number of input features (bands).
+        kernel_size (int): The size of the convolutional kernels.
+        num_stages (int): The number of conv/pool stages.
+    Returns:
+        int: Length of the feature maps.
+    """
+    length = num_features
+    for _ in range(num_stages):
+        length = (length - kernel_size + 1) // 2
+        if length < 1:
+            raise ValueError(f"{num_features} features are too few for {num_stages} stages with kernel size "
+                             f"{kernel_size}, use fewer stages or a smaller kernel.")
+    return length
 
-        x = x.view(x.size(0), -1)
+def max_stages(num_features, kernel_size, limit=4):
+    """
+    Return the largest number of conv/pool stages (up to limit) that fits num_features bands.
+    """
+    for num_stages in range(limit, 0, -1):
+        try:
+            feature_length(num_features, kernel_size, num_stages)
+            return num_stages
+        except ValueError:
+            continue
+    raise ValueError(f"{num_features} features are too few for kernel size {kernel_size}.")
+
+def macs_per_pixel(config):
+    """
+    Return the number of multiply-accumulates to classify one pixel, a hardware-independent
+    measure of the inference cost of a model config (see JustoLiuNet1D_torch.config).
+    """
+    kernel_size, starting_kernels = config['kernel_size'], config['starting_kernels']
+    length = config['num_features']
+    in_channels = 1
+    macs = 0
+    for i in range(1, config['num_stages'] + 1):
+        length = length - kernel_size + 1
+        macs += starting_kernels * i * in_channels * kernel_size * length
+        length //= 2
+        in_channels = starting_kernels * i
+    return macs + in_channels * length * config['num_classes']
+
+#######################################################################################
+
+class JustoLiuNet1D_fused(nn.Module):
+    """
+    Inference-only version of JustoLiuNet1D_torch that shares the parameters of a trained model.
+    Every stage is fused as conv -> max pool -> in-place ReLU. Since ReLU is monotonic this equals
+    conv -> ReLU -> max pool, but the ReLU runs on half the values and allocates nothing, and the
+    stage needs three ops instead of four. The module is scriptable and compilable.
+    """
+    def __init__(self, model):
+        """
+        Initializes the fused model from a trained JustoLiuNet1D_torch.
+        Args:
+            model (JustoLiuNet1D_torch): The trained model, its parameters are shared, not copied.
+        """
+        super(JustoLiuNet1D_fused, self).__init__()
+        self.convs = nn.ModuleList(getattr(model, f"conv{i}") for i in range(1, model.num_stages + 1))
+        self.classifier = model.classifier
+
+    def forward(self, x):
+        """
+        Forward pass of the fused model.
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, 1, num_features).
+        Returns:
+            torch.Tensor: Logits of shape (batch_size, num_classes).
+        """
+        for conv in self.convs:
+            x = F.max_pool1d(conv(x), 2).relu_()
+        return self.classifier(x.flatten(1))
+
+#######################################################################################
+
+def optimize_for_inference(model, mode="fused"):
+    """
+    Build an optimized CPU inference module from a trained model.
+    Args:
+        model (JustoLiuNet1D_torch): The trained model.
+        mode (str): "eager" returns the model unchanged, "fused" the JustoLiuNet1D_fused module,
+            "script" the frozen TorchScript of the fused module, and "compile" the fused module
+            compiled with torch.compile.
+    Returns:
+        torch.nn.Module: The module, in evaluation mode.
+    """
+    model.eval()
+    if mode == "eager":
+        return model
 
-        if self.classifier is None:
-            raise RuntimeError(f"'classifier' is not defined yet. Set Linear input dim to {x.size(1)} in __init__.")
+    fused = JustoLiuNet1D_fused(model).eval()
+    if mode == "fused":
+        return fused
+    if mode == "script":
+        return torch.jit.optimize_for_inference(torch.jit.freeze(torch.jit.script(fused)))
+    if mode == "compile":
+        return torch.compile(fused, dynamic=True)
+    raise ValueError(f"Unknown inference mode '{mode}'. Use 'eager', 'fused', 'script' or 'compile'.")
 
-        return self.classifier(x)
\ No newline at end of file
+#######################################################################################
+
+def export_weights(model, normalizer=None):
+    """
+    Return the weights of a model (and optionally the fitted normalizer) as a flat dictionary of
+    numpy arrays, the format read by the NumPy engines in models/cnn_1d_numpy.py and
+    models/cnn_1d_quantized.py.
+    Args:
+        model (torch.nn.Module): The trained model.
+        normalizer (normalization_manager, optional): Fitted normalizer, exported as
+            normalizer.min_vals, normalizer.max_vals and normalizer.epsilon.
+    Returns:
+        dict: Mapping from names to numpy arrays.
+    """
+    arrays = {name: tensor.detach().cpu().numpy() for name, tensor in model.state_dict().items()}
+
+    if normalizer is not None:
+        arrays["normalizer.min_vals"] = normalizer.min_vals.detach().cpu().numpy()
+        arrays["normalizer.max_vals"] = normalizer.max_vals.detach().cpu().numpy()
+        arrays["normalizer.epsilon"] = np.float64(normalizer.epsilon)
+
+    return arrays
+
+#######################################################################################
+
+def export_to_npz(model, path, normalizer=None):
+    """
+    Export the weights of a model (and optionally the fitted normalizer) to a flat .npz file,
+    which the standalone NumPy engine in models/cnn_1d_numpy.py loads without importing torch.
+    Args:
+        model (torch.nn.Module): The trained model.
+        path (str): Output .npz file.
+        normalizer (normalization_manager, optional): Fitted normalizer, see export_weights().
+    """
+    np.savez(path, **export_weights(model, normalizer))
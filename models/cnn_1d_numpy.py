@@ -0,0 +1,133 @@
+# cnn_1d_numpy.py – Standalone NumPy inference engine for JustoLiuNet1D_torch
+#
+# Only NumPy is imported, so this module starts in milliseconds and runs where torch is not
+# available. The weights are read from the flat .npz file written by cnn_1d.export_to_npz().
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+class JustoLiuNet1D_numpy:
+    """
+    NumPy implementation of the JustoLiuNet1D_torch forward pass.
+    Activations are kept channels-last, (pixels, length, channels), so every convolution is one
+    im2col matrix product over a strided window view. Every stage is fused as
+    conv -> max pool -> bias -> ReLU: since the bias is constant per channel and ReLU is monotonic,
+    this equals conv -> bias -> ReLU -> max pool, but the bias and ReLU only touch half the values.
+    The architecture (number of stages, kernels, input length) is read from the weight shapes.
+    """
+    def __init__(self, weights):
+        """
+        Initializes the engine from a dictionary of weights.
+        Args:
+            weights (dict): Arrays written by cnn_1d.export_to_npz(): conv{i}.weight, conv{i}.bias,
+                classifier.weight, classifier.bias and optionally normalizer.min_vals/max_vals/epsilon.
+        """
+        self.stages = []
+        i = 1
+        while f"conv{i}.weight" in weights:
+            weight = np.asarray(weights[f"conv{i}.weight"], dtype=np.float32) # (out, in, kernel)
+            out_channels, in_channels, kernel_size = weight.shape
+            # Row order (in, kernel) matches the flattened im2col windows
+            matrix = np.ascontiguousarray(weight.reshape(out_channels, in_channels * kernel_size).T)
+            bias = np.asarray(weights[f"conv{i}.bias"], dtype=np.float32)
+            self.stages.append((matrix, bias, kernel_size))
+            i += 1
+
+        if not self.stages:
+            raise ValueError("No convolution weights found.")
+
+        classifier = np.asarray(weights["classifier.weight"], dtype=np.float32) # (classes, channels * length)
+        channels = self.stages[-1][0].shape[1]
+        length = classifier.shape[1] // channels
+        # torch flattens (channels, length), the engine flattens (length, channels)
+        classifier = classifier.reshape(-1, channels, length).transpose(0, 2, 1).reshape(classifier.shape[0], -1)
+        self.classifier_weight = np.ascontiguousarray(classifier.T)
+        self.classifier_bias = np.asarray(weights["classifier.bias"], dtype=np.float32)
+        self.num_classes = self.classifier_bias.shape[0]
+
+        self.min_vals = None
+        self.scale = None
+        if "normalizer.min_vals" in weights:
+            self.min_vals = np.asarray(weights["normalizer.min_vals"], dtype=np.float32)
+            max_vals = np.asarray(weights["normalizer.max_vals"], dtype=np.float32)
+            epsilon = float(weights["normalizer.epsilon"]) if "normalizer.epsilon" in weights else 1e-8
+            self.scale = (max_vals - self.min_vals + epsilon).astype(np.float32)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Create the engine from a .npz file written by cnn_1d.export_to_npz().
+        """
+        with np.load(path) as weights:
+            return cls({name: weights[name] for name in weights.files})
+
+    #######################################################################################
+
+    def normalize(self, spectra):
+        """
+        Apply the exported min-max normalization to raw spectra of shape (pixels, bands).
+        """
+        if self.min_vals is None:
+            raise ValueError("The weights were exported without a normalizer.")
+        return (spectra.astype(np.float32) - self.min_vals) / self.scale
+
+    def forward(self, x):
+        """
+        Forward pass on normalized spectra.
+        Args:
+            x (numpy.ndarray): Normalized spectra of shape (pixels, bands).
+        Returns:
+            numpy.ndarray: Logits of shape (pixels, classes).
+        """
+        h = np.asarray(x, dtype=np.float32)[:, :, None] # (pixels, length, channels)
+        for matrix, bias, kernel_size in self.stages:
+            h = conv_pool_bias_relu(h, matrix, bias, kernel_size)
+        return h.reshape(h.shape[0], -1) @ self.classifier_weight + self.classifier_bias
+
+    def predict(self, spectra, batch_size=16384, normalized=False):
+        """
+        Classify spectra in batches.
+        Args:
+            spectra (numpy.ndarray): Raw (or normalized) spectra of shape (pixels, bands), e.g. a whole tile.
+            batch_size (int): Number of pixels per forward pass, bounds the size of the im2col buffers.
+            normalized (bool): True if the spectra are already normalized.
+        Returns:
+            numpy.ndarray: uint8 class indices of shape (pixels,).
+        """
+        classes = np.empty(spectra.shape[0], dtype=np.uint8)
+        for start in range(0, spectra.shape[0], batch_size):
+            batch = spectra[start:start + batch_size]
+            if not normalized:
+                batch = self.normalize(batch)
+            classes[start:start + batch_size] = self.forward(batch).argmax(axis=1)
+        return classes
+
+#######################################################################################
+
+def conv_pool_bias_relu(h, matrix, bias, kernel_size):
+    """
+    One fused stage: valid Conv1d, MaxPool1d(2), bias and ReLU on channels-last activations.
+    Args:
+        h (numpy.ndarray): Activations of shape (pixels, length, in_channels).
+        matrix (numpy.ndarray): Weights of shape (in_channels * kernel_size, out_channels).
+        bias (numpy.ndarray): Bias of shape (out_channels,).
+        kernel_size (int): Convolution kernel size.
+    Returns:
+        numpy.ndarray: Activations of shape (pixels, (length - kernel_size + 1) // 2, out_channels).
+    """
+    pixels, length, in_channels = h.shape
+    pooled_length = (length - kernel_size + 1) // 2
+
+    # (pixels, positions, in_channels, kernel) view, the tail that max pooling drops is skipped
+    windows = sliding_window_view(h, kernel_size, axis=1)[:, :pooled_length * 2]
+    out = windows.reshape(pixels * pooled_length * 2, in_channels * kernel_size) @ matrix
+
+    out = out.reshape(pixels, pooled_length, 2, -1)
+    out = np.maximum(out[:, :, 0], out[:, :, 1])
+    out += bias
+    np.maximum(out, 0, out=out)
+    return out
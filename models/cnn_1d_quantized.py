@@ -0,0 +1,226 @@
+# cnn_1d_quantized.py – Integer-only (int8/int32 fixed-point) inference for JustoLiuNet1D_torch
+#
+# Post-training quantization of the NumPy engine in cnn_1d_numpy.py. Weights are int8 with one
+# scale per output channel, activations are int8 with one scale per layer, accumulators are int32
+# and every rescaling is a fixed-point multiply and rounding shift, so the forward pass uses only
+# integer arithmetic and is bit-exact on any platform. Only NumPy is imported.
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from models.cnn_1d_numpy import JustoLiuNet1D_numpy, conv_pool_bias_relu
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+def quantize_multiplier(multiplier):
+    """
+    Represent positive real multipliers as fixed-point numbers m * 2^-shift with m in [2^30, 2^31).
+    Args:
+        multiplier (numpy.ndarray): Positive real multipliers.
+    Returns:
+        tuple: int64 arrays (m, shift).
+    """
+    multiplier = np.atleast_1d(np.asarray(multiplier, dtype=np.float64))
+    if np.any(multiplier <= 0):
+        raise ValueError("Multipliers must be positive.")
+
+    shift = 30 - np.floor(np.log2(multiplier)).astype(np.int64)
+    m = np.round(multiplier * np.exp2(shift)).astype(np.int64)
+
+    # Rounding can reach 2^31
+    overflow = m >= (1 << 31)
+    m[overflow] //= 2
+    shift[overflow] -= 1
+
+    if np.any(shift < 1) or np.any(shift > 62):
+        raise ValueError("Multiplier out of the representable range.")
+    return m, shift
+
+def requantize(x, m, shift):
+    """
+    Rescale int32 values by the fixed-point multipliers m * 2^-shift with round-half-up.
+    Args:
+        x (numpy.ndarray): int32 values, the last axis is broadcast against m and shift.
+        m, shift (numpy.ndarray): int64 multipliers from quantize_multiplier().
+    Returns:
+        numpy.ndarray: int64 rescaled values.
+    """
+    return (x.astype(np.int64) * m + (np.int64(1) << (shift - 1))) >> shift
+
+#######################################################################################
+
+class JustoLiuNet1D_int8:
+    """
+    Integer-only JustoLiuNet1D inference.
+    Every stage is conv (int8 x int8 -> int32) -> max pool -> bias -> fixed-point requantization,
+    and ReLU is fused into the clamp to [0, 127]. Max pooling commutes with the bias and with the
+    positive requantization, so it is done on the int32 accumulators. If the normalizer was
+    exported with the weights, the raw uint16 spectra are normalized and quantized in the same
+    fixed-point way, so the whole path from raw counts to the class index is integer-only.
+    """
+    def __init__(self, arrays):
+        """
+        Initializes the engine from the arrays created by quantize() or load().
+        """
+        self.arrays = arrays
+        self.stages = []
+        i = 1
+        while f"conv{i}.weight" in arrays:
+            self.stages.append((arrays[f"conv{i}.weight"], arrays[f"conv{i}.bias"],
+                                arrays[f"conv{i}.m"], arrays[f"conv{i}.shift"], int(arrays[f"conv{i}.kernel_size"])))
+            i += 1
+        self.classifier = (arrays["classifier.weight"], arrays["classifier.bias"],
+                           arrays["classifier.m"], arrays["classifier.shift"])
+        self.input_scale = float(arrays["input.scale"])
+        self.has_integer_input = "input.min_vals" in arrays
+
+    #######################################################################################
+
+    @classmethod
+    def quantize(cls, weights, calibration, percentile=100.0):
+        """
+        Post-training quantization, calibrated on a sample of normalized spectra.
+        Args:
+            weights (dict): Float weights, as written by cnn_1d.export_to_npz() (optionally with the normalizer).
+            calibration (numpy.ndarray): Normalized calibration spectra of shape (pixels, bands).
+            percentile (float): Percentile of the absolute activations used as the range of every layer.
+        Returns:
+            JustoLiuNet1D_int8: The quantized engine.
+        """
+        float_engine = JustoLiuNet1D_numpy(weights)
+
+        def activation_scale(values):
+            return max(float(np.percentile(np.abs(values), percentile)), 1e-8) / 127
+
+        # Float activation ranges of every layer
+        h = np.asarray(calibration, dtype=np.float32)
+        scales = [activation_scale(h)]
+        h = h[:, :, None]
+        for matrix, bias, kernel_size in float_engine.stages:
+            h = conv_pool_bias_relu(h, matrix, bias, kernel_size)
+            scales.append(activation_scale(h))
+        logits = h.reshape(h.shape[0], -1) @ float_engine.classifier_weight + float_engine.classifier_bias
+        logit_scale = max(float(np.abs(logits).max()), 1e-8) / (1 << 20)
+
+        arrays = {"input.scale": np.float64(scales[0])}
+
+        for i, (matrix, bias, kernel_size) in enumerate(float_engine.stages):
+            weight_q, weight_scale = quantize_per_channel(matrix)
+            arrays[f"conv{i+1}.weight"] = weight_q
+            arrays[f"conv{i+1}.bias"] = np.round(bias / (scales[i] * weight_scale)).astype(np.int32)
+            arrays[f"conv{i+1}.m"], arrays[f"conv{i+1}.shift"] = quantize_multiplier(scales[i] * weight_scale / scales[i+1])
+            arrays[f"conv{i+1}.kernel_size"] = np.int64(kernel_size)
+
+        weight_q, weight_scale = quantize_per_channel(float_engine.classifier_weight)
+        arrays["classifier.weight"] = weight_q
+        arrays["classifier.bias"] = np.round(float_engine.classifier_bias / (scales[-1] * weight_scale)).astype(np.int32)
+        arrays["classifier.m"], arrays["classifier.shift"] = quantize_multiplier(scales[-1] * weight_scale / logit_scale)
+
+        if float_engine.min_vals is not None:
+            # Raw counts are integers, so (raw - min) / range / input_scale is one fixed-point rescale per band
+            arrays["input.min_vals"] = np.round(float_engine.min_vals).astype(np.int32)
+            arrays["input.m"], arrays["input.shift"] = quantize_multiplier(1.0 / (float_engine.scale.astype(np.float64) * scales[0]))
+
+        return cls(arrays)
+
+    def save(self, path):
+        """
+        Save the quantized model to a .npz file.
+        """
+        np.savez(path, **self.arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a quantized model saved with save().
+        """
+        with np.load(path) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    def size_bytes(self):
+        """
+        Return the size of all parameters and quantization constants in bytes.
+        """
+        return sum(array.nbytes for array in self.arrays.values())
+
+    #######################################################################################
+
+    def quantize_input(self, spectra, normalized=False):
+        """
+        Quantize spectra to int8.
+        Args:
+            spectra (numpy.ndarray): Raw uint16 spectra, or normalized float spectra if normalized is True.
+            normalized (bool): True if the spectra are already normalized (float path).
+        Returns:
+            numpy.ndarray: int8 spectra of shape (pixels, bands).
+        """
+        if normalized:
+            return np.clip(np.round(spectra / self.input_scale), -128, 127).astype(np.int8)
+        if not self.has_integer_input:
+            raise ValueError("The model was quantized without a normalizer, pass normalized spectra.")
+        shifted = spectra.astype(np.int32) - self.arrays["input.min_vals"]
+        return np.clip(requantize(shifted, self.arrays["input.m"], self.arrays["input.shift"]), -128, 127).astype(np.int8)
+
+    def forward(self, x_q):
+        """
+        Integer-only forward pass.
+        Args:
+            x_q (numpy.ndarray): int8 spectra of shape (pixels, bands), from quantize_input().
+        Returns:
+            numpy.ndarray: int64 logits of shape (pixels, classes) on a common scale, so argmax gives the class.
+        """
+        h = x_q[:, :, None]
+        for weight, bias, m, shift, kernel_size in self.stages:
+            pixels, length, in_channels = h.shape
+            pooled_length = (length - kernel_size + 1) // 2
+
+            windows = sliding_window_view(h, kernel_size, axis=1)[:, :pooled_length * 2]
+            windows = windows.reshape(pixels * pooled_length * 2, in_channels * kernel_size)
+            acc = int8_matmul(windows, weight).reshape(pixels, pooled_length, 2, -1) # int32 accumulators
+
+            acc = np.maximum(acc[:, :, 0], acc[:, :, 1]) + bias
+            h = np.clip(requantize(acc, m, shift), 0, 127).astype(np.int8) # requantization and ReLU
+
+        weight, bias, m, shift = self.classifier
+        acc = int8_matmul(h.reshape(h.shape[0], -1), weight) + bias
+        return requantize(acc, m, shift)
+
+    def predict(self, spectra, batch_size=16384, normalized=False):
+        """
+        Classify spectra in batches.
+        Args:
+            spectra (numpy.ndarray): Raw uint16 spectra (or normalized float spectra) of shape (pixels, bands).
+            batch_size (int): Number of pixels per forward pass.
+            normalized (bool): True if the spectra are already normalized.
+        Returns:
+            numpy.ndarray: uint8 class indices of shape (pixels,).
+        """
+        classes = np.empty(spectra.shape[0], dtype=np.uint8)
+        for start in range(0, spectra.shape[0], batch_size):
+            x_q = self.quantize_input(spectra[start:start + batch_size], normalized)
+            classes[start:start + batch_size] = self.forward(x_q).argmax(axis=1)
+        return classes
+
+#######################################################################################
+
+def quantize_per_channel(matrix):
+    """
+    Symmetric int8 quantization of a (inputs, outputs) weight matrix with one scale per output channel.
+    Returns:
+        tuple: int8 weights and float64 scales of shape (outputs,).
+    """
+    scale = np.maximum(np.abs(matrix).max(axis=0).astype(np.float64), 1e-12) / 127
+    return np.clip(np.round(matrix / scale), -127, 127).astype(np.int8), scale
+
+def int8_matmul(a, b):
+    """
+    Exact int8 x int8 matrix product with int32 results.
+    When every accumulator is below 2^24 in magnitude (inner dimension * 128 * 127 < 2^24, true for
+    all layers of JustoLiuNet1D), float32 represents every partial sum exactly, so the product is
+    computed with float32 BLAS and cast back without changing a single bit. Otherwise an int32
+    product is used.
+    """
+    if a.shape[1] * 128 * 127 < (1 << 24):
+        return (a.astype(np.float32) @ b.astype(np.float32)).astype(np.int32)
+    return a.astype(np.int32) @ b.astype(np.int32)
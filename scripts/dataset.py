@@ -3,7 +3,8 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
+from libraries.data_io import *
+from libraries.training import *
 from functions.processing import *
 from manage_data import read_csv_file
 
@@ -12,7 +13,8 @@ from manage_data import read_csv_file
 #######################################################################################
 
 class merged_hyperspectral_dataset(Dataset):
-    def __init__(self, list_of_images, list_of_labels=None, normalizer=None):
+    def __init__(self, list_of_images, list_of_labels=None, normalizer=None, storage="float32",
+                 fit_normalizer=False, cache=None, bands=None, bin_size=1, stride=1):
         """
         Initializes the dataset by loading images and optionally labels, and applies normalization if provided.
 
@@ -22,36 +24,112 @@ class merged_hyperspectral_dataset(Dataset):
                 If None, labels will not be loaded. Defaults to None.
             normalizer (object, optional): An object with a `transform` method to normalize the images. 
                 If None, no normalization is applied. Defaults to None.
+            storage (str, optional): "float32" keeps the normalized spectra as one float32 tensor and the
+                labels as int64. "compact" keeps the raw uint16 spectra and uint8 labels, and the
+                normalization is applied per batch by `collate_fn`. Defaults to "float32".
+            fit_normalizer (bool, optional): If True, the normalizer is fitted with `partial_fit` on every
+                scene while the scenes are loaded, so data and normalizer are built in a single pass.
+                Defaults to False.
+            cache (scene_cache, optional): Persistent cache of preprocessed scenes. If given, every scene
+                is parsed once and memory-mapped from the cache afterwards. Defaults to None.
+            bands (slice or list of int, optional): Bands to load, e.g. from a bands.json written by
+                scripts/select_bands.py, see processing.load_image(). Defaults to None (the cut_bands() range).
+            bin_size (int, optional): Number of adjacent bands averaged into one (spectral binning). Defaults to 1.
+            stride (int, optional): Spatial stride, only every stride-th row and column of a scene is used.
+                Defaults to 1.
 
         Attributes:
-            images (torch.Tensor): A tensor containing the loaded and optionally normalized images.
-            labels (torch.Tensor or None): A tensor containing the loaded labels if provided, otherwise None.
+            images (torch.Tensor or numpy.ndarray): The loaded images, float32 tensor or uint16 array.
+            labels (torch.Tensor, numpy.ndarray or None): The loaded labels if provided, otherwise None.
+            collate_fn (callable): Collate function to pass to the DataLoader.
         """
+        if storage not in ("float32", "compact"):
+            raise ValueError(f"Unknown storage mode '{storage}'. Use 'float32' or 'compact'.")
+
+        if fit_normalizer and normalizer is None:
+            raise ValueError("fit_normalizer=True requires a normalizer.")
+
+        self.storage = storage
+        self.normalizer = normalizer
+
+        if fit_normalizer:
+            normalizer.reset()
+            normalizer.set_preprocessing(bands, bin_size)
+        elif normalizer is not None:
+            normalizer.check_preprocessing(bands, bin_size)
 
         all_images = []
+        all_labels = []
+        has_labels = list_of_labels is not None
 
-        if list_of_labels is not None:
-            all_labels = []
+        if not has_labels:
+            list_of_labels = [None] * len(list_of_images)
 
         for image_path, label_path in tqdm(zip(list_of_images, list_of_labels), 
                                            desc="Loading images and labels", 
                                            total=len(list_of_images)):
-            image = load_image(image_path) # (pixels, bands)
+            if cache is not None:
+                image = cache.load_image(image_path, bands=bands, bin_size=bin_size, stride=stride) # (pixels, bands), memory-mapped
+                if fit_normalizer:
+                    normalizer.partial_fit_stats(*cache.image_stats(image_path, bands=bands, bin_size=bin_size,
+                                                                    stride=stride))
+            else:
+                image = np.ascontiguousarray(load_image(image_path, bands=bands, bin_size=bin_size,
+                                                        stride=stride)) # (pixels, bands)
+                if fit_normalizer:
+                    normalizer.partial_fit(image)
             all_images.append(image)
 
-            if list_of_labels is not None:
-                label = load_label(label_path) # (pixels, )
+            if has_labels:
+                if cache is not None:
+                    label = cache.load_label(label_path, stride=stride) # (pixels, )
+                else:
+                    label = load_label(label_path, stride=stride)
                 all_labels.append(label)
 
-        self.images = torch.from_numpy(np.concatenate(all_images)).float().contiguous()
+        if fit_normalizer:
+            print(colored("Fitted normalization parameters from training data.", "green"))
+
+        self.set_arrays(np.concatenate(all_images), np.concatenate(all_labels) if has_labels else None)
+
+    @classmethod
+    def from_arrays(cls, images, labels=None, normalizer=None, storage="float32"):
+        """
+        Create the dataset from in-memory arrays instead of files, e.g. for benchmarks.
+        Args:
+            images (numpy.ndarray): uint16 spectra of shape (pixels, bands).
+            labels (numpy.ndarray, optional): uint8 labels of shape (pixels,). Defaults to None.
+            normalizer (normalization_manager, optional): Fitted normalizer. Defaults to None.
+            storage (str, optional): "float32" or "compact", see __init__. Defaults to "float32".
+        """
+        dataset = cls.__new__(cls)
+        dataset.storage = storage
+        dataset.normalizer = normalizer
+        dataset.set_arrays(images, labels)
+        return dataset
+
+    def set_arrays(self, images, labels):
+        """
+        Store the concatenated images and labels in the configured storage mode.
+        """
+        if self.storage == "compact":
+            self.images = images
+            self.labels = labels
+            self.collate_fn = normalized_collate(self.normalizer)
+            return
+
+        self.images = torch.from_numpy(images).float().contiguous()
 
-        if list_of_labels is not None:
-            self.labels = torch.from_numpy(np.concatenate(all_labels)).long()
+        if labels is not None:
+            self.labels = torch.from_numpy(labels).long()
         else:
             self.labels = None
 
-        if normalizer is not None:
-            self.images = normalizer.transform(self.images, verify=True, verbose=False)
+        if self.normalizer is not None:
+            self.images = self.normalizer.transform(self.images, verify=True, verbose=False)
+
+        # The spectra are already normalized, the collate function only batches them
+        self.collate_fn = normalized_collate()
 
     def __len__(self):
         """
@@ -77,4 +155,249 @@ class merged_hyperspectral_dataset(Dataset):
         if self.labels is None:
             return self.images[idx]
         else:
-            return self.images[idx], self.labels[idx]
\ No newline at end of file
+            return self.images[idx], self.labels[idx]
+
+    def __getitems__(self, indices):
+        """
+        Retrieves a whole batch with one vectorized slice. The DataLoader calls this method with
+        the indices of a batch instead of calling __getitem__ once per pixel.
+
+        Args:
+            indices (list of int or numpy.ndarray): The indices of the batch.
+
+        Returns:
+            numpy.ndarray, torch.Tensor or tuple: The batch of images, and the batch of labels if
+                labels are loaded. `collate_fn` turns it into the final tensors.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.storage != "compact":
+            indices = torch.from_numpy(indices)
+
+        if self.labels is None:
+            return self.images[indices]
+        return self.images[indices], self.labels[indices]
+
+#######################################################################################
+
+def stack_batch(samples):
+    """
+    Stack a sequence of numpy arrays, numpy scalars or tensors along a new batch axis.
+    """
+    if isinstance(samples[0], torch.Tensor):
+        return torch.stack(samples)
+    return np.stack(samples)
+
+#######################################################################################
+
+class normalized_collate:
+    """
+    Collate function for the datasets in this module.
+    The spectra of a batch are stacked, converted to float32 and normalized with the
+    fitted normalization_manager, and the labels are converted to int64. Only one batch
+    is ever held in float form. Batches that were already sliced by __getitems__ are
+    converted without stacking. The class is picklable, so it works with DataLoader workers.
+    """
+    def __init__(self, normalizer=None):
+        """
+        Initializes the collate function.
+        Args:
+            normalizer (normalization_manager, optional): Fitted normalizer. If None, the spectra
+                are only converted to float32.
+        """
+        self.normalizer = normalizer
+
+    def __call__(self, batch):
+        """
+        Collate a batch into normalized tensors.
+        Args:
+            batch (list or tuple): List of spectra or (spectrum, label) samples, or a batch that was
+                already sliced by a dataset's __getitems__ (array of spectra, or (spectra, labels)).
+        Returns:
+            torch.Tensor or tuple: Float32 spectra, and int64 labels if the samples have labels.
+        """
+        if isinstance(batch, list):
+            if isinstance(batch[0], tuple):
+                spectra, labels = zip(*batch)
+                batch = (stack_batch(spectra), stack_batch(labels))
+            else:
+                batch = stack_batch(batch)
+
+        if isinstance(batch, tuple):
+            spectra, labels = batch
+            return self.spectra_to_tensor(spectra), torch.as_tensor(labels).long()
+        return self.spectra_to_tensor(batch)
+
+    def spectra_to_tensor(self, spectra):
+        """
+        Convert a (batch, bands) array into a normalized float32 tensor.
+        """
+        if isinstance(spectra, np.ndarray):
+            spectra = torch.from_numpy(spectra.astype(np.float32))
+        else:
+            spectra = spectra.float()
+        if self.normalizer is not None:
+            spectra = self.normalizer.transform(spectra)
+        return spectra
+
+#######################################################################################
+
+class lazy_hyperspectral_dataset(Dataset):
+    """
+    A multi-scene dataset that never concatenates the scenes.
+    Every scene is memory-mapped from the scene cache, and a global pixel index is resolved to
+    (scene, pixel) with a binary search over the cumulative per-scene pixel offsets. The spectra
+    are returned as raw uint16 rows and normalized per batch by `collate_fn`, like the compact
+    storage of merged_hyperspectral_dataset. DataLoader workers share the mapped pages through
+    the OS page cache instead of copying one large tensor.
+    """
+    def __init__(self, list_of_images, list_of_labels=None, normalizer=None, fit_normalizer=False, cache=None,
+                 bands=None, bin_size=1, stride=1):
+        """
+        Initializes the dataset by preprocessing every scene into the cache and building the pixel index.
+
+        Args:
+            list_of_images (list of str): A list of file paths to the image files.
+            list_of_labels (list of str, optional): A list of file paths to the label files. Defaults to None.
+            normalizer (normalization_manager, optional): Normalizer applied per batch. Defaults to None.
+            fit_normalizer (bool, optional): If True, the normalizer is fitted from the cached per-scene
+                statistics. Defaults to False.
+            cache (scene_cache): Persistent cache holding the memory-mapped scenes. The scenes of the
+                dataset are pinned against eviction, so its max_bytes must be large enough to hold them all
+                (a ValueError is raised otherwise).
+            bands (slice or list of int, optional): Bands to load, see merged_hyperspectral_dataset.
+            bin_size, stride (int, optional): Spectral binning and spatial stride, see merged_hyperspectral_dataset.
+
+        Attributes:
+            offsets (numpy.ndarray): Cumulative pixel offsets, scene i holds pixels [offsets[i], offsets[i+1]).
+            collate_fn (callable): Collate function to pass to the DataLoader.
+        """
+        if cache is None:
+            raise ValueError("lazy_hyperspectral_dataset requires a scene_cache.")
+        if fit_normalizer and normalizer is None:
+            raise ValueError("fit_normalizer=True requires a normalizer.")
+
+        self.normalizer = normalizer
+        self.image_files = []
+        self.label_files = [] if list_of_labels is not None else None
+        self.images = [] # Opened as soon as a scene is cached, so later cache misses cannot evict it first
+        self.labels = [] if list_of_labels is not None else None
+        scene_sizes = []
+
+        if fit_normalizer:
+            normalizer.reset()
+            normalizer.set_preprocessing(bands, bin_size)
+        elif normalizer is not None:
+            normalizer.check_preprocessing(bands, bin_size)
+
+        for i, image_path in enumerate(tqdm(list_of_images, desc="Indexing images and labels")):
+            image = cache.load_image(image_path, bands=bands, bin_size=bin_size, stride=stride)
+            cache.pin(image)
+            self.images.append(image)
+            self.image_files.append(image.filename)
+            scene_sizes.append(image.shape[0])
+
+            if fit_normalizer:
+                normalizer.partial_fit_stats(*cache.image_stats(image_path, bands=bands, bin_size=bin_size,
+                                                                stride=stride))
+
+            if list_of_labels is not None:
+                label = cache.load_label(list_of_labels[i], stride=stride)
+                if label.shape[0] != image.shape[0]:
+                    raise ValueError(f"{list_of_labels[i]} has {label.shape[0]} labels for {image.shape[0]} pixels.")
+                cache.pin(label)
+                self.labels.append(label)
+                self.label_files.append(label.filename)
+
+        if fit_normalizer:
+            print(colored("Fitted normalization parameters from training data.", "green"))
+
+        self.offsets = np.concatenate(([0], np.cumsum(scene_sizes))).astype(np.int64)
+        self.collate_fn = normalized_collate(normalizer)
+
+    def open_scenes(self):
+        """
+        Memory-map all scenes (read-only), e.g. in a worker after unpickling.
+        """
+        self.images = [np.load(path, mmap_mode='r') for path in self.image_files]
+        if self.label_files is not None:
+            self.labels = [np.load(path, mmap_mode='r') for path in self.label_files]
+
+    def __getstate__(self):
+        """
+        Drop the memmaps when the dataset is pickled (e.g. for spawned workers), only the paths are sent.
+        """
+        state = self.__dict__.copy()
+        state['images'] = None
+        state['labels'] = None
+        return state
+
+    def __len__(self):
+        """
+        Returns the total number of pixels over all scenes.
+        """
+        return int(self.offsets[-1])
+
+    def locate(self, idx):
+        """
+        Resolve global pixel indices to (scene, pixel) pairs with a binary search over the offsets.
+        Args:
+            idx (int or numpy.ndarray): Global pixel index or indices.
+        Returns:
+            tuple: Scene index and pixel index within the scene.
+        """
+        scene = np.searchsorted(self.offsets, idx, side='right') - 1
+        return scene, idx - self.offsets[scene]
+
+    def __getitem__(self, idx):
+        """
+        Retrieves an item from the dataset at the specified global pixel index.
+
+        Args:
+            idx (int): The index of the item to retrieve.
+
+        Returns:
+            numpy.ndarray or tuple: The uint16 spectrum, and the uint8 label if labels were given.
+        """
+        if self.images is None:
+            self.open_scenes()
+
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"Index {idx} is out of range for {len(self)} pixels.")
+
+        scene, pixel = self.locate(idx)
+        spectrum = np.asarray(self.images[scene][pixel])
+
+        if self.labels is None:
+            return spectrum
+        return spectrum, self.labels[scene][pixel]
+
+    def __getitems__(self, indices):
+        """
+        Retrieves a whole batch of global pixel indices with one vectorized gather per scene.
+
+        Args:
+            indices (list of int or numpy.ndarray): The indices of the batch.
+
+        Returns:
+            numpy.ndarray or tuple: The uint16 spectra, and the uint8 labels if labels were given.
+        """
+        if self.images is None:
+            self.open_scenes()
+
+        indices = np.asarray(indices, dtype=np.int64)
+        scenes, pixels = self.locate(indices)
+
+        spectra = np.empty((indices.shape[0], self.images[0].shape[1]), dtype=np.uint16)
+        labels = np.empty(indices.shape[0], dtype=np.uint8) if self.labels is not None else None
+
+        for scene in np.unique(scenes):
+            mask = scenes == scene
+            spectra[mask] = self.images[scene][pixels[mask]]
+            if labels is not None:
+                labels[mask] = self.labels[scene][pixels[mask]]
+
+        if labels is None:
+            return spectra
+        return spectra, labels
@@ -0,0 +1,35 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import argparse
+from functions.inference import load_trained_model
+from models.cnn_1d import export_to_npz
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script exports a trained checkpoint and its fitted normalizer to a flat .npz file
+for the standalone NumPy engine (models/cnn_1d_numpy.py), which runs without torch.
+
+Example:
+    python scripts/export_numpy.py --checkpoint models/best_model.pth --output models/best_model.npz
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a checkpoint for the NumPy inference engine.")
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="Checkpoint written by save_model().")
+    parser.add_argument("--normalizer", default=None, help="Normalizer file, if the checkpoint has none.")
+    parser.add_argument("--output", default="models/best_model.npz")
+    args = parser.parse_args()
+
+    model, normalizer = load_trained_model(args.checkpoint, "cpu", args.normalizer)
+    export_to_npz(model, args.output, normalizer)
+    print(colored(f"Exported {args.checkpoint} to {args.output}", "green"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.model import *
+import argparse
+from functions.inference import load_trained_model, load_preprocessing, predict_scene, inference_engine, spectrum_memo
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script classifies a raw HYPSO capture into a Sea/Land/Cloud map with a trained 1D CNN.
+It includes the following steps:
+
+1. Load the trained model, the fitted normalizer and the input preprocessing (band subset and
+   spectral binning) from a checkpoint written by save_model().
+2. Stream the selected bands of the .bip cube in row tiles and classify every tile with batched no-grad inference.
+3. Write the (HEIGHT, WIDTH) uint8 class map (0 = Cloud, 1 = Land, 2 = Sea) and optionally the
+   per-class probabilities as .npy files.
+
+Example:
+    python scripts/infer.py raw_data/scene/scene.bip --output plots/scene_classes.npy --threads 8
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a HYPSO capture into a Sea/Land/Cloud map.")
+    parser.add_argument("image", help="Path to the .bip (/.bip@) file.")
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="Checkpoint written by save_model().")
+    parser.add_argument("--normalizer", default=None, help="Normalizer file, if the checkpoint has none.")
+    parser.add_argument("--output", default=None, help="Output .npy file for the class map.")
+    parser.add_argument("--probabilities", default=None, help="Output .npy file for the class probabilities.")
+    parser.add_argument("--tile-rows", type=int, default=64, help="Rows per tile.")
+    parser.add_argument("--batch-size", type=int, default=2048, help="Pixels per forward pass.")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads used by torch.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--stride", type=int, default=1, help="Spatial stride for a decimated quick-look map.")
+    parser.add_argument("--dedup", action="store_true", help="Classify identical spectra only once.")
+    parser.add_argument("--memo-entries", type=int, default=100_000, help="Spectra kept in the cross-tile cache of --dedup.")
+    parser.add_argument("--mode", default="fused", choices=["eager", "fused", "script", "compile"],
+                        help="CPU inference mode, see models.cnn_1d.optimize_for_inference().")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(os.path.basename(args.image))[0] + "_classes.npy"
+
+    model, normalizer = load_trained_model(args.checkpoint, args.device, args.normalizer)
+    preprocessing = load_preprocessing(args.checkpoint)
+    if args.device == "cpu" and args.mode != "eager":
+        model = inference_engine(model, normalizer, args.mode, args.batch_size, args.threads)
+
+    memo = spectrum_memo(args.memo_entries) if args.dedup else None
+
+    start = time.perf_counter()
+    class_map = predict_scene(args.image, model, normalizer, output_path=output,
+                              probabilities_path=args.probabilities, tile_rows=args.tile_rows,
+                              batch_size=args.batch_size, num_threads=args.threads, device=args.device,
+                              stride=args.stride, memo=memo, **preprocessing)
+    elapsed = time.perf_counter() - start
+
+    fractions = np.bincount(class_map.ravel(), minlength=3) / class_map.size
+    print(colored(f"Classified {class_map.size} pixels in {elapsed:.2f} s "
+                  f"({class_map.size / elapsed:,.0f} pixels/s), saved to {output}", "green"))
+    if memo is not None:
+        print(f"Dedup: {memo.pixels} pixels, {memo.computed} classified ({memo.dedup_ratio():.2f}x), "
+              f"{memo.hits} cache hits")
+    print(f"Cloud: {fractions[0]*100:.1f}%, Land: {fractions[1]*100:.1f}%, Sea: {fractions[2]*100:.1f}%")
+
+if __name__ == "__main__":
+    main()
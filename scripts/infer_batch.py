@@ -0,0 +1,63 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import argparse
+from functions.batch_inference import find_scenes, run_batch_inference
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script classifies many archived HYPSO captures with a pool of CPU worker processes.
+The scenes are read from a CSV file written by manage_data.create_csv_file() and/or a glob
+pattern. Every worker loads the model once, and scenes whose class maps are up to date are skipped.
+With --max-cloud, scenes are triaged first with a cheap strided quick-look: scenes that are almost
+certainly cloud are skipped and the rest are classified clearest first.
+
+Example:
+    python scripts/infer_batch.py --csv csv/evaluate_files.csv --output-dir plots/class_maps \
+        --workers 8 --threads-per-worker 2 --max-cloud 0.9
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify many HYPSO captures with a process pool.")
+    parser.add_argument("--csv", default=None, help="CSV file with a 'bip_files' column.")
+    parser.add_argument("--glob", default=None, help="Glob pattern of .bip files, e.g. 'raw_data/**/*.bip'.")
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="Checkpoint written by save_model().")
+    parser.add_argument("--normalizer", default=None, help="Normalizer file, if the checkpoint has none.")
+    parser.add_argument("--output-dir", default="plots/class_maps")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--tile-rows", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=2048)
+    parser.add_argument("--prefetch", type=int, default=2, help="Tiles read ahead per worker.")
+    parser.add_argument("--stride", type=int, default=1, help="Spatial stride for decimated quick-look maps.")
+    parser.add_argument("--max-cloud", type=float, default=None,
+                        help="Skip scenes that a quick-look finds to be more cloud than this fraction, e.g. 0.9.")
+    parser.add_argument("--triage-stride", type=int, default=16, help="Sampling stride of the quick-look.")
+    parser.add_argument("--dedup", type=int, default=None, metavar="ENTRIES",
+                        help="Classify identical spectra once, with a cross-tile cache of ENTRIES spectra per worker.")
+    parser.add_argument("--mode", default="fused", choices=["eager", "fused", "script", "compile"],
+                        help="CPU inference mode, see models.cnn_1d.optimize_for_inference().")
+    parser.add_argument("--probabilities", action="store_true", help="Also save the class probabilities.")
+    parser.add_argument("--force", action="store_true", help="Classify scenes even if their outputs are up to date.")
+    args = parser.parse_args()
+
+    if args.csv is None and args.glob is None:
+        parser.error("Pass --csv and/or --glob.")
+
+    image_paths = find_scenes(args.csv, args.glob)
+    run_batch_inference(image_paths, args.checkpoint, args.output_dir, normalizer_path=args.normalizer,
+                        num_workers=args.workers, threads_per_worker=args.threads_per_worker,
+                        save_probabilities=args.probabilities, force=args.force, mode=args.mode,
+                        max_cloud_fraction=args.max_cloud, triage_stride=args.triage_stride,
+                        memo_entries=args.dedup,
+                        tile_rows=args.tile_rows, batch_size=args.batch_size, prefetch=args.prefetch,
+                        stride=args.stride)
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
+from libraries.data_io import *
 
 #######################################################################################
 #######################################################################################
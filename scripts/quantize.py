@@ -0,0 +1,108 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import argparse
+from manage_data import read_csv_file
+from functions.inference import load_trained_model, load_preprocessing
+from functions.processing import load_image, load_label
+from models.cnn_1d import export_weights
+from models.cnn_1d_numpy import JustoLiuNet1D_numpy
+from models.cnn_1d_quantized import JustoLiuNet1D_int8
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script quantizes a trained 1D CNN to integer-only int8 inference and reports whether the
+cheaper path is viable. It includes the following steps:
+
+1. Load the trained model and the fitted normalizer from a checkpoint.
+2. Calibrate the activation ranges on a random sample of pixels from the training scenes.
+3. Quantize weights (int8, per-channel scales) and activations (int8, int32 accumulators).
+4. Classify the evaluation scenes with the float engine and the integer-only engine.
+5. Report accuracy, agreement, model size and CPU pixels/s of both, and save the quantized model.
+
+Example:
+    python scripts/quantize.py --checkpoint models/best_model.pth --output models/best_model_int8.npz
+"""
+
+def sample_pixels(image_paths, num_pixels, seed=0, **preprocessing):
+    """
+    Draw random pixels evenly from a list of scenes, reading only the sampled spectra.
+    """
+    rng = np.random.default_rng(seed)
+    per_scene = max(1, num_pixels // max(1, len(image_paths)))
+    samples = []
+    for image_path in tqdm(image_paths, desc="Sampling calibration pixels"):
+        image = load_image(image_path, **preprocessing)
+        indices = np.sort(rng.choice(image.shape[0], size=min(per_scene, image.shape[0]), replace=False))
+        samples.append(np.asarray(image[indices]))
+    return np.concatenate(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Post-training int8 quantization with an accuracy/latency report.")
+    parser.add_argument("--checkpoint", default="models/best_model.pth")
+    parser.add_argument("--normalizer", default=None, help="Normalizer file, if the checkpoint has none.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--calibration-pixels", type=int, default=100_000)
+    parser.add_argument("--percentile", type=float, default=100.0, help="Activation range percentile.")
+    parser.add_argument("--output", default="models/best_model_int8.npz")
+    args = parser.parse_args()
+
+    model, normalizer = load_trained_model(args.checkpoint, "cpu", args.normalizer)
+    preprocessing = load_preprocessing(args.checkpoint)
+    weights = export_weights(model, normalizer)
+    float_engine = JustoLiuNet1D_numpy(weights)
+
+    # Calibration
+    train_bip_paths, _, _ = read_csv_file(args.train_csv)
+    calibration = float_engine.normalize(sample_pixels(train_bip_paths, args.calibration_pixels, **preprocessing))
+    int8_engine = JustoLiuNet1D_int8.quantize(weights, calibration, percentile=args.percentile)
+    int8_engine.save(args.output)
+
+    # Evaluation
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+    correct = {"float32": 0, "int8": 0}
+    seconds = {"float32": 0.0, "int8": 0.0}
+    agree = 0
+    total = 0
+    pixels = 0
+
+    for image_path, label_path in tqdm(list(zip(eval_bip_paths, eval_labels_paths)), desc="Evaluating"):
+        spectra = np.ascontiguousarray(load_image(image_path, **preprocessing))
+        labels = load_label(label_path)
+        valid = labels < 3
+
+        start = time.perf_counter()
+        float_classes = float_engine.predict(spectra)
+        seconds["float32"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        int8_classes = int8_engine.predict(spectra)
+        seconds["int8"] += time.perf_counter() - start
+
+        correct["float32"] += int((float_classes[valid] == labels[valid]).sum())
+        correct["int8"] += int((int8_classes[valid] == labels[valid]).sum())
+        agree += int((float_classes == int8_classes).sum())
+        total += int(valid.sum())
+        pixels += spectra.shape[0]
+
+    # Both sizes count everything needed to classify raw counts: the float weights with the normalizer,
+    # the int8 weights with the quantization constants (which include the folded input normalization)
+    float_size = sum(array.nbytes for array in weights.values())
+
+    print("\n" + f"{'':>8} {'accuracy':>10} {'size [bytes]':>13} {'pixels/s':>12}")
+    print(f"{'float32':>8} {correct['float32'] / max(total, 1) * 100:>9.2f}% {float_size:>13} "
+          f"{pixels / max(seconds['float32'], 1e-9):>12,.0f}")
+    print(f"{'int8':>8} {correct['int8'] / max(total, 1) * 100:>9.2f}% {int8_engine.size_bytes():>13} "
+          f"{pixels / max(seconds['int8'], 1e-9):>12,.0f}")
+    print(f"Prediction agreement: {agree / max(pixels, 1) * 100:.2f}% over {pixels} pixels.")
+    print(colored(f"Saved the quantized model to {args.output}", "green"))
+
+if __name__ == "__main__":
+    main()
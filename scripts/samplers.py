@@ -0,0 +1,305 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+from collections import deque
+from torch.utils.data import Sampler
+from functions.distributed import is_distributed, all_reduce_sum
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+def shard(order, rank=0, num_replicas=1, pad=True):
+    """
+    Return the part of the sample order of an epoch that belongs to one rank of a distributed run.
+    Every rank draws the same order from the same seed and keeps every num_replicas-th sample, so
+    the shards are disjoint. With `pad`, the order is first extended cyclically to a multiple of
+    num_replicas, so every rank runs the same number of steps (DistributedDataParallel needs
+    that); without it the shards differ by at most one sample, e.g. for evaluation.
+    """
+    if num_replicas == 1:
+        return order
+    if pad:
+        order = np.resize(order, -(-len(order) // num_replicas) * num_replicas)
+    return order[rank::num_replicas]
+
+def shard_size(num_samples, rank=0, num_replicas=1, pad=True):
+    """
+    Return the number of samples of a rank's shard, see shard().
+    """
+    if pad:
+        return -(-num_samples // num_replicas)
+    return len(range(rank, num_samples, num_replicas))
+
+#######################################################################################
+
+class permutation_batch_sampler(Sampler):
+    """
+    Batch sampler that yields whole batches of indices as numpy arrays.
+    Shuffling is done with one index permutation per epoch, and every batch is a slice of it.
+    Pass it as `batch_sampler` to a DataLoader over a dataset with __getitems__, so every batch is
+    fetched with one vectorized slice instead of one __getitem__ call per pixel.
+    In a distributed run, every rank passes its rank and yields only its shard of the permutation.
+    """
+    def __init__(self, num_samples, batch_size, shuffle=True, drop_last=False, seed=0,
+                 rank=0, num_replicas=1, pad=True):
+        """
+        Initializes the batch sampler.
+        Args:
+            num_samples (int): Number of samples in the dataset.
+            batch_size (int): Number of samples per batch.
+            shuffle (bool, optional): Shuffle the samples every epoch. Defaults to True.
+            drop_last (bool, optional): Drop the last incomplete batch. Defaults to False.
+            seed (int, optional): Seed of the permutations. Defaults to 0.
+            rank (int, optional): Rank of this process in a distributed run. Defaults to 0.
+            num_replicas (int, optional): Number of ranks sharing the samples. Defaults to 1.
+            pad (bool, optional): Pad the shards to equal size, see shard(). Defaults to True.
+        """
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.rank = rank
+        self.num_replicas = num_replicas
+        self.pad = pad
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """
+        Set the epoch, which selects the permutation. Epochs advance automatically after every
+        full pass, so calling this is only needed to jump to a given epoch.
+        `start_batch` skips the first batches of the next pass, to resume an epoch mid-way.
+        """
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def permutation(self):
+        """
+        Return the sample order of the current epoch.
+        """
+        if not self.shuffle:
+            return np.arange(self.num_samples, dtype=np.int64)
+        rng = np.random.default_rng((self.seed, self.epoch))
+        return rng.permutation(self.num_samples)
+
+    def __iter__(self):
+        """
+        Yield the batches of the current epoch as int64 arrays of indices.
+        """
+        order = shard(self.permutation(), self.rank, self.num_replicas, self.pad)
+        first, self.start_batch = self.start_batch, 0
+        for start in range(first * self.batch_size, len(self) * self.batch_size, self.batch_size):
+            yield order[start:start + self.batch_size]
+        self.epoch += 1
+
+    def __len__(self):
+        """
+        Returns the number of batches per epoch (of this rank).
+        """
+        num_samples = shard_size(self.num_samples, self.rank, self.num_replicas, self.pad)
+        if self.drop_last:
+            return num_samples // self.batch_size
+        return (num_samples + self.batch_size - 1) // self.batch_size
+
+#######################################################################################
+
+class loss_tracker:
+    """
+    Compact per-pixel record of the recent training loss, used by stratified_batch_sampler to
+    oversample hard pixels. The losses are kept as one float16 array over the whole dataset and
+    updated with an exponential moving average. The per-pixel losses of an epoch stay on the
+    device until update(), so tracking adds no host sync per training step.
+    """
+    def __init__(self, num_samples, initial_loss=1.0, decay=0.5):
+        """
+        Initializes the tracker.
+        Args:
+            num_samples (int): Number of samples in the dataset.
+            initial_loss (float, optional): Loss assumed for pixels that were never trained on, e.g.
+                log(num_classes), the loss of a uniform prediction. Defaults to 1.0.
+            decay (float, optional): Weight of the previous loss in the moving average. Defaults to 0.5.
+        """
+        self.losses = np.full(num_samples, initial_loss, dtype=np.float16)
+        self.decay = decay
+        self.issued = deque()
+        self.pending = []
+
+    def issue(self, indices):
+        """
+        Remember the indices of a batch handed to the DataLoader. The DataLoader returns batches in
+        the order they were issued, so record() pairs them with the losses of the training step.
+        """
+        self.issued.append(indices)
+
+    def record(self, losses):
+        """
+        Store the per-sample losses of the oldest issued batch.
+        Args:
+            losses (torch.Tensor): Per-sample losses of shape (batch,), on any device.
+        """
+        self.pending.append((self.issued.popleft(), losses.detach().float()))
+
+    def update(self):
+        """
+        Fold the losses recorded since the last update into the moving average.
+        A pixel drawn several times since the last update (the stratified sampler draws with
+        replacement, and shard() pads cyclically) gets one moving-average step with its mean loss.
+        In a distributed run every rank only records the losses of its own shard, so the per-pixel
+        loss sums and counts are summed over the ranks first, which keeps the losses, and the draws
+        of the sampler, identical on all ranks.
+        """
+        sums = np.zeros((2, len(self.losses)), dtype=np.float32) # loss sum and count per pixel
+        if self.pending:
+            indices = np.concatenate([indices for indices, _ in self.pending])
+            losses = torch.cat([losses.cpu() for _, losses in self.pending]).numpy() # restored losses are on the CPU
+            np.add.at(sums[0], indices, losses)
+            np.add.at(sums[1], indices, 1)
+        if is_distributed():
+            sums = all_reduce_sum(torch.from_numpy(sums)).numpy()
+        seen = np.flatnonzero(sums[1])
+        mean_losses = sums[0, seen] / sums[1, seen]
+        self.losses[seen] = self.decay * self.losses[seen].astype(np.float32) + (1 - self.decay) * mean_losses
+        self.pending = []
+        self.issued.clear()
+
+    def state_dict(self):
+        """
+        Return the tracked losses, including the losses recorded since the last update(), for a
+        training checkpoint. The pending losses are copied to the host.
+        """
+        state = {'losses': self.losses.copy(), 'decay': self.decay}
+        if self.pending:
+            state['pending_indices'] = np.concatenate([indices for indices, _ in self.pending])
+            state['pending_losses'] = torch.cat([losses for _, losses in self.pending]).cpu()
+        return state
+
+    def load_state_dict(self, state_dict):
+        """
+        Restore the losses from a dictionary created by state_dict().
+        """
+        self.losses = np.asarray(state_dict['losses'], dtype=np.float16)
+        self.decay = state_dict.get('decay', self.decay)
+        self.issued.clear()
+        self.pending = []
+        if 'pending_indices' in state_dict:
+            self.pending.append((state_dict['pending_indices'], state_dict['pending_losses']))
+
+#######################################################################################
+
+class stratified_batch_sampler(Sampler):
+    """
+    Batch sampler that draws a fixed pixel budget per epoch, stratified by class.
+    Every epoch, the budget is split over the classes by `class_fractions` (equal by default), and
+    the pixels of each class are drawn at random from that class. With a loss_tracker, a fraction
+    of every class quota is drawn with a probability proportional to the tracked loss of the
+    pixels, so pixels the model still gets wrong are seen more often. The pixels of every class
+    are located with one stable sort of the labels, whose class boundaries come from the class
+    counts (e.g. the per-scene label histograms, see train_functions.class_histograms()).
+    Batches are yielded as numpy arrays, like permutation_batch_sampler. In a distributed run the
+    budget is shared by the ranks, each yielding its shard of the draw.
+    """
+    def __init__(self, labels, batch_size, class_counts=None, num_samples=None, class_fractions=None,
+                 loss_tracker=None, hard_fraction=0.5, drop_last=False, seed=0, rank=0, num_replicas=1):
+        """
+        Initializes the batch sampler.
+        Args:
+            labels (numpy.ndarray or torch.Tensor): Label of every sample in the dataset.
+            batch_size (int): Number of samples per batch.
+            class_counts (numpy.ndarray, optional): Number of samples of every class. Computed from
+                the labels if not given.
+            num_samples (int, optional): Pixel budget per epoch. Defaults to the dataset size.
+            class_fractions (list of float, optional): Share of the budget of every class, normalized
+                over the classes that have samples. Defaults to equal shares.
+            loss_tracker (loss_tracker, optional): Per-pixel losses for hard-example sampling.
+            hard_fraction (float, optional): Share of every class quota drawn by loss when a
+                loss_tracker is given. Defaults to 0.5.
+            drop_last (bool, optional): Drop the last incomplete batch. Defaults to False.
+            seed (int, optional): Seed of the sampling. Defaults to 0.
+            rank (int, optional): Rank of this process in a distributed run. Defaults to 0.
+            num_replicas (int, optional): Number of ranks sharing the budget. Defaults to 1.
+        """
+        labels = labels.numpy() if isinstance(labels, torch.Tensor) else np.asarray(labels)
+        if class_counts is None:
+            class_counts = np.bincount(labels[labels < 255], minlength=len(class_fractions or []))
+        class_counts = np.asarray(class_counts, dtype=np.int64)
+
+        # Samples sorted by class, class c occupies order[ends[c] - counts[c]:ends[c]]
+        order = np.argsort(labels, kind='stable')
+        ends = np.cumsum(class_counts)
+        if ends[-1] > labels.shape[0] or any(labels[order[ends[c] - 1]] != c for c in np.flatnonzero(class_counts)):
+            raise ValueError("class_counts do not match the labels of the dataset.")
+        self.class_indices = [order[end - count:end] for count, end in zip(class_counts, ends)]
+
+        if class_fractions is None:
+            class_fractions = np.ones(len(class_counts))
+        class_fractions = np.where(class_counts > 0, np.asarray(class_fractions, dtype=np.float64), 0.0)
+        self.class_fractions = class_fractions / class_fractions.sum()
+
+        self.num_samples = num_samples if num_samples is not None else labels.shape[0]
+        self.batch_size = batch_size
+        self.loss_tracker = loss_tracker
+        self.hard_fraction = hard_fraction
+        self.drop_last = drop_last
+        self.seed = seed
+        self.rank = rank
+        self.num_replicas = num_replicas
+        self.pad = True
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """
+        Set the epoch, which selects the random draw, see permutation_batch_sampler.set_epoch().
+        """
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def sample(self):
+        """
+        Return the shuffled sample indices of the current epoch.
+        """
+        rng = np.random.default_rng((self.seed, self.epoch))
+        quotas = np.round(self.class_fractions * self.num_samples).astype(np.int64)
+        quotas[np.argmax(quotas)] += self.num_samples - quotas.sum()
+        drawn = []
+
+        for indices, quota in zip(self.class_indices, quotas):
+            if quota == 0:
+                continue
+            hard = int(quota * self.hard_fraction) if self.loss_tracker is not None else 0
+            drawn.append(indices[rng.integers(0, indices.shape[0], quota - hard)])
+            if hard:
+                weights = self.loss_tracker.losses[indices].astype(np.float64) + 1e-6
+                drawn.append(rng.choice(indices, size=hard, p=weights / weights.sum()))
+
+        return rng.permutation(np.concatenate(drawn))
+
+    def __iter__(self):
+        """
+        Yield the batches of the current epoch as int64 arrays of indices.
+        """
+        order = shard(self.sample(), self.rank, self.num_replicas)
+        if self.loss_tracker is not None:
+            self.loss_tracker.issued.clear()
+        first, self.start_batch = self.start_batch, 0
+        for start in range(first * self.batch_size, len(self) * self.batch_size, self.batch_size):
+            batch = order[start:start + self.batch_size]
+            if self.loss_tracker is not None:
+                self.loss_tracker.issue(batch)
+            yield batch
+        self.epoch += 1
+
+    def __len__(self):
+        """
+        Returns the number of batches per epoch (of this rank).
+        """
+        num_samples = shard_size(self.num_samples, self.rank, self.num_replicas, self.pad)
+        if self.drop_last:
+            return num_samples // self.batch_size
+        return (num_samples + self.batch_size - 1) // self.batch_size
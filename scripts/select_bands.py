@@ -0,0 +1,104 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+import argparse
+from manage_data import read_csv_file
+from functions.processing import normalization_manager
+from functions.inference import load_trained_model, load_preprocessing, inference_engine
+from functions.band_selection import (CANDIDATE_BANDS, sample_labeled_pixels, fisher_scores, occlusion_scores,
+                                      check_candidate_preprocessing, select_bands, lda_accuracy, save_bands)
+from models.cnn_1d import JustoLiuNet1D_torch, max_stages
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script selects a subset of spectral bands and reports what it costs and saves.
+It includes the following steps:
+
+1. Sample labeled pixels from the training and evaluation scenes (only the sampled spectra are read).
+2. Rank the bands, or groups of adjacent bands, on the training sample by their Fisher score, or
+   by the accuracy drop of a trained model when they are occluded (--method occlusion). The
+   evaluation sample is only used for the report, so the reported accuracy is not fit to it.
+3. For every subset size, report the accuracy of a linear discriminant analysis trained on the
+   subset (a cheap proxy for the accuracy of a retrained model), the bytes read per scene and the
+   CPU pixels/s of a JustoLiuNet1D model sized for the subset.
+4. Write the subset of --num-bands bands to a bands.json file. Set BANDS_FILE in train.py to train
+   on it; the bands are stored in the checkpoint and used by infer.py and infer_batch.py.
+
+Example:
+    python scripts/select_bands.py --sizes 114 60 30 15 --num-bands 60 --group-size 2 --output bands.json
+"""
+
+HEIGHT, WIDTH = 598, 1092
+
+def pixels_per_second(num_features, kernel_size=6, pixels=65536, batch_size=2048):
+    """
+    Return the CPU pixels/s of an untrained model sized for num_features bands (fused inference engine).
+    """
+    model = JustoLiuNet1D_torch(num_features, kernel_size=kernel_size,
+                                num_stages=max_stages(num_features, kernel_size)).eval()
+    spectra = np.random.default_rng(0).integers(0, 4096, size=(pixels, num_features), dtype=np.uint16)
+    normalizer = normalization_manager()
+    normalizer.partial_fit(spectra)
+    engine = inference_engine(model, normalizer, "fused", batch_size)
+
+    engine.predict(spectra)
+    start = time.perf_counter()
+    engine.predict(spectra)
+    return pixels / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank spectral bands and write a band subset.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--pixels", type=int, default=200_000, help="Labeled pixels sampled from each split.")
+    parser.add_argument("--method", default="fisher", choices=["fisher", "occlusion"])
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="Model occluded by --method occlusion.")
+    parser.add_argument("--group-size", type=int, default=1, help="Adjacent bands ranked and kept together.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[114, 60, 30, 15], help="Subset sizes to report.")
+    parser.add_argument("--kernel-size", type=int, default=6)
+    parser.add_argument("--num-bands", type=int, default=None, help="Size of the written subset, none if not given.")
+    parser.add_argument("--output", default="bands.json")
+    args = parser.parse_args()
+
+    train_bip_paths, train_labels_paths, _ = read_csv_file(args.train_csv)
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+    train_spectra, train_labels = sample_labeled_pixels(train_bip_paths, train_labels_paths, args.pixels)
+    eval_spectra, eval_labels = sample_labeled_pixels(eval_bip_paths, eval_labels_paths, args.pixels, seed=1)
+
+    # Ranking
+    if args.method == "fisher":
+        scores = fisher_scores(train_spectra, train_labels)
+    else:
+        check_candidate_preprocessing(load_preprocessing(args.checkpoint))
+        model, normalizer = load_trained_model(args.checkpoint, "cpu")
+        scores = occlusion_scores(model, normalizer, train_spectra, train_labels, args.group_size)
+
+    print("\nBand ranking (best first): " + ", ".join(str(int(CANDIDATE_BANDS[i])) for i in np.argsort(-scores)[:20]) + ", ...")
+
+    # Report
+    print("\n" + f"{'bands':>6} {'stages':>7} {'LDA accuracy':>13} {'MB read/scene':>14} {'pixels/s':>12}")
+    for size in sorted(args.sizes, reverse=True):
+        bands = select_bands(scores, size, args.group_size)
+        columns = [band - int(CANDIDATE_BANDS[0]) for band in bands]
+        accuracy = lda_accuracy(train_spectra, train_labels, eval_spectra, eval_labels, columns)
+        megabytes = HEIGHT * WIDTH * len(bands) * 2 / 1024**2
+        try:
+            stages = max_stages(len(bands), args.kernel_size)
+            speed = f"{pixels_per_second(len(bands), args.kernel_size):>12,.0f}"
+        except ValueError:
+            stages, speed = "-", f"{'too few':>12}"
+        print(f"{len(bands):>6} {stages:>7} {accuracy*100:>12.2f}% {megabytes:>14.1f} {speed}")
+
+    if args.num_bands is not None:
+        bands = select_bands(scores, args.num_bands, args.group_size)
+        save_bands(args.output, bands, method=args.method, group_size=args.group_size)
+        print(colored(f"Saved {len(bands)} bands to {args.output}", "green"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from libraries.data_io import *
+from libraries.training import *
+from libraries.tracking import *
+import argparse
+from contextlib import nullcontext
+from manage_data import read_csv_file
+from dataset import lazy_hyperspectral_dataset
+from functions.processing import normalization_manager
+from functions.scene_cache import scene_cache
+from functions.train_functions import get_class_weights
+from functions.sweep import sample_trials, run_sweep
+
+#######################################################################################
+#######################################################################################
+#######################################################################################
+
+"""
+This script runs a hyperparameter sweep of the 1D CNN instead of editing the constants of
+scripts/train.py and retraining by hand. It includes the following steps:
+
+1. Load the training and evaluation scenes once through the scene cache and fit the normalizer.
+2. Draw trial configs from SEARCH_SPACE.
+3. Train the trials in a pool of worker processes with successive halving: every rung trains
+   the surviving trials to a larger budget (starting at a fraction of an epoch) and keeps the
+   best 1/eta of them. Every worker memory-maps the same cached scenes.
+4. Log every trial as a nested MLflow run (or with the file backend under --tracking-dir).
+5. Measure the inference cost of every trial and write a Pareto table of validation accuracy
+   against CPU latency per pixel to <output-dir>/pareto.csv.
+
+Example:
+    python scripts/sweep.py --trials 36 --workers 8 --threads-per-trial 2 --min-epochs 0.1 --max-epochs 3
+"""
+
+# Values tried for every hyperparameter
+SEARCH_SPACE = {
+    'kernel_size': [4, 6, 8],
+    'starting_kernels': [4, 6, 8],
+    'lr': [3e-4, 1e-3, 3e-3],
+    'label_smoothing': [0.0, 0.1],
+    'loss': ["cross_entropy", "focal"],
+    'batch_size': [128, 512, 2048]
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep with successive halving in a process pool.")
+    parser.add_argument("--train-csv", default="csv/train_files.csv")
+    parser.add_argument("--eval-csv", default="csv/evaluate_files.csv")
+    parser.add_argument("--cache-dir", default="cache/scenes", help="Scene cache shared by all trials.")
+    parser.add_argument("--cache-max-gb", type=float, default=100)
+    parser.add_argument("--trials", type=int, default=None, help="Configs drawn from SEARCH_SPACE, all by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads-per-trial", type=int, default=2)
+    parser.add_argument("--min-epochs", type=float, default=0.1, help="Training budget of the first rung.")
+    parser.add_argument("--max-epochs", type=float, default=3.0, help="Training budget of the last rung.")
+    parser.add_argument("--eta", type=int, default=3, help="Budget factor between rungs, the best 1/eta continue.")
+    parser.add_argument("--eval-pixels", type=int, default=200_000, help="Size of the evaluation subset.")
+    parser.add_argument("--output-dir", default="sweeps/sweep")
+    parser.add_argument("--tracking-dir", default=None, help="Log to this directory instead of MLflow.")
+    args = parser.parse_args()
+
+    train_bip_paths, train_labels_paths, _ = read_csv_file(args.train_csv)
+    eval_bip_paths, eval_labels_paths, _ = read_csv_file(args.eval_csv)
+
+    cache = scene_cache(args.cache_dir, max_bytes=int(args.cache_max_gb * 1024**3))
+    normalizer = normalization_manager()
+    train_dataset = lazy_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer,
+                                               fit_normalizer=True, cache=cache)
+    eval_dataset = lazy_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer, cache=cache)
+    class_weights = get_class_weights(train_labels_paths, 3, cache)
+
+    trials = sample_trials(SEARCH_SPACE, args.trials, args.seed)
+    print(colored(f"{len(trials)} trials, {args.workers} at a time with {args.threads_per_trial} threads each.", "blue"))
+
+    if args.tracking_dir is None:
+        mlflow.set_experiment("CNN_hyperspectral_sweep")
+    with mlflow.start_run(run_name="sweep") if args.tracking_dir is None else nullcontext():
+        run_sweep(trials, train_dataset, eval_dataset, class_weights, output_dir=args.output_dir,
+                  num_workers=args.workers, threads_per_trial=args.threads_per_trial,
+                  min_fraction=args.min_epochs, max_fraction=args.max_epochs, eta=args.eta,
+                  eval_pixels=args.eval_pixels, tracking_dir=args.tracking_dir)
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,27 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from libraries import *
+from libraries.data_io import *
+from libraries.training import *
+from libraries.tracking import *
+import argparse
+from contextlib import nullcontext
 from manage_data import read_csv_file
-from dataset import merged_hyperspectral_dataset
-from functions.processing import normalization_manager
+from dataset import merged_hyperspectral_dataset, lazy_hyperspectral_dataset
+from samplers import permutation_batch_sampler, stratified_batch_sampler, loss_tracker
+from functions.processing import normalization_manager, band_indices, num_input_features
+from functions.scene_cache import scene_cache
+from functions.band_selection import load_bands
+from functions.triage import label_quick_look, triage_scenes
 from functions.train_functions import train_loop
-from functions.train_functions import get_class_weights
+from functions.train_functions import get_class_weights, class_histograms
 from functions.train_functions import FocalLoss
 from functions.train_functions import log_mlflow_pre_train
-from models.cnn_1d import JustoLiuNet1D_torch
+from functions.tracking import tracking_worker, mlflow_backend, file_backend
+from functions.checkpointing import checkpoint_writer, load_checkpoint, load_training_state
+from functions.distributed import init_distributed, get_rank, get_world_size, is_main_process
+from functions.distributed import main_process_first, wrap_model, cleanup_distributed
+from models.cnn_1d import JustoLiuNet1D_torch, max_stages
 
 #######################################################################################
 #######################################################################################
@@ -27,21 +39,41 @@ It includes the following steps:
 4. Define hyperparameters such as epochs, batch size, learning rate, etc.
 5. Load and preprocess training and evaluation datasets:
     - Read file paths from CSV files.
-    - Normalize the hyperspectral data using a normalization manager.
-    - Create PyTorch datasets and dataloaders for training and evaluation.
+    - Load the preprocessed scenes (optionally only the bands of BANDS_FILE, spectrally binned and
+      spatially strided) from the persistent scene cache (parsing only new scenes).
+    - Fit the normalization manager while the training scenes are loaded (single pass).
+    - Normalize the hyperspectral data using the normalization manager.
+    - Create PyTorch datasets and dataloaders for training and evaluation. The training pixels of an
+      epoch are either all pixels shuffled, or a class-balanced budget of EPOCH_PIXELS (SAMPLER).
 6. Initialize the 1D CNN model with specified parameters.
 7. Set up the optimizer (AdamW), learning rate scheduler, and loss function (CrossEntropyLoss or FocalLoss).
 8. Log pre-training information to MLflow, including model architecture and hyperparameters.
 9. Train the model using a training loop that iterates over epochs and batches.
 10. Print the total number of model parameters and training progress.
+11. Write the full training state to CHECKPOINT_PATH every few minutes and after every epoch.
+    `python scripts/train.py --resume checkpoints/last.pt` continues an interrupted run at the
+    epoch and step it stopped, with the fitted normalizer of the checkpoint instead of refitting.
+
+Started with torchrun, the script trains data-parallel over several processes (gloo backend), each
+with its shard of the pixels of every epoch; BATCH_SIZE is per rank. See functions/distributed.py.
+    torchrun --nproc_per_node=8 scripts/train.py
 """
 
-# MLflow
-mlflow.set_experiment("CNN_hyperspectral_v1")
+parser = argparse.ArgumentParser(description="Train the 1D CNN on the HYPSO scenes of csv/train_files.csv.")
+parser.add_argument("--resume", default=None, help="Training checkpoint to continue from, e.g. checkpoints/last.pt.")
+args = parser.parse_args()
+
+# Distributed (several ranks when started with torchrun)
+DISTRIBUTED = init_distributed(backend="gloo")
+RANK, WORLD_SIZE = get_rank(), get_world_size()
+MAIN = is_main_process()
 
 # Device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Device: {device}")
+if DISTRIBUTED and device.type == "cuda":
+    device = torch.device("cuda", int(os.environ.get("LOCAL_RANK", 0)))
+if MAIN:
+    print(f"Device: {device}, ranks: {WORLD_SIZE}")
 
 # Hyperparameters
 EPOCHS = 10
@@ -51,54 +83,154 @@ LABEL_SMOOTHING = 0.1
 KERNEL_SIZE = 6
 STARTING_KERNELS = 6
 NUM_FEATURES = 114
+NUM_STAGES = 4 # Conv/pool stages, 4 stages with kernel size 6 need at least 91 bands
 NUM_CLASSES = 3
-
-with mlflow.start_run():
+CACHE_DIR = "cache/scenes" # Preprocessed scenes, set to None to disable the cache
+CACHE_MAX_GB = 100
+CACHE_SHARED = False # True if CACHE_DIR is on a filesystem shared by all nodes, then only global rank 0 fills it
+SYNC_EVERY = 500 # Training steps between host syncs for the progress bar
+STORAGE = "lazy" # "lazy" memory-maps cached scenes, "compact" keeps uint16 spectra in RAM, "float32" stores normalized floats
+BANDS_FILE = None # bands.json written by scripts/select_bands.py, None keeps all bands of cut_bands()
+MAX_CLOUD_FRACTION = None # Skip training scenes whose labels are almost certainly all cloud above this fraction, e.g. 0.95
+BIN_SIZE = 1 # Adjacent bands averaged into one (spectral binning), 2 halves the features
+STRIDE = 1 # Spatial stride of the training pixels, 2 keeps every second row and column
+SAMPLER = "uniform" # "uniform" shuffles all pixels, "balanced" draws equal pixels per class, "hard" also oversamples high-loss pixels
+EPOCH_PIXELS = None # Training pixels per epoch of the "balanced"/"hard" samplers, None for the dataset size
+TRACKING_DIR = None # Log params, metrics and plots to this local directory instead of MLflow, e.g. "tracking"
+CHECKPOINT_PATH = "checkpoints/last.pt" # Full training state for --resume, overwritten atomically
+CHECKPOINT_EVERY_STEPS = 0 # Training steps between checkpoints, 0 to only use the time interval
+CHECKPOINT_EVERY_SECONDS = 300 # Seconds between checkpoints, bounds the compute lost to an interruption
+NUM_WORKERS = 8 # DataLoader workers per node, split between the local ranks
+
+# Input preprocessing, stored in the checkpoint and reused by the inference scripts
+BANDS = load_bands(BANDS_FILE) if BANDS_FILE is not None else None
+PREPROCESSING = {'bands': band_indices(BANDS), 'bin_size': BIN_SIZE}
+if BANDS is not None or BIN_SIZE != 1:
+    NUM_FEATURES = num_input_features(BANDS, BIN_SIZE)
+    NUM_STAGES = min(NUM_STAGES, max_stages(NUM_FEATURES, KERNEL_SIZE))
+
+# DataLoader workers of this rank
+LOADER_WORKERS = max(1, NUM_WORKERS // int(os.environ.get("LOCAL_WORLD_SIZE", 1)))
+
+# MLflow (rank 0 only)
+USE_MLFLOW = TRACKING_DIR is None and MAIN
+if USE_MLFLOW:
+    mlflow.set_experiment("CNN_hyperspectral_v1")
+
+with mlflow.start_run() if USE_MLFLOW else nullcontext():
 
     # Data
     train_bip_paths, train_labels_paths, _ = read_csv_file("csv/train_files.csv")
     eval_bip_paths, eval_labels_paths, _ = read_csv_file("csv/evaluate_files.csv")
 
-    # Normalizer
-    normalizer = normalization_manager()
-    raw_train = merged_hyperspectral_dataset(train_bip_paths, train_labels_paths)
-    normalizer.fit(raw_train.images)
-    train_dataset = merged_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer)
-    eval_dataset = merged_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer)
+    # Triage (strided label quick-look, no spectra are read)
+    if MAX_CLOUD_FRACTION is not None:
+        estimates = {label_path: label_quick_look(label_path) for label_path in train_labels_paths}
+        _, skipped = triage_scenes(estimates, MAX_CLOUD_FRACTION)
+        kept = [i for i, label_path in enumerate(train_labels_paths) if label_path not in skipped]
+        train_bip_paths = [train_bip_paths[i] for i in kept]
+        train_labels_paths = [train_labels_paths[i] for i in kept]
+        print(colored(f"Skipped {len(skipped)} cloud-covered training scenes.", "blue"))
 
-    # Dataloader
+    # Normalizer (restored from the checkpoint on --resume instead of being refitted)
+    normalizer = normalization_manager()
+    checkpoint = load_checkpoint(args.resume) if args.resume is not None else None
+    if checkpoint is not None:
+        normalizer.load_state_dict(checkpoint['normalizer_state_dict'])
+    fit_normalizer = checkpoint is None
+    with main_process_first(local=not CACHE_SHARED): # Rank 0 (of every node) fills the scene cache, the other ranks memory-map it
+        # Cache (opened after rank 0 is done, so the other ranks read its hash index instead of rehashing)
+        cache = scene_cache(CACHE_DIR, max_bytes=CACHE_MAX_GB * 1024**3) if CACHE_DIR is not None else None
+        if STORAGE == "lazy":
+            train_dataset = lazy_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer,
+                                                       fit_normalizer=fit_normalizer, cache=cache, bands=BANDS,
+                                                       bin_size=BIN_SIZE, stride=STRIDE)
+            eval_dataset = lazy_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer, cache=cache,
+                                                      bands=BANDS, bin_size=BIN_SIZE, stride=STRIDE)
+        else:
+            train_dataset = merged_hyperspectral_dataset(train_bip_paths, train_labels_paths, normalizer,
+                                                         storage=STORAGE, fit_normalizer=fit_normalizer, cache=cache, bands=BANDS,
+                                                         bin_size=BIN_SIZE, stride=STRIDE)
+            eval_dataset = merged_hyperspectral_dataset(eval_bip_paths, eval_labels_paths, normalizer,
+                                                        storage=STORAGE, cache=cache, bands=BANDS,
+                                                        bin_size=BIN_SIZE, stride=STRIDE)
+
+    # Sampler (class counts from the cached label histograms)
+    pixel_losses = None
+    if SAMPLER == "uniform":
+        train_sampler = permutation_batch_sampler(len(train_dataset), BATCH_SIZE, shuffle=True,
+                                                  rank=RANK, num_replicas=WORLD_SIZE)
+    else:
+        if SAMPLER == "hard":
+            pixel_losses = loss_tracker(len(train_dataset), initial_loss=np.log(NUM_CLASSES))
+        train_labels = np.concatenate(train_dataset.labels) if STORAGE == "lazy" else train_dataset.labels
+        class_counts = class_histograms(train_labels_paths, NUM_CLASSES, cache, STRIDE).sum(axis=0)
+        train_sampler = stratified_batch_sampler(train_labels, BATCH_SIZE, class_counts,
+                                                 num_samples=EPOCH_PIXELS, loss_tracker=pixel_losses,
+                                                 rank=RANK, num_replicas=WORLD_SIZE)
+
+    # Dataloader (whole batches are sliced at once through the datasets' __getitems__)
+    eval_sampler = permutation_batch_sampler(len(eval_dataset), BATCH_SIZE, shuffle=False,
+                                             rank=RANK, num_replicas=WORLD_SIZE, pad=False)
     train_loader = DataLoader(train_dataset,
-                              batch_size=BATCH_SIZE,
-                              shuffle=True,
-                              num_workers=8,
-                              pin_memory=True)
+                              batch_sampler=train_sampler,
+                              num_workers=LOADER_WORKERS,
+                              pin_memory=True,
+                              collate_fn=train_dataset.collate_fn)
     eval_loader = DataLoader(eval_dataset,
-                             batch_size=BATCH_SIZE,
-                             shuffle=False,
-                             num_workers=8,
-                             pin_memory=True)
+                             batch_sampler=eval_sampler,
+                             num_workers=LOADER_WORKERS,
+                             pin_memory=True,
+                             collate_fn=eval_dataset.collate_fn)
 
     # Model
     model = JustoLiuNet1D_torch(num_features=NUM_FEATURES, num_classes=NUM_CLASSES,
-                                 kernel_size=KERNEL_SIZE, starting_kernels=STARTING_KERNELS).to(device)
+                                 kernel_size=KERNEL_SIZE, starting_kernels=STARTING_KERNELS,
+                                 num_stages=NUM_STAGES).to(device)
     total_params = sum(p.numel() for p in model.parameters())
-    print(colored(f"Total parameters in {model.__class__.__name__}: {total_params}", "magenta"))
+    if MAIN:
+        print(colored(f"Total parameters in {model.__class__.__name__}: {total_params}", "magenta"))
 
     optimizer = torch.optim.AdamW(model.parameters(), lr=LR, weight_decay=1e-4)
     scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.5)
-    alpha = get_class_weights(train_labels_paths, NUM_CLASSES)
+    alpha = get_class_weights(train_labels_paths, NUM_CLASSES, cache, STRIDE)
     #criterion = nn.CrossEntropyLoss(weight=alpha.to(device), label_smoothing=LABEL_SMOOTHING).to(device)
     criterion = nn.CrossEntropyLoss(label_smoothing=LABEL_SMOOTHING).to(device)
     #criterion = FocalLoss(alpha=alpha.to(device), gamma=3, reduction='sum').to(device)
 
-    # Logging
-    log_mlflow_pre_train(EPOCHS, BATCH_SIZE, LR, LABEL_SMOOTHING,
-               KERNEL_SIZE, STARTING_KERNELS, NUM_FEATURES, 
-               NUM_CLASSES,optimizer, scheduler, criterion, 
-               model, train_dataset, eval_dataset)
-
-    # Training
-    print("Starting training...")
+    # Checkpoints (written in the background)
+    resume = None
+    if checkpoint is not None:
+        resume = load_training_state(checkpoint, model, optimizer, scheduler, loss_tracker=pixel_losses, device=device)
+        if MAIN:
+            print(colored(f"Resuming from {args.resume} at epoch {resume['epoch']+1}, step {resume['step']}.", "blue"))
+    checkpointer = None
+    if MAIN:
+        checkpointer = checkpoint_writer(CHECKPOINT_PATH, every_steps=CHECKPOINT_EVERY_STEPS,
+                                         every_seconds=CHECKPOINT_EVERY_SECONDS)
+
+    # Logging (params, metrics and plots are sent by a background worker of rank 0)
+    tracker = None
+    if MAIN:
+        tracker = tracking_worker(mlflow_backend() if TRACKING_DIR is None else file_backend(TRACKING_DIR))
+        log_mlflow_pre_train(EPOCHS, BATCH_SIZE, LR, LABEL_SMOOTHING,
+                   KERNEL_SIZE, STARTING_KERNELS, NUM_FEATURES, 
+                   NUM_CLASSES,optimizer, scheduler, criterion, 
+                   model, train_dataset, eval_dataset, tracker)
+        tracker.log_params({"WORLD_SIZE": WORLD_SIZE})
+
+    # Training (gradients are all-reduced over the ranks by DistributedDataParallel)
+    model = wrap_model(model, device)
+    if MAIN:
+        print("Starting training...")
     train_loop(model, train_loader, eval_loader, criterion, 
-               optimizer, scheduler, device, num_epochs=EPOCHS)
-    print("Training finished.")
\ No newline at end of file
+               optimizer, scheduler, device, num_epochs=EPOCHS,
+               normalizer=normalizer, sync_every=SYNC_EVERY,
+               preprocessing=PREPROCESSING, loss_tracker=pixel_losses, tracker=tracker,
+               checkpointer=checkpointer, resume=resume)
+    if MAIN:
+        tracker.close()
+        checkpointer.close()
+        print("Training finished.")
+
+cleanup_distributed()
\ No newline at end of file